@@ -4,101 +4,176 @@
 # from variable_region_calc.py and searches for them in the
 # aligned gg otus
 
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from os import path as p
+import numpy as np
+
+boundary = {'V1_start': 189, 'V1_end': 471,
+            'V2_start': 485, 'V2_end': 1867,
+            'V3_start': 1915, 'V3_end': 2231,
+            'V4_start': 2262, 'V4_end': 4050,
+            'V5_start': 4089, 'V5_end': 4521,
+            'V6_start': 4652, 'V6_end': 4931,
+            'V7_start': 5043, 'V7_end': 5806,
+            'V8_start': 5909, 'V8_end': 6426,
+            'V9_start': 6449, 'V9_end': 6790}
+'''
+The boundary positions were found using code provided by Tony Walters
+(http://qiime.org/home_static/nih_cloud-apr2012/variable_region_position_calculations.pdf).
+It was then modified to allow for the additional search of the
+V1 rev, V2 fwd, V5, V7 and V8 boundary positions.
+Primers used:
+V1: 27f / P2 (original code / Cocolin et al. 2001)
+V2: V2f / 338r (modified V2-V3 fwd primer from "16S V2-V3 Library
+                Preparation Kit for Illumina" / original code)
+V3: 349f / 534r (original code)
+V4: 515f / 806r (original code)
+V5: 806f / 926r (kindly provided by Tony Walters)
+V6: 967f / 1046r (original code)
+V7: 1115f / 1193r (Schneyder et al. 2021 / Bodenhausen et al. 2013)
+V8: 1237f / 1291r (Turner et al. 1999)
+V9: 1391f / 1492r (original code)
+'''
+columns = np.array(list(boundary.values()))
+regions = [key[0:2] for key in boundary][::2]
+
+
+def index(line):
+    r'''Variable region position finder
 
+    This function searches for the positions of
+    the 16S variable regions within a line from
+    the MSA refrence file.
+    A single cumulative count of the non-gap characters maps
+    every alignment column to its position in the ungapped sequence.
 
-def write_reference_file(seq_chrom, annoted_ref, region):
-    r'''Reference file writer
+    Parameters
+    ----------
+    line: str
+        String of a line from the refrence file
+        declared in main with "file".
+
+    Returns
+    -------
+    positions: numpy.ndarray
+        Positions of the region starts and ends in the ungapped
+        sequence in the order of boundary.
+
+    '''
+    sequence = np.frombuffer(line.encode(), dtype=np.uint8)
+    ungapped = np.zeros(len(sequence) + 1, dtype=np.int64)
+    np.cumsum(sequence != ord('-'), out=ungapped[1:])
+    # ungapped[i] is the number of bases in front of column i
+    return ungapped[columns] + 1
 
-    This function uses the dictionary created by index and
-    writes a file containing the start and end position of
-    each variable region for each entry in the MSA refrence.
+
+def format_records(records):
+    r'''Reference file formatter
+
+    Creates the lines of the reference file containing the start
+    and end position of each variable region for each entry.
 
     Parameters
     ----------
-    seq_chrom: str
-        Name of the entry
+    records: list
+        (seq_chrom, line) tuples with the name of the entry and
+        its aligned sequence.
 
-    annoted_ref: str
-        Filepath where the created Refrence file should
-        be saved to.
-
-    region: dict
-        Dictionary conataining region start / end as
-        keys and the position in the refrence file
-        declared in main with "file".
+    Returns
+    -------
+    text: str
+        Lines of the reference file for all given entries.
 
     '''
-    with open(annoted_ref, 'a') as t:
-        if 'V1_start' in region:
-            for counter, key in enumerate(region):
-                if (counter % 2) == 0:
-                    wordstart = f'{seq_chrom}\t{str(region[key])}'
-                else:
-                    var_reg = key[0:2]
-                    wordend = f'\t{str(region[key])}\t{var_reg}\n'
-                    words = wordstart + wordend
-                    t.write(words)
-    region.clear()
-
-
-def index(line, region):
-    r'''Variable region position finder
+    lines = []
+    for seq_chrom, line in records:
+        positions = index(line).reshape(-1, 2)
+        for var_reg, (start, end) in zip(regions, positions):
+            lines.append(f'{seq_chrom}\t{start}\t{end}\t{var_reg}\n')
+    return ''.join(lines)
 
-    This function searches for the positions of
-    the 16S variable regions within a line from
-    the MSA refrence file via deleting the gaps.
+
+def read_msa(file_):
+    r'''MSA reader
 
     Parameters
     ----------
-    line: str
-        String of a line from the efrence file
-        declared in main with "file".
-
-    region: dict
-        Empty dictionary.
+    file_: str
+        Filepath to the aligned reference with one line per sequence.
 
     Returns
     -------
-    region: dict
-        Dictionary conataining region start / end as
-        keys and the position in the refrence file
-        declared in main with "file".
+    records: generator
+        Yields (seq_chrom, line) tuples.
 
     '''
-    boundary = {'V1_start': 189, 'V1_end': 471,
-                'V2_start': 485, 'V2_end': 1867,
-                'V3_start': 1915, 'V3_end': 2231,
-                'V4_start': 2262, 'V4_end': 4050,
-                'V5_start': 4089, 'V5_end': 4521,
-                'V6_start': 4652, 'V6_end': 4931,
-                'V7_start': 5043, 'V7_end': 5806,
-                'V8_start': 5909, 'V8_end': 6426,
-                'V9_start': 6449, 'V9_end': 6790}
+    with open(file_, 'r') as f:
+        seq_chrom = None
+        for line in f:
+            if line.startswith('>'):
+                seq_chrom = line[1:].strip('\n')
+            elif seq_chrom is not None:
+                yield seq_chrom, line
+                seq_chrom = None
+
+
+def chunks(records, chunk_size):
+    r'''MSA splitter
+
+    Parameters
+    ----------
+    records: iterable
+        (seq_chrom, line) tuples as returned by read_msa.
+    chunk_size: int
+        Number of entries per chunk.
+
+    Returns
+    -------
+    chunks: generator
+        Yields lists of at most chunk_size entries.
+
     '''
-    The boundary positions were found using code provided by Tony Walters
-    (http://qiime.org/home_static/nih_cloud-apr2012/variable_region_position_calculations.pdf).
-    It was then modified to allow for the additional search of the
-    V1 rev, V2 fwd, V5, V7 and V8 boundary positions.
-    Primers used:
-    V1: 27f / P2 (original code / Cocolin et al. 2001)
-    V2: V2f / 338r (modified V2-V3 fwd primer from "16S V2-V3 Library
-                    Preparation Kit for Illumina" / original code)
-    V3: 349f / 534r (original code)
-    V4: 515f / 806r (original code)
-    V5: 806f / 926r (kindly provided by Tony Walters)
-    V6: 967f / 1046r (original code)
-    V7: 1115f / 1193r (Schneyder et al. 2021 / Bodenhausen et al. 2013)
-    V8: 1237f / 1291r (Turner et al. 1999)
-    V9: 1391f / 1492r (original code)
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def write_reference_file(file_, annoted_ref, jobs=1, chunk_size=1000):
+    r'''Reference file writer
+
+    Writes a file containing the start and end position of
+    each variable region for each entry in the MSA refrence.
+    The output is written in one buffered batch per chunk.
+
+    Parameters
+    ----------
+    file_: str
+        Filepath to the aligned reference.
+    annoted_ref: str
+        Filepath where the created Refrence file should
+        be saved to. An existing file is overwritten.
+    jobs: int
+        Number of processes the chunks are spread across.
+    chunk_size: int
+        Number of entries formatted at once.
+
     '''
-    for key in boundary:
-        list1 = list(line)
-        list1[boundary[key]] = '1'
-        list1 = ''.join(str(e) for e in list1)
-        list1 = list1.replace('-', '')
-        region[key] = int(list1.index('1')) + 1
-    return region
+    with open(annoted_ref, 'w') as t:
+        if jobs > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                for text in executor.map(format_records,
+                                         chunks(read_msa(file_),
+                                                chunk_size)):
+                    t.write(text)
+                    # executor.map keeps the order of the MSA
+        else:
+            for chunk in chunks(read_msa(file_), chunk_size):
+                t.write(format_records(chunk))
 
 
 def main():
@@ -109,17 +184,24 @@ def main():
     VXdetector.
 
     '''
-    file_ = f'{p.dirname(p.dirname(__file__))}/85_otus_aligned.fasta'
-    annoted_ref = f'{p.dirname(p.dirname(__file__))}/annoted_ref.bed'
-    with open(file_, 'r') as f:
-        region = dict()
-        for line in f:
-            if line.startswith('>'):
-                seq_chrom = line[1:]
-                seq_chrom = seq_chrom.strip('\n')
-            else:
-                region = index(line, region)
-                write_reference_file(seq_chrom, annoted_ref, region)
+    parser = argparse.ArgumentParser(prog='create_annoted_ref', description=(
+        'Creates the variable region reference of VXdetector'))
+    parser.add_argument('-i', '--input', dest='file_',
+                        default=(f'{p.dirname(p.dirname(__file__))}/'
+                                 '85_otus_aligned.fasta'),
+                        help='Aligned reference (MSA) in fasta format')
+    parser.add_argument('-o', '--output', dest='annoted_ref',
+                        default=(f'{p.dirname(p.dirname(__file__))}/'
+                                 'annoted_ref.bed'),
+                        help='Filepath of the created reference file')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=1,
+                        help='Number of processes used')
+    parser.add_argument('--chunk-size', dest='chunk_size', type=int,
+                        default=1000,
+                        help='Number of MSA entries processed at once')
+    args = parser.parse_args()
+    write_reference_file(args.file_, args.annoted_ref, args.jobs,
+                         args.chunk_size)
 
 
 if __name__ == '__main__':
@@ -2,9 +2,14 @@
 
 from itertools import (takewhile, repeat)
 from os.path import exists
+import vxdetector.bowtie2_stats as bowtie2_stats
 
 regions_list = ['V1', 'V2', 'V3', 'V4', 'V5', 'V6', 'V7', 'V8', 'V9']
 # lists all variable regions for iteration
+agreement_columns = regions_list + ['Not aligned to a variable region']
+# columns compared by agreement
+read_size = 4 * 1024 * 1024
+# bytes read at once by count_regions
 
 
 def rawincount(filename):
@@ -33,7 +38,99 @@ def rawincount(filename):
     return lines_count
 
 
-def region_count(temp_path, paired, new_row, regions):
+def _name_starts(data, newlines, column):
+    # finds the first byte of the given column in every line
+    import numpy as np
+    tabs = np.flatnonzero(data == 9)
+    width = len(tabs) // len(newlines)
+    if width >= column and len(tabs) == width * len(newlines):
+        table = tabs.reshape(-1, width)
+        if np.all(table[:, -1] < newlines) and \
+           np.all(table[1:, 0] > newlines[:-1]):
+            return table[:, column - 1] + 1
+            # every line has the same number of columns
+    line = np.searchsorted(newlines, tabs)
+    rank = np.arange(len(tabs)) - np.searchsorted(line, line)
+    return tabs[rank == column - 1] + 1
+
+
+def count_regions(BED_path, column=3):
+    r'''Counts variable regions in a .bed file
+
+    This function reads the file once in chunks of read_size bytes
+    and counts the names 'V1' - 'V9' in the name column only.
+    Memory use does not depend on the size of the file.
+
+    Parameters
+    ----------
+    BED_path : str
+        Filepath to the .bed file created by bedtools intersect.
+    column : int
+        0-based index of the column containing the region names.
+
+    Returns
+    -------
+    counts : numpy.ndarray
+        Occurences of V1 - V9 in the order of regions_list.
+
+    '''
+    import numpy as np
+    # numpy is only imported once a .bed file is counted, so the
+    # regions_list can be imported without it
+    counts = np.zeros(len(regions_list), dtype=np.int64)
+    rest = b''
+    with open(BED_path, 'rb') as f:
+        while True:
+            chunk = f.read(read_size)
+            if not chunk:
+                if not rest:
+                    break
+                chunk = b'\n'
+                # handles a missing newline at the end of the file
+            chunk = rest + chunk
+            end = chunk.rfind(b'\n') + 1
+            rest = chunk[end:]
+            if end == 0:
+                continue
+            data = np.frombuffer(chunk, dtype=np.uint8, count=end)
+            newlines = np.flatnonzero(data == 10)
+            starts = _name_starts(data, newlines, column)
+            starts = starts[starts + 2 < end]
+            name = (data[starts] == ord('V')) \
+                & (data[starts + 1] >= ord('1')) \
+                & (data[starts + 1] <= ord('9')) \
+                & ((data[starts + 2] == 9) | (data[starts + 2] == 10))
+            # names have to be exactly V1 - V9 followed by tab or newline
+            counts += np.bincount(data[starts[name] + 1] - ord('1'),
+                                  minlength=len(regions_list))
+    return counts
+
+
+def read_log(lines):
+    r'''Reads the bowtie2 summary
+
+    Parameters
+    ----------
+    lines : list
+        Lines of the bowtie2 stderr output.
+
+    Returns
+    -------
+    new_row : dict
+        keys: ['Number of Reads', 'Unaligned Reads [%]']
+
+    '''
+    new_row = dict()
+    new_row['Number of Reads'] = int(lines[0].strip('\n\t ').split()[0])
+    unaligned_count = lines[-1].strip('\n\t ')
+    # Reads the bowtie2 stdout which is normally seen in the terminal
+    unaligned_count = unaligned_count.split()[0].replace('%', '')
+    new_row['Unaligned Reads [%]'] = 100 - float(unaligned_count)
+    return new_row
+
+
+def region_count(temp_path, paired, new_row, regions, no_overlap=None,
+                 not_paired=None):
     r'''Create dictionary
 
     This function streamlines already obtained information and
@@ -57,6 +154,12 @@ def region_count(temp_path, paired, new_row, regions):
         Dictionary containing the occurences of all variable regions
         within the intersect file.
         keys: ['V1', 'V2', 'V3', 'V4', 'V5', 'V6', 'V7', 'V8', 'V9']
+    no_overlap : int or None
+        Number of reads not mapped to any variable region. If None they
+        are counted in the noOver.bed file.
+    not_paired : int or None
+        Number of reads which were not properly paired. If None they are
+        counted in the bed.log file.
 
     Returns
     -------
@@ -68,16 +171,18 @@ def region_count(temp_path, paired, new_row, regions):
 
     '''
     if paired is True:
-        new_row['Not properly paired'] = rawincount(
-                                         f'{temp_path}bed.log') \
-                                         / new_row['Number of Reads']
+        if not_paired is None:
+            not_paired = rawincount(f'{temp_path}bed.log')
+        new_row['Not properly paired'] = not_paired \
+            / new_row['Number of Reads']
         # counts the amount of error messages given by bedtools
         # during bam to bed conversion each error message reprensents
         # one improperly paired read
     else:
         new_row['Not properly paired'] = 'not paired'
-    regions['Not aligned to a variable region'] = rawincount(
-                                                  f'{temp_path}noOver.bed')
+    if no_overlap is None:
+        no_overlap = rawincount(f'{temp_path}noOver.bed')
+    regions['Not aligned to a variable region'] = no_overlap
     # counts the number of reads not mapped to any variable region
     aligned_count = 100 - new_row['Unaligned Reads [%]']
     var_re_count = sum(regions.values())
@@ -108,11 +213,12 @@ def region_count(temp_path, paired, new_row, regions):
     return new_row
 
 
-def create_row(temp_path, paired):
+def create_row(temp_path, paired, regions=None, no_overlap=None, stats=None):
     r'''Base function to create Output
 
     This function counts the occurences of the variable regions and
-    reads the total number of reads and unaligned reads from the bowtie2.log.
+    reads the total number of reads and unaligned reads from the bowtie2.log
+    or from the alignment summary parsed while bowtie2 was running.
     Then it calls other functions which create a dictionary containing
     analised data.
 
@@ -125,6 +231,16 @@ def create_row(temp_path, paired):
     paired : Bool
         Wether or not the reads in the directory have paired mates
         or are unpaired.
+    regions : dict or None
+        Occurences of all variable regions, e.g. counted by
+        interval_overlap.overlap_counts. If None they are counted
+        in the .bed file.
+    no_overlap : int or None
+        Number of reads not mapped to any variable region. If None they
+        are counted in the noOver.bed file.
+    stats : dict or None
+        Alignment summary parsed by interact_bowtie2.map_reads. If None
+        the bowtie2.log and bed.log files are read instead.
 
     Returns
     -------
@@ -133,31 +249,70 @@ def create_row(temp_path, paired):
         keys: ['Number of Reads', 'Unaligned Reads [%]', 'Not properly paired',
                'Sequenced variable region', 'V1', 'V2', 'V3', 'V4', 'V5', 'V6',
                'V7', 'V8', 'V9', 'Not aligned to a variable region']
+        If stats is given the columns of bowtie2_stats.create_row are added.
 
     '''
     BED_path = f'{temp_path}BED.bed'
     Log_path = f'{temp_path}bowtie2.log'
-    if exists(BED_path) is False:
+    if regions is None and exists(BED_path) is False:
         raise FileNotFoundError(f'It seems {BED_path} is missing.'
                                 ' Check if you deleted the temp_dir')
-    if exists(Log_path) is False:
+    if stats is None and exists(Log_path) is False:
         raise FileNotFoundError(f'It seems {Log_path} is missing.'
                                 ' Check if you deleted the temp_dir')
-    new_row = dict()
-    regions = dict()
-    b = open(BED_path, 'r')
-    bed_data = b.read()
-    b.close()
-    for region in regions_list:
-        regions[region] = bed_data.count(region)
+    if regions is None:
+        regions = dict(zip(regions_list,
+                           count_regions(BED_path).tolist()))
         # counts all appearing variable Regions
-    with open(Log_path, 'r') as log:
-        lines = log.readlines()
-        new_row['Number of Reads'] = int(lines[0].strip('\n\t ').split()[0])
-        unaligned_count = lines[-1].strip('\n\t ')
-        # Reads the bowtie2 stdout which is normally seen in the terminal
-    unaligned_count = unaligned_count.split()[0].replace('%', '')
-    new_row['Unaligned Reads [%]'] = 100 - float(unaligned_count)
-    new_row = region_count(temp_path, paired, new_row, regions)
+    else:
+        regions = dict(regions)
+    if stats is None:
+        with open(Log_path, 'r') as log:
+            new_row = read_log(log.readlines())
+        not_paired = None
+    else:
+        new_row = bowtie2_stats.create_row(stats)
+        not_paired = stats.get('not_paired')
+    new_row = region_count(temp_path, paired, new_row, regions, no_overlap,
+                           not_paired)
 
     return new_row
+
+
+def agreement(expected, result):
+    r'''Agreement of the results of two engines or references
+
+    Parameters
+    ----------
+    expected : dict
+        Result row of every sample of the reference run (e.g. bowtie2
+        with the full reference).
+    result : dict
+        Result row of every sample of the compared run.
+
+    Returns
+    -------
+    agreement : dict
+        'samples' : number of samples both runs analysed.
+        'same_region' : share of the samples with the same
+                        'Sequenced variable region'.
+        'max_difference', 'mean_difference' : largest and mean
+            difference of the region columns in percentage points.
+
+    '''
+    samples = [sample for sample in expected
+               if expected[sample] is not None
+               and result.get(sample) is not None]
+    same = 0
+    differences = []
+    for sample in samples:
+        same += (expected[sample]['Sequenced variable region']
+                 == result[sample]['Sequenced variable region'])
+        differences.extend(abs(expected[sample][column]
+                               - result[sample][column])
+                           for column in agreement_columns)
+    return {'samples': len(samples),
+            'same_region': same / len(samples) if samples else 0.0,
+            'max_difference': max(differences, default=0.0),
+            'mean_difference': (sum(differences) / len(differences)
+                                if differences else 0.0)}
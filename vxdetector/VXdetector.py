@@ -1,14 +1,53 @@
 #!/usr/bin/python
 
 import argparse
-import glob
+import asyncio
+import collections
+import contextlib
+import itertools
 import os
 import sys
-import pandas as pd
+from concurrent.futures import (ProcessPoolExecutor, ThreadPoolExecutor,
+                                as_completed)
+from functools import partial
 import vxdetector.Output_counter as Output_counter
 import vxdetector.files_manager as files_manager
-from vxdetector.interact_bowtie2 import mapbowtie2, buildbowtie2
-from vxdetector.interact_bedtools import overlap
+import vxdetector.scheduler as scheduler
+import vxdetector.result_cache as result_cache
+import vxdetector.result_writer as result_writer
+import vxdetector.bowtie2_stats as bowtie2_stats
+import vxdetector.profiler as profiler
+import vxdetector.pipeline as pipeline
+from vxdetector.interact_bowtie2 import map_reads, buildbowtie2
+from vxdetector.interact_bedtools import intersect_counts, overlap_counts
+
+output_columns = ['Number of Reads', 'Unaligned Reads [%]',
+                  'Not properly paired', 'Sequenced variable region',
+                  'V1', 'V2', 'V3', 'V4', 'V5', 'V6', 'V7', 'V8', 'V9',
+                  'Not aligned to a variable region']
+optional_columns = ['Reads used'] + bowtie2_stats.columns
+# optional columns are only written if at least one sample has them
+# pandas, numpy and the engines which need them are imported by the
+# functions using them, so importing this module stays fast
+
+
+def select_columns(result):
+    r'''Lists the output columns of a dataFrame
+
+    Parameters
+    ----------
+    result : pandas dataFrame
+        DataFrame with the obtained information in the columns.
+
+    Returns
+    -------
+    columns : list
+        output_columns followed by all optional_columns present
+        in the dataFrame.
+
+    '''
+    return output_columns + [column for column in optional_columns
+                             if column in result.columns]
 
 
 def do_statistic(result):
@@ -37,8 +76,10 @@ def do_statistic(result):
         ['Number of Reads', 'Unaligned Reads [%]', 'Not properly paired',
          'Sequenced variable region', 'V1', 'V2', 'V3', 'V4', 'V5', 'V6',
          'V7', 'V8', 'V9', 'Not aligned to a variable region']
+        followed by the present optional columns.
 
     '''
+    import pandas as pd
     average = result.mean(numeric_only=True).to_frame().T
     # calculates mean value for every numeric column
     region = (result['Sequenced variable region'].mode().values)
@@ -55,11 +96,7 @@ def do_statistic(result):
     std_dev = result.std(numeric_only=True).to_frame().T
     # calculates standard deviation for every numeric column
     statistic = pd.concat([average, std_dev], axis=0)
-    statistic = statistic[['Number of Reads',
-                           'Unaligned Reads [%]', 'Not properly paired',
-                           'Sequenced variable region', 'V1', 'V2', 'V3',
-                           'V4', 'V5', 'V6', 'V7', 'V8', 'V9',
-                           'Not aligned to a variable region']]
+    statistic = statistic[select_columns(result)]
     # combines the average and std_dev dataframes and sorts the columns
     # in the correct order
     statistic['row_descriptor'] = ['Average', 'Standard deviation']
@@ -88,6 +125,7 @@ def do_output(result, new_file, single_file):
         input.
 
     '''
+    import pandas as pd
     result = pd.DataFrame(result).T.sort_index()
     # converts dict to dataframe and sorts the dataframe by index
     # allows for easy navigation within the file
@@ -97,22 +135,404 @@ def do_output(result, new_file, single_file):
     if single_file is False:
         result = do_statistic(result)
     else:
-        result = result[['Number of Reads',
-                         'Unaligned Reads [%]', 'Not properly paired',
-                         'Sequenced variable region', 'V1', 'V2', 'V3',
-                         'V4', 'V5', 'V6', 'V7', 'V8', 'V9',
-                         'Not aligned to a variable region']]
+        result = result[select_columns(result)]
     result.to_csv(new_file, index=True)
 
 
-def workflow(file_dir, new_file, write_csv):
+def find_read2(fq_file):
+    r'''Searches for a reverse read file
+
+    Parameters
+    ----------
+    fq_file : str
+        Path to a .fastq file (or .fastq.gz) containing the (forward) reads.
+
+    Returns
+    -------
+    read2_file : str
+        Path the reverse read file would have. It does not
+        necessarily exist.
+    paired : Bool
+        Wether or not a reverse read file was found.
+
+    '''
+    file_name = os.path.basename(fq_file)
+    read2_file = os.path.join(os.path.dirname(fq_file),
+                              file_name.replace('_R1_', '_R2_'))
+    paired = '_R1_' in file_name and os.path.exists(read2_file)
+    return read2_file, paired
+
+
+def sample_name(fq_file):
+    r'''Reformats a filename for easy viewing
+
+    Parameters
+    ----------
+    fq_file : str
+        Path to a .fastq file (or .fastq.gz).
+
+    Returns
+    -------
+    file_name : str
+        Filename without extension and read designation.
+
+    '''
+    file_name = os.path.basename(fq_file)
+    file_name = file_name.rsplit('.f', 1)[0]
+    file_name = file_name.replace('_R1_001', '')
+    return file_name
+
+
+def project_name(file_dir):
+    r'''Name of the project of a run
+
+    Parameters
+    ----------
+    file_dir : str
+        Given filepath of a directory or a single file.
+
+    Returns
+    -------
+    project : str
+        Name of the directory, for a single file the name of the
+        directory containing it.
+
+    '''
+    if os.path.isdir(file_dir):
+        return os.path.basename(os.path.normpath(file_dir))
+    return os.path.basename(os.path.dirname(os.path.abspath(file_dir)))
+
+
+def find_overlap(path, temp_path, aligned_path, overlap_engine, reads=None):
+    r'''Looks which reads intersect with which variable region
+
+    Parameters
+    ----------
+    path : str
+        The program filepath.
+    temp_path : str
+        Path to the temporary folder of the sample.
+    aligned_path : str
+        Filepath of the converted Bowtie2 output file.
+    overlap_engine : str
+        'bedtools' classifies the output of a single bedtools intersect
+        (see interact_bedtools.overlap_counts). 'native' counts the
+        regions in-process (see interval_overlap.overlap_counts).
+    reads : dict or None
+        Writer of the per-read output (see read_output.start), only
+        used by the native engine.
+
+    Returns
+    -------
+    regions : dict
+        Occurences of all variable regions.
+    no_overlap : int
+        Number of reads not mapped to any variable region.
+
+    '''
+    if overlap_engine == 'native':
+        import vxdetector.interval_overlap as interval_overlap
+        with profiler.stage('overlap'):
+            return interval_overlap.overlap_counts(path, aligned_path, reads)
+    return overlap_counts(path, aligned_path)
+
+
+def per_read_supported(engine, overlap_engine, stream, sampling):
+    r'''Checks if the per-read output can be written
+
+    The positions of the reads are only known after an alignment and
+    only the in-process counters see every read.
+
+    Returns
+    -------
+    supported : Bool
+        Wether or not analyse_sample can write the per-read output
+        with these settings.
+
+    '''
+    return engine == 'bowtie2' and sampling is None \
+        and (stream is True or overlap_engine == 'native')
+
+
+def find_reference(path, reference=None):
+    r'''Directory of the reference the reads are mapped against
+
+    Parameters
+    ----------
+    path : str
+        The program filepath.
+    reference : str or None
+        Directory of a reduced reference bundle
+        (see reduce_reference.build_bundle). Default is the full
+        reference of the program.
+
+    Returns
+    -------
+    reference_path : str
+        Directory containing the Indexed_bt2 folder which is used.
+
+    Raises
+    ------
+    FileNotFoundError
+        If the bundle was not built completely or its reference files
+        are missing.
+
+    '''
+    if reference is None:
+        return path
+    reference_path = os.path.join(os.path.abspath(reference), '')
+    if os.path.exists(f'{reference_path}bundle.json') is False:
+        raise FileNotFoundError(f'"{reference}" is no complete '
+                                'reference bundle')
+    for name in ['annoted_ref.bed', '85_otus.fasta']:
+        if os.path.exists(f'{reference_path}Indexed_bt2/{name}') is False:
+            raise FileNotFoundError(f'It seems "{name}" of the reference '
+                                    f'bundle "{reference}" is missing.')
+    return reference_path
+
+
+def prepare_reference(path, threads=None, overlap_engine='bedtools',
+                      stream=False, sampling=None, engine='bowtie2'):
+    r'''Builds and loads everything the samples share
+
+    Parameters
+    ----------
+    path : str
+        Directory containing the Indexed_bt2 folder (see find_reference).
+    threads : int or None
+        Number of threads bowtie2-build may use. Default are all
+        available cores.
+    overlap_engine, stream, sampling, engine :
+        See analyse_sample. The variable region reference is only loaded
+        if the samples need it.
+
+    '''
+    if engine == 'kmer':
+        import vxdetector.kmer_classifier as kmer_classifier
+        with profiler.stage('load_index'):
+            kmer_classifier.load_index(path)
+        # compiles the k-mer index once, bowtie2 is not needed
+        return
+    with profiler.stage('buildbowtie2'):
+        buildbowtie2(path, threads)
+        # builds bowtie2 index
+    if overlap_engine == 'native' or stream is True or sampling is not None:
+        import vxdetector.interval_overlap as interval_overlap
+        with profiler.stage('load_reference'):
+            interval_overlap.load_reference(path)
+        # compiles the variable region reference once before the
+        # samples are analysed, workers memory-map the compiled files
+
+
+def analyse_sample(fq_file, read2_file, paired, path, threads=1,
+                   overlap_engine='bedtools', stream=False, strict=False,
+                   sampling=None, profile=None, timeout=None,
+                   engine='bowtie2', temp_dir=None, per_read=None):
+    r'''Analyses a single sample
+
+    Runs the mapbowtie2 -> overlap -> create_row chain for one
+    sample inside its own temporary folder. That way several samples
+    can be analysed at the same time without interfering with each other.
+
+    Parameters
+    ----------
+    fq_file : str
+        Path to a .fastq file (or .fastq.gz) containing the (forward) reads.
+    read2_file : str
+        Path to a .fastq file (or .fastq.gz) containing backwards reads.
+        Is disregarded if paired = False.
+    paired : Bool
+        Wether or not the reads are paired.
+    path : str
+        The program filepath.
+    threads : int
+        Number of threads given to bowtie2 and samtools.
+    overlap_engine : str
+        Either 'bedtools' or 'native' (see find_overlap).
+    stream : Bool
+        If True the bowtie2 output is counted while bowtie2 is running
+        (see sam_stream.stream_bowtie2) and no intermediate files
+        are written.
+    strict : Bool
+        If True a ValueError is raised if the file is no fastq file or
+        has no reads of the required mapping-quality. Used if a single
+        file was given.
+    sampling : dict or None
+        If given only a subsample of the reads is analysed
+        (see subsample.analyse). Keys are 'reads' (reservoir sample
+        size), 'tolerance' and 'confidence' (early stopping).
+    profile : str or None
+        JSON-lines file the stages of this sample are recorded in
+        (see profiler.stage). None disables the profiling.
+    timeout : float or None
+        Seconds after which bowtie2, samtools and bedtools are killed
+        and a TimeoutError is raised.
+    engine : str
+        'bowtie2' (default) aligns the reads. 'kmer' classifies the reads
+        by their k-mers without alignment (see kmer_classifier.analyse),
+        overlap_engine, stream and sampling are disregarded.
+    temp_dir : str or None
+        Directory the temporary folder of the sample is created in.
+        Default is the program filepath.
+    per_read : str or None
+        Directory the regions of every read are written to
+        (see read_output). Needs the bowtie2 engine without sampling
+        and either stream or the native overlap engine.
+
+    Returns
+    -------
+    new_row : dict or None
+        Dictionary containing all analysed information about the sample
+        (see Output_counter.create_row). None if bowtie2 ended with an error
+        and the sample should be skipped.
+
+    '''
+    profiler.enable(profile, sample_name(fq_file))
+    if per_read is not None and not per_read_supported(
+            engine, overlap_engine, stream, sampling):
+        raise ValueError('The per-read output needs the bowtie2 engine '
+                         'with --stream or the native overlap engine')
+    if engine == 'kmer':
+        import vxdetector.kmer_classifier as kmer_classifier
+        with profiler.stage('kmer'):
+            new_row, counts = kmer_classifier.analyse(fq_file, read2_file,
+                                                      path, paired)
+        if new_row is None:
+            if strict is True:
+                raise ValueError('This file does not look like a fastq file')
+            return None
+        if paired is True:
+            overlap_count = counts['aligned']
+        else:
+            overlap_count = sum(counts['regions'].values())
+        if strict is True and overlap_count == 0:
+            raise ValueError('This file has no Reads of the required '
+                             'mapping-quality')
+        return new_row
+    if sampling is not None:
+        import vxdetector.subsample as subsample
+        with profiler.stage('subsample'):
+            new_row, counts = subsample.analyse(fq_file, read2_file, path,
+                                                paired, threads,
+                                                timeout=timeout, **sampling)
+        if new_row is None and strict is True:
+            raise ValueError('This file does not look like a fastq file')
+        if paired is True:
+            overlap_count = counts['intervals']
+        else:
+            overlap_count = sum(counts['regions'].values())
+        if strict is True and overlap_count == 0:
+            raise ValueError('This file has no Reads of the required '
+                             'mapping-quality')
+        return new_row
+    if stream is True:
+        import vxdetector.read_output as read_output
+        import vxdetector.sam_stream as sam_stream
+        with read_output.writing(per_read, sample_name(fq_file)) as reads:
+            with profiler.stage('stream_bowtie2'):
+                counts, stats, Error = sam_stream.stream_bowtie2(
+                    fq_file, read2_file, path, paired, threads, reads,
+                    timeout)
+            if Error is True:
+                read_output.discard(reads)
+                # the reads of a failed sample are not published
+        if Error is True:
+            if strict is True:
+                raise ValueError('This file does not look like a fastq file')
+            return None
+        if paired is True:
+            overlap_count = counts['intervals']
+        else:
+            overlap_count = sum(counts['regions'].values())
+        if strict is True and overlap_count == 0:
+            raise ValueError('This file has no Reads of the required '
+                             'mapping-quality')
+        return sam_stream.create_row(stats, paired, counts)
+    return asyncio.run(analyse_alignment(fq_file, read2_file, paired, path,
+                                         threads, overlap_engine, strict,
+                                         profile, timeout, temp_dir,
+                                         per_read))
+
+
+async def analyse_alignment(fq_file, read2_file, paired, path, threads=1,
+                            overlap_engine='bedtools', strict=False,
+                            profile=None, timeout=None, temp_dir=None,
+                            per_read=None):
+    r'''Analyses a single sample without blocking the event loop
+
+    Runs the mapbowtie2 -> overlap -> create_row chain of
+    analyse_sample. bowtie2, samtools and bedtools run as asyncio
+    subprocesses, so several samples can be analysed concurrently by
+    one process (see pipeline.gather). Cancelling the coroutine kills
+    the running programs and removes the temporary folder.
+    See analyse_sample for the parameters.
+
+    '''
+    profiler.enable(profile, sample_name(fq_file))
+    temp_path = files_manager.tmp_dir(temp_dir or path, temp_path=None)
+    stats = dict()
+    try:
+        with profiler.stage('mapbowtie2'):
+            aligned_path, Error = await map_reads(fq_file, read2_file, path,
+                                                  temp_path, paired, threads,
+                                                  timeout, stats)
+            # the alignment summary is parsed while bowtie2 is running
+        # The Programm bowtie2 is used to align the Reads to a reference
+        # 16S database.
+        if Error is True:
+            if strict is True:
+                raise ValueError('This file does not look like a fastq file')
+                # raises error if given file is not a fastq file
+            return None
+        if strict is True and paired is True and Output_counter.rawincount(
+                f'{temp_path}paired.bed') == 0:
+            raise ValueError('This file has no Reads of the required '
+                             'mapping-quality')
+        if overlap_engine == 'native':
+            import vxdetector.read_output as read_output
+            writing = read_output.writing(per_read, sample_name(fq_file))
+        else:
+            writing = contextlib.nullcontext()
+        with writing as reads:
+            if overlap_engine == 'native':
+                regions, no_overlap = await asyncio.to_thread(
+                    find_overlap, path, temp_path, aligned_path,
+                    overlap_engine, reads)
+            else:
+                regions, no_overlap = await intersect_counts(
+                    path, aligned_path, timeout)
+            # look which reads intersect with which variable Region
+            if strict is True and paired is False:
+                if sum(regions.values()) == 0:
+                    raise ValueError('This file has no Reads of the '
+                                     'required mapping-quality')
+            # checked before the per-read output is published, it is
+            # removed if the sample is rejected
+        with profiler.stage('create_row'):
+            return await asyncio.to_thread(Output_counter.create_row,
+                                           temp_path, paired, regions,
+                                           no_overlap, stats)
+        # streamlines generated output to a visual terminal output
+    finally:
+        files_manager.tmp_dir(temp_dir or path, temp_path)
+        # deletes the temporary folder of this sample
+
+
+def workflow(file_dir, new_file, write_csv, jobs=None, threads=None,
+             overlap_engine='bedtools', stream=False, sampling=None,
+             cache=None, cache_size=result_cache.default_size,
+             profile=None, timeout=None, alignment_stats=False,
+             engine='bowtie2', reference=None, batch=None, per_read=None,
+             store=None):
     r'''Worker function
 
     This function is the center piece of this program.
     It does some preliminary work such as grabbing all fastq files
     in the given directory.
     After that it calls other functions which analyse the found
-    fastq-files.
+    fastq-files. Every result is written to a spool file as soon as
+    its sample is analysed (see result_writer), the average and standard
+    deviation are updated online.
 
     Parameters
     ----------
@@ -126,90 +546,262 @@ def workflow(file_dir, new_file, write_csv):
     write_csv : Bool
         Wether or not a csv file should be written in the
         standard Output folder of this program.
+    jobs : int or None
+        Number of samples of a directory which are analysed in
+        parallel. Each sample is processed in its own process and
+        temporary folder. If threads is set, jobs is the upper limit
+        of parallel samples. Default is serial processing.
+    threads : int or None
+        Total number of cores the analysis may use. The cores are split
+        between parallel samples and the bowtie2 and samtools threads
+        of each sample (see scheduler.plan). The number of parallel
+        samples is also limited by the available memory.
+        0 uses all available cores.
+    overlap_engine : str
+        'bedtools' (default) intersects the reads with the variable
+        regions using bedtools. 'native' uses the in-process engine of
+        interval_overlap which loads the reference only once.
+    stream : Bool
+        If True the bowtie2 output is filtered and counted while bowtie2
+        is still running. No intermediate files are written.
+    sampling : dict or None
+        Analyses only a subsample of the reads of every file, see
+        analyse_sample. The column 'Reads used' reports how many reads
+        were aligned.
+    cache : str or None
+        'use' returns the results of samples analysed before from the
+        result cache (see result_cache), 'refresh' analyses all samples
+        again and replaces the cached results. None disables the cache.
+    cache_size : int
+        Size limit of the result cache in bytes. The least recently
+        used results are removed first.
+    profile : str or None
+        If given wall time, CPU time, peak memory and I/O of every stage
+        of every sample are appended to this JSON-lines file. The hottest
+        stages are printed by "python -m vxdetector.profiler FILE".
+    timeout : float or None
+        Seconds after which the programs of a sample are killed and a
+        TimeoutError is raised.
+    alignment_stats : Bool
+        Wether or not the columns of the bowtie2 alignment summary
+        (see bowtie2_stats.create_row) are written.
+    engine : str
+        'bowtie2' (default) or 'kmer' (see analyse_sample).
+    reference : str or None
+        Directory of a reduced reference bundle
+        (see reduce_reference.build_bundle) the reads are mapped against.
+        Default is the full reference of the program.
+    batch : int or None
+        If given up to batch samples of a directory are aligned by a
+        single bowtie2 process using all threads
+        (see multiplex.analyse_batch). Only used with the bowtie2 engine
+        and without sampling.
+    per_read : str or None
+        Directory the regions of every read are written to, one folder
+        per sample (see read_output). Samples are neither batched nor
+        taken from the cache then.
+    store : str or None
+        If given every result is also appended to this SQLite result
+        store (see result_store), keyed by sample, run and a fingerprint
+        of the reference and parameters. The input directory is the
+        project of the samples. '' uses Output/results.sqlite of the
+        program.
 
     '''
+    if per_read is not None and not per_read_supported(
+            engine, overlap_engine, stream, sampling):
+        raise ValueError('The per-read output needs the bowtie2 engine '
+                         'with --stream or the native overlap engine')
     path = files_manager.get_lib()
-    temp_path = files_manager.tmp_dir(path, temp_path=None)
-    # sets the paths of the programm itself and a temporary folder
-    paired = False
-    result = dict()
-    buildbowtie2(path)
-    # builds bowtie2 index
-    if glob.glob(f'{file_dir}**/*.fastq*', recursive=True) == [] \
-       and os.path.isdir(file_dir):
-        files_manager.tmp_dir(path, temp_path)
-        raise ValueError('There were no FASTQ files '
-                         'in this directory')
-        # checks if given directory contains fastq files
+    # sets the path of the programm itself
+    index_threads = threads or None
+    # the index is built before any sample, so it may use all cores
+    # unless a core budget was given
+    reference_path = find_reference(path, reference)
+    # the index and the variable regions are read from the bundle,
+    # the output and the cache stay in the program path
+    if threads is None:
+        threads = 1 if jobs is None else jobs
+        budget_jobs = threads
+        # without a core budget every sample gets a single thread
+    else:
+        if threads == 0:
+            threads = scheduler.available_cpus()
+        budget_jobs = jobs
+    profiler.enable(profile)
+    prepare_reference(reference_path, index_threads, overlap_engine, stream,
+                      sampling, engine)
     if os.path.isfile(file_dir):
         single_file = True
-        file_name = os.path.basename(file_dir)
-        read2_file = os.path.join(os.path.dirname(file_dir),
-                                  file_name.replace('_R1_', '_R2_'))
-        if '_R1_' in file_name and os.path.exists(read2_file):
-            paired = True
+        read2_file, paired = find_read2(file_dir)
         # searches for a reverse read file
-        aligned_path, Error = mapbowtie2(file_dir, read2_file,
-                                         path, temp_path, paired)
-        # The Programm bowtie2 is used to align the Reads to a reference
-        # 16S database.
-        if Error is True:
-            files_manager.tmp_dir(path, temp_path)
-            raise ValueError('This file does not look like a fastq file')
-            # raises error if given file is not a fastq file
-        if paired is True and Output_counter.rawincount(f'{temp_path}'
-                                                        'paired.bed') == 0:
-            files_manager.tmp_dir(path, temp_path)
-            raise ValueError('This file has no Reads of the required '
-                             'mapping-quality')
-        overlap(path, temp_path, aligned_path)
-        # look which reads intersect with which variable Region
-        if paired is False and Output_counter.rawincount(f'{temp_path}'
-                                                         'BED.bed') == 0:
-            files_manager.tmp_dir(path, temp_path)
-            raise ValueError('This file has no Reads of the required '
-                             'mapping-quality')
-        file_name = file_name.rsplit('.f', 1)[0]
-        file_name = file_name.replace('_R1_001', '')
-        # reformats filename for easy viewing
-        result[file_name] = Output_counter.create_row(temp_path, paired)
-        # streamlines generated output to a visual terminal output
+        found = iter([(file_dir, read2_file, paired)])
     elif os.path.isdir(file_dir):
         single_file = False
-        for fq_file in glob.glob(f'{file_dir}**/*.fastq*', recursive=True):
-            paired = False
-            if '_R2_' in fq_file:
-                continue
-            file_name = os.path.basename(fq_file)
-            read2_file = os.path.join(os.path.dirname(fq_file),
-                                      file_name.replace('_R1_', '_R2_'))
-            if '_R1_' in file_name and os.path.exists(read2_file):
-                paired = True
-            # searches for a reverse read file
-            aligned_path, Error = mapbowtie2(fq_file, read2_file,
-                                             path, temp_path, paired)
-            # The Programm bowtie2 is used to align the Reads to a reference
-            # 16S database.
-            if Error is True:
-                continue
-            overlap(path, temp_path, aligned_path)
-            # look which reads intersect with which variable Region
-            file_name = file_name.rsplit('.f', 1)[0]
-            file_name = file_name.replace('_R1_001', '')
-            # reformats filename for easy viewing
-            result[file_name] = Output_counter.create_row(temp_path,
-                                                          paired)
-            # streamlines generated output to a visual terminal output
-    files_manager.tmp_dir(path, temp_path)
-    # deletes temporary folder
-    do_output(result, new_file, single_file)
-    # writes ouput eiher to STDOUT or to a file specified
-    # via the -o option
+        found = files_manager.find_samples(file_dir)
+        # lazily walks the directory, reverse read files are already paired
+    lookahead = list(itertools.islice(found, threads))
+    if lookahead == [] and single_file is False:
+        raise ValueError('There were no FASTQ files '
+                         'in this directory')
+        # checks if given directory contains fastq files
+    workers, sample_threads = scheduler.plan(
+        threads, len(lookahead), scheduler.sample_memory(reference_path),
+        scheduler.available_memory(), budget_jobs)
+    # splits the core budget between samples and bowtie2 threads, no
+    # more than threads samples are needed to know the number of workers
+    found = itertools.chain(lookahead, found)
+    samples = []
+    keys = []
+    parameters = sampling if engine == 'bowtie2' else {'engine': engine}
+    # results of the k-mer engine never replace alignment results
+    if cache is not None or store is not None:
+        fingerprint = result_cache.reference_fingerprint(reference_path)
+    if cache is not None:
+        cache_path = result_cache.cache_dir(path)
+    if store is not None:
+        import vxdetector.result_store as result_store
+        connection = result_store.connect(
+            store or result_store.store_path(path))
+        run = result_store.start_run(
+            connection, project_name(file_dir),
+            result_store.parameter_fingerprint(fingerprint, parameters),
+            parameters)
+    writer = result_writer.start()
+
+    def record(i, new_row, analysed=True):
+        # writes the result of a sample as soon as it is available
+        if analysed is True and cache is not None and new_row is not None:
+            result_cache.store(cache_path, keys[i], new_row)
+        if new_row is None:
+            return
+            # skips files on which bowtie2 ended with an error
+        if store is not None:
+            result_store.add(connection, run, sample_name(samples[i][0]),
+                             new_row)
+        if alignment_stats is False:
+            new_row = {key: value for key, value in new_row.items()
+                       if key not in bowtie2_stats.columns}
+        result_writer.add(writer, sample_name(samples[i][0]), new_row)
+
+    def key_samples():
+        # hashes the read files of several samples at the same time
+        # while the directory is still walked
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            hashing = collections.deque()
+            for sample in found:
+                hashing.append((sample, executor.submit(
+                    result_cache.sample_key, *sample, fingerprint,
+                    parameters)))
+                if len(hashing) >= workers:
+                    sample, key = hashing.popleft()
+                    yield sample, key.result()
+            for sample, key in hashing:
+                yield sample, key.result()
+
+    def missing():
+        # yields the index of every sample that needs to be analysed
+        if cache is None:
+            keyed = ((sample, None) for sample in found)
+        else:
+            keyed = key_samples()
+        for sample, key in keyed:
+            samples.append(sample)
+            keys.append(key)
+            if cache == 'use' and per_read is None:
+                new_row = result_cache.lookup(cache_path, key)
+                if new_row is not None:
+                    record(len(samples) - 1, new_row, analysed=False)
+                    continue
+                    # cached samples are not analysed again
+            yield len(samples) - 1
+
+    analyse = partial(analyse_sample, path=reference_path,
+                      threads=sample_threads,
+                      overlap_engine=overlap_engine, stream=stream,
+                      strict=single_file, sampling=sampling,
+                      profile=profile, timeout=timeout, engine=engine,
+                      per_read=per_read)
+    if batch is not None and engine == 'bowtie2' and sampling is None \
+       and single_file is False and per_read is None:
+        import vxdetector.multiplex as multiplex
+        pending = {True: [], False: []}
+
+        def align_batch(paired):
+            indexes = pending[paired]
+            pending[paired] = []
+            with profiler.stage('multiplex'):
+                rows = multiplex.analyse_batch([samples[i] for i in indexes],
+                                               reference_path, threads,
+                                               timeout)
+            for i, new_row in zip(indexes, rows):
+                record(i, new_row)
+
+        for i in missing():
+            pending[samples[i][2]].append(i)
+            if len(pending[samples[i][2]]) >= batch:
+                align_batch(samples[i][2])
+        for paired in pending:
+            if pending[paired]:
+                align_batch(paired)
+        # paired and unpaired samples are aligned in separate batches
+    elif workers > 1 and engine == 'bowtie2' \
+            and overlap_engine == 'bedtools' \
+            and stream is False and sampling is None:
+        async def analyse_task(i):
+            if cache is not None:
+                keys[i] = await asyncio.to_thread(
+                    result_cache.sample_key, *samples[i], fingerprint,
+                    parameters)
+                # the read files are hashed in a thread, so the programs
+                # of the other samples are not stalled meanwhile
+                if cache == 'use':
+                    new_row = await asyncio.to_thread(
+                        result_cache.lookup, cache_path, keys[i])
+                    if new_row is not None:
+                        record(i, new_row, analysed=False)
+                        return
+            record(i, await analyse_alignment(
+                *samples[i], reference_path, sample_threads, overlap_engine,
+                False, profile, timeout))
+
+        def produce():
+            for sample in found:
+                samples.append(sample)
+                keys.append(None)
+                yield partial(analyse_task, len(samples) - 1)
+
+        asyncio.run(pipeline.gather(produce(), workers))
+        # all work is done by bowtie2, samtools and bedtools, so one
+        # process runs the samples as concurrent asyncio tasks
+    elif workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(analyse, *samples[i]): i
+                       for i in missing()}
+            for future in as_completed(futures):
+                record(futures[future], future.result())
+    else:
+        for i in missing():
+            record(i, analyse(*samples[i]))
+    # the output is sorted by sample name at the end, so parallel
+    # and serial runs yield the same result
+    if cache is not None:
+        result_cache.evict(cache_path, cache_size)
+    if store is not None:
+        connection.close()
+    targets = [new_file]
     if write_csv is True:
-        new_file = (f'{path}Output/'
-                    f'{os.path.basename(os.path.dirname(file_dir))}.csv')
-        do_output(result, new_file, single_file)
+        targets.append(f'{path}Output/'
+                       f'{os.path.basename(os.path.dirname(file_dir))}.csv')
         # writes csv file to the standard output folder
+    columns = output_columns + [column for column in optional_columns
+                                if column in writer['columns']]
+    profiler.enable(profile)
+    # stages after the samples do not belong to a sample
+    with profiler.stage('do_output'):
+        result_writer.finish(writer, targets, columns, single_file)
+        # writes ouput eiher to STDOUT or to a file specified
+        # via the -o option and the csv file in one pass
 
 
 def main():
@@ -225,8 +817,46 @@ def main():
         -c, --csv :
             If set a csv file will be written into
             the standard Output folder
+        -j, --jobs :
+            Number of samples analysed in parallel
+        -t, --threads :
+            Total number of cores the analysis may use
+        --overlap-engine :
+            Either 'bedtools' or 'native'
+        --stream :
+            Counts the bowtie2 output without intermediate files
+        --subsample :
+            Analyses a reservoir sample of N reads per file
+        --early-stop :
+            Stops aligning once all proportions are known within
+            the given tolerance (percentage points)
+        --cache :
+            Reuses the results of samples analysed before
+        --no-cache :
+            Neither reads nor writes the result cache (default)
+        --refresh :
+            Analyses all samples again and updates the result cache
+        --cache-size :
+            Size limit of the result cache in MB
+        --profile :
+            Records every stage in a JSON-lines file
+        --timeout :
+            Seconds after which the programs of a sample are killed
+        --alignment-stats :
+            Adds the bowtie2 alignment summary to the output
+        --engine :
+            Either 'bowtie2' or 'kmer'
+        --reference :
+            Directory of a reduced reference bundle
+        --batch :
+            Aligns up to N samples with one bowtie2 process
+        --per-read :
+            Directory the regions of every read are written to
+        --store :
+            Appends the results to an SQLite result store
 
     '''
+    from vxdetector.multiplex import default_batch
     parser = argparse.ArgumentParser(prog='VX detector', description=(
         'This programm tries to find which variable region of the 16S '
         'sequence was sequencend'))
@@ -240,9 +870,100 @@ def main():
     parser.add_argument('-c', '--csv', dest='write_csv', action='store_true',
                         help='If set the output will be written in a \
                        .csv file in the Output folder')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=None,
+                        help='Number of samples of a directory which are \
+                        analysed in parallel. If --threads is set this is \
+                        the upper limit of parallel samples.')
+    parser.add_argument('-t', '--threads', dest='threads', type=int,
+                        default=None,
+                        help='Total number of cores which are split between \
+                        parallel samples and bowtie2 threads. 0 uses all \
+                        available cores.')
+    parser.add_argument('--overlap-engine', dest='overlap_engine',
+                        choices=['bedtools', 'native'], default='bedtools',
+                        help='Intersect reads and variable regions with \
+                        bedtools or with the in-process engine.')
+    parser.add_argument('--stream', dest='stream', action='store_true',
+                        help='Counts the variable regions while bowtie2 is \
+                        running without writing intermediate files.')
+    parser.add_argument('--subsample', dest='subsample', type=int,
+                        default=None,
+                        help='Analyses a deterministic reservoir sample of \
+                        N reads (pairs) of every file.')
+    parser.add_argument('--early-stop', dest='tolerance', type=float,
+                        default=None,
+                        help='Aligns reads in batches and stops once the \
+                        confidence interval of every region is narrower \
+                        than +/- the given percentage points.')
+    parser.add_argument('--confidence', dest='confidence', type=float,
+                        default=0.95,
+                        help='Confidence level used by --early-stop \
+                        (default: 0.95)')
+    parser.add_argument('--cache', dest='cache', action='store_const',
+                        const='use', default=None,
+                        help='Returns the results of samples analysed \
+                        before from the result cache in Output/cache and \
+                        caches new results.')
+    parser.add_argument('--no-cache', dest='cache', action='store_const',
+                        const=None,
+                        help='Does not use the result cache (default).')
+    parser.add_argument('--refresh', dest='cache', action='store_const',
+                        const='refresh',
+                        help='Analyses all samples again and replaces their \
+                        cached results.')
+    parser.add_argument('--cache-size', dest='cache_size', type=float,
+                        default=result_cache.default_size / 1024 ** 2,
+                        help='Size limit of the result cache in MB \
+                        (default: 100)')
+    parser.add_argument('--profile', dest='profile', default=None,
+                        help='Appends wall time, CPU time, peak memory and \
+                        I/O of every stage to this JSON-lines file.')
+    parser.add_argument('--timeout', dest='timeout', type=float,
+                        default=None,
+                        help='Seconds after which bowtie2, samtools and \
+                        bedtools are killed for a sample.')
+    parser.add_argument('--alignment-stats', dest='alignment_stats',
+                        action='store_true',
+                        help='Adds the concordant, discordant and mate \
+                        alignment rates reported by bowtie2 to the output.')
+    parser.add_argument('--engine', dest='engine',
+                        choices=['bowtie2', 'kmer'], default='bowtie2',
+                        help='Aligns the reads with bowtie2 or classifies \
+                        them by their k-mers without alignment (faster).')
+    parser.add_argument('--reference', dest='reference', default=None,
+                        help='Maps against a reduced reference bundle \
+                        built by "python -m vxdetector.reduce_reference".')
+    parser.add_argument('--batch', dest='batch', type=int, nargs='?',
+                        const=default_batch, default=None,
+                        help='Aligns up to N samples of a directory with a \
+                        single bowtie2 process, which saves the start-up \
+                        of bowtie2 for many small samples (default N: 64).')
+    parser.add_argument('--per-read', dest='per_read', default=None,
+                        help='Writes the OTU, position and variable regions \
+                        of every read to a folder per sample in this \
+                        directory (needs --stream or --overlap-engine \
+                        native).')
+    parser.add_argument('--store', dest='store', nargs='?', const='',
+                        default=None,
+                        help='Also appends the results to this SQLite \
+                        result store (default: Output/results.sqlite). \
+                        Summaries are printed by \
+                        "python -m vxdetector.result_store STORE".')
     args = parser.parse_args()
     # allows terminal input
-    workflow(args.dir_path, args.output_file, args.write_csv)
+    sampling = None
+    if args.subsample is not None or args.tolerance is not None:
+        sampling = {'reads': args.subsample, 'tolerance': args.tolerance,
+                    'confidence': args.confidence}
+    workflow(args.dir_path, args.output_file, args.write_csv,
+             jobs=args.jobs, threads=args.threads,
+             overlap_engine=args.overlap_engine, stream=args.stream,
+             sampling=sampling, cache=args.cache,
+             cache_size=int(args.cache_size * 1024 ** 2),
+             profile=args.profile, timeout=args.timeout,
+             alignment_stats=args.alignment_stats, engine=args.engine,
+             reference=args.reference, batch=args.batch,
+             per_read=args.per_read, store=args.store)
 
 
 if __name__ == '__main__':
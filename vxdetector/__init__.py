@@ -0,0 +1,7 @@
+def __getattr__(name):
+    # vxdetector.detect and vxdetector.Result import the api on first use,
+    # so "import vxdetector" does not load any module of the program
+    if name in ('detect', 'Result'):
+        import vxdetector.api as api
+        return getattr(api, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
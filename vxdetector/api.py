@@ -0,0 +1,177 @@
+#!/usr/bin/python
+
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import vxdetector.VXdetector as VXdetector
+import vxdetector.bowtie2_stats as bowtie2_stats
+import vxdetector.files_manager as files_manager
+from vxdetector.Output_counter import regions_list
+
+
+@dataclass
+class Result:
+    r'''Result of a single sample
+
+    Attributes
+    ----------
+    sample : str
+        Name of the sample (see VXdetector.sample_name).
+    fq_file, read2_file, paired :
+        Read files of the sample, read2_file is None if the reads
+        are unpaired.
+    reads : int
+        Number of Reads.
+    unaligned : float
+        Unaligned Reads [%].
+    not_properly_paired : float or str
+        Share of the reads which are not properly paired,
+        'not paired' if the reads are unpaired.
+    region : str
+        Sequenced variable region.
+    regions : dict
+        Share of every variable region (V1 to V9).
+    not_aligned : float
+        Share of the reads not aligned to a variable region.
+    reads_used : int or None
+        Number of reads of the subsample, None without sampling.
+    alignment : dict
+        Columns of the bowtie2 alignment summary
+        (see bowtie2_stats.create_row), empty for the k-mer engine.
+
+    '''
+    __slots__ = ('sample', 'fq_file', 'read2_file', 'paired', 'reads',
+                 'unaligned', 'not_properly_paired', 'region', 'regions',
+                 'not_aligned', 'reads_used', 'alignment')
+    # many results stay small in memory
+    sample: str
+    fq_file: str
+    read2_file: str
+    paired: bool
+    reads: int
+    unaligned: float
+    not_properly_paired: object
+    region: str
+    regions: dict
+    not_aligned: float
+    reads_used: object
+    alignment: dict
+
+
+def make_result(fq_file, read2_file, paired, new_row):
+    r'''Converts the row of a sample to a Result
+
+    Parameters
+    ----------
+    fq_file, read2_file, paired :
+        Read files of the sample.
+    new_row : dict
+        Result of the sample (see Output_counter.create_row).
+
+    Returns
+    -------
+    result : Result
+
+    '''
+    return Result(
+        sample=VXdetector.sample_name(fq_file), fq_file=fq_file,
+        read2_file=read2_file if paired else None, paired=paired,
+        reads=new_row['Number of Reads'],
+        unaligned=new_row['Unaligned Reads [%]'],
+        not_properly_paired=new_row['Not properly paired'],
+        region=new_row['Sequenced variable region'],
+        regions={region: new_row[region] for region in regions_list},
+        not_aligned=new_row['Not aligned to a variable region'],
+        reads_used=new_row.get('Reads used'),
+        alignment={column: new_row[column] for column in bowtie2_stats.columns
+                   if column in new_row})
+
+
+def expand(paths):
+    r'''Lists the samples of the given files and directories
+
+    Parameters
+    ----------
+    paths : str or list
+        .fastq files (or .fastq.gz) and directories containing them.
+
+    Returns
+    -------
+    samples : list
+        (fq_file, read2_file, paired) of every sample.
+
+    Raises
+    ------
+    FileNotFoundError
+        If a path does not exist.
+
+    '''
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+    samples = []
+    for path in map(os.fspath, paths):
+        if os.path.isfile(path):
+            samples.append((path, *VXdetector.find_read2(path)))
+        elif os.path.isdir(path):
+            samples.extend(files_manager.find_samples(path))
+        else:
+            raise FileNotFoundError(f'"{path}" does not exist')
+    return samples
+
+
+def detect(paths, threads=1, jobs=1, engine='bowtie2',
+           overlap_engine='native', stream=False, sampling=None,
+           reference=None, strict=False):
+    r'''Detects the sequenced variable regions of samples
+
+    Analyses the samples like VXdetector without writing any output
+    file, the temporary folders of the samples are created in the
+    temporary directory of the system.
+
+    Parameters
+    ----------
+    paths : str or list
+        .fastq files (or .fastq.gz) and directories containing them
+        (see expand).
+    threads : int
+        Number of threads given to bowtie2 and samtools of every sample.
+    jobs : int
+        Number of samples analysed at the same time.
+    engine, overlap_engine, stream, sampling :
+        See VXdetector.analyse_sample.
+    reference : str or None
+        Directory of a reduced reference bundle
+        (see reduce_reference.build_bundle).
+    strict : Bool
+        If True a ValueError is raised for a file which is no fastq file
+        or has no reads of the required mapping-quality. Otherwise the
+        sample is left out.
+
+    Returns
+    -------
+    results : list
+        Result of every analysed sample in the order of the paths.
+
+    '''
+    samples = expand(paths)
+    if reference is None:
+        path = files_manager.get_lib(output=False)
+    else:
+        path = VXdetector.find_reference(None, reference)
+        # the reference of the program is not used, only the bundle is
+        # checked
+    VXdetector.prepare_reference(path, None, overlap_engine, stream,
+                                 sampling, engine)
+    temp_dir = tempfile.gettempdir()
+
+    def analyse(sample):
+        return VXdetector.analyse_sample(
+            *sample, path, threads, overlap_engine=overlap_engine,
+            stream=stream, strict=strict, sampling=sampling, engine=engine,
+            temp_dir=temp_dir)
+
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        rows = list(executor.map(analyse, samples))
+    return [make_result(*sample, new_row)
+            for sample, new_row in zip(samples, rows) if new_row is not None]
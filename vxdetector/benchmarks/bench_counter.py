@@ -0,0 +1,108 @@
+#!/usr/bin/python
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import vxdetector.Output_counter as Output_counter
+
+program_path = os.path.dirname(os.path.abspath(__file__))
+program_path = f'{os.path.dirname(os.path.dirname(program_path))}/'
+# the reference files are stored in the parent directory of the package
+
+
+def count_substrings(BED_path):
+    r'''Former region counter of Output_counter.create_row
+
+    Reads the whole file into memory and counts every region name
+    anywhere on a line with one scan per region.
+
+    Parameters
+    ----------
+    BED_path : str
+        Filepath to the .bed file.
+
+    Returns
+    -------
+    counts : list
+        Occurences of V1 - V9.
+
+    '''
+    with open(BED_path, 'r') as b:
+        bed_data = b.read()
+    return [bed_data.count(region) for region in Output_counter.regions_list]
+
+
+def write_bed(BED_path, rows, path):
+    r'''Writes a synthetic intersect file
+
+    Parameters
+    ----------
+    BED_path : str
+        Filepath the synthetic .bed file is written to.
+    rows : int
+        Number of lines of the synthetic file.
+    path : str
+        The program filepath. Lines are drawn from the annoted_ref.bed.
+
+    '''
+    with open(f'{path}Indexed_bt2/annoted_ref.bed', 'r') as f:
+        reference = f.readlines()
+    random.seed(0)
+    with open(BED_path, 'w') as f:
+        for _ in range(rows):
+            f.write(random.choice(reference))
+
+
+def benchmark(rows, repeat):
+    r'''Times both region counters on the same synthetic file
+
+    Parameters
+    ----------
+    rows : int
+        Number of lines of the synthetic file.
+    repeat : int
+        Every counter is timed this many times, the fastest run counts.
+
+    Returns
+    -------
+    result : dict
+        Throughput in MB/s for 'substrings' and 'count_regions'.
+
+    '''
+    path = program_path
+    with tempfile.TemporaryDirectory() as temp_path:
+        BED_path = f'{temp_path}/BED.bed'
+        write_bed(BED_path, rows, path)
+        size = os.path.getsize(BED_path) / 1e6
+        result = dict()
+        for name, counter in [('substrings', count_substrings),
+                              ('count_regions',
+                               Output_counter.count_regions)]:
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                counts = list(counter(BED_path))
+                times.append(time.perf_counter() - start)
+            result[name] = size / min(times)
+            print(f'{name:>14}: {min(times):.3f} s  '
+                  f'{result[name]:.1f} MB/s  {counts}')
+    print(f'speedup: {result["count_regions"] / result["substrings"]:.2f}x '
+          f'on {size:.1f} MB')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='bench_counter', description=(
+        'Compares the former substring counter with count_regions.'))
+    parser.add_argument('-r', '--rows', type=int, default=2000000,
+                        help='Number of lines of the synthetic .bed file')
+    parser.add_argument('-n', '--repeat', type=int, default=3,
+                        help='Number of timed runs per counter')
+    args = parser.parse_args()
+    benchmark(args.rows, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/python
+
+import argparse
+import gzip
+import os
+import shutil
+import struct
+import tempfile
+import time
+import zlib
+import vxdetector.decompress as decompress
+from vxdetector.interact_bowtie2 import buildbowtie2, mapbowtie2
+
+program_path = os.path.dirname(os.path.abspath(__file__))
+program_path = f'{os.path.dirname(os.path.dirname(program_path))}/'
+# the reference files are stored in the parent directory of the package
+test_file = (f'{program_path}vxdetector/tests/test_data/test_dir/'
+             '5004_S20_L001_R1_001.fastq.gz')
+block_size = 65280
+# uncompressed bytes of a BGZF block, like bgzip
+
+
+def compress_bgzf(source, destination):
+    r'''Writes a BGZF copy of a read file
+
+    Parameters
+    ----------
+    source : str
+        Filepath to a .fastq or .fastq.gz file.
+    destination : str
+        Filepath the BGZF file is written to.
+
+    '''
+    opener = gzip.open if decompress.is_gzip(source) else open
+    with opener(source, 'rb') as f, open(destination, 'wb') as out:
+        while True:
+            data = f.read(block_size)
+            compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+            deflated = compressor.compress(data) + compressor.flush()
+            out.write(b'\x1f\x8b\x08\x04' + bytes(4) + b'\x00\xff'
+                      + struct.pack('<HBBHH', 6, ord('B'), ord('C'), 2,
+                                    len(deflated) + 25)
+                      + deflated
+                      + struct.pack('<II', zlib.crc32(data), len(data)))
+            if not data:
+                return
+                # the empty block marks the end of the file
+
+
+def consume(chunks):
+    # decompresses the whole file like the aligner would read it
+    size = 0
+    for data in chunks:
+        size += len(data)
+    return size
+
+
+def inline_chunks(fq_file):
+    # decompresses on the reading thread, like bowtie2 does
+    with gzip.open(fq_file, 'rb') as f:
+        while True:
+            data = f.read(decompress.read_size)
+            if not data:
+                return
+            yield data
+
+
+def benchmark(fq_file, threads=4, repeat=3):
+    r'''Times the decompression of a read file
+
+    Parameters
+    ----------
+    fq_file : str
+        Filepath to a .fastq.gz file.
+    threads : int
+        Number of threads decompressing the BGZF copy.
+    repeat : int
+        Number of runs, the fastest is reported.
+
+    Returns
+    -------
+    seconds : dict
+        'inline' : gzip module on the reading thread, like bowtie2.
+        'gzip' : decompress.read_chunks of the gzip file.
+        'bgzf' : decompress.read_chunks of a BGZF copy with threads.
+
+    '''
+    temp_path = tempfile.mkdtemp()
+    try:
+        bgzf_file = f'{temp_path}/reads.fastq.gz'
+        compress_bgzf(fq_file, bgzf_file)
+        runs = {'inline': lambda: consume(inline_chunks(fq_file)),
+                'gzip': lambda: consume(decompress.read_chunks(fq_file)),
+                'bgzf': lambda: consume(decompress.read_chunks(bgzf_file,
+                                                               threads))}
+        seconds = dict()
+        for name, run in runs.items():
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                run()
+                times.append(time.perf_counter() - start)
+            seconds[name] = min(times)
+        return seconds
+    finally:
+        shutil.rmtree(temp_path)
+
+
+def benchmark_mapping(fq_file, threads=4):
+    r'''Times mapbowtie2 with and without the decompression process
+
+    Parameters
+    ----------
+    fq_file : str
+        Filepath to a .fastq.gz file.
+    threads : int
+        Number of threads given to bowtie2.
+
+    Returns
+    -------
+    seconds : dict
+        'bowtie2' : bowtie2 decompresses the file.
+        'offload' : the file is decompressed by decompress.main.
+
+    '''
+    buildbowtie2(program_path, threads)
+    seconds = dict()
+    for name, offload in [('bowtie2', False), ('offload', True)]:
+        temp_path = f'{tempfile.mkdtemp()}/'
+        try:
+            start = time.perf_counter()
+            mapbowtie2(fq_file, '', program_path, temp_path, False, threads,
+                       offload=offload)
+            seconds[name] = time.perf_counter() - start
+        finally:
+            shutil.rmtree(temp_path)
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='bench_decompress', description=(
+        'Times the decompression of .fastq.gz files outside of bowtie2.'))
+    parser.add_argument('fq_file', nargs='?', default=test_file,
+                        help='.fastq.gz file (default: the test data)')
+    parser.add_argument('-t', '--threads', type=int, default=4,
+                        help='Number of threads')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Number of runs')
+    parser.add_argument('--map', action='store_true',
+                        help='Also times the alignment with bowtie2')
+    args = parser.parse_args()
+    seconds = benchmark(args.fq_file, args.threads, args.repeat)
+    for name, value in seconds.items():
+        print(f'{name:>8}: {value * 1000:7.1f} ms')
+    if args.map:
+        for name, value in benchmark_mapping(args.fq_file,
+                                             args.threads).items():
+            print(f'{name:>8}: {value:7.2f} s mapping')
+
+
+if __name__ == '__main__':
+    main()
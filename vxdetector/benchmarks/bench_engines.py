@@ -0,0 +1,85 @@
+#!/usr/bin/python
+
+import argparse
+import os
+import time
+import vxdetector.VXdetector as VXdetector
+import vxdetector.files_manager as files_manager
+import vxdetector.kmer_classifier as kmer_classifier
+from vxdetector.interact_bowtie2 import buildbowtie2
+from vxdetector.Output_counter import agreement
+
+program_path = os.path.dirname(os.path.abspath(__file__))
+program_path = f'{os.path.dirname(os.path.dirname(program_path))}/'
+# the reference files are stored in the parent directory of the package
+test_dir = f'{program_path}vxdetector/tests/test_data/test_dir/'
+# samples of the test data
+
+
+def benchmark(directory, threads=1):
+    r'''Runs both engines on every sample of a directory
+
+    The bowtie2 index and the k-mer index are built before the samples
+    are timed.
+
+    Parameters
+    ----------
+    directory : str
+        Directory containing the .fastq (or .fastq.gz) files.
+    threads : int
+        Number of threads given to bowtie2 and samtools.
+
+    Returns
+    -------
+    report : dict
+        'seconds' : summed seconds of every engine.
+        'speedup' : bowtie2 seconds divided by k-mer seconds.
+        'agreement' : see Output_counter.agreement.
+        'results' : result row of every sample and engine.
+
+    '''
+    path = program_path
+    buildbowtie2(path, threads)
+    kmer_classifier.load_index(path)
+    seconds = {'bowtie2': 0.0, 'kmer': 0.0}
+    results = {'bowtie2': dict(), 'kmer': dict()}
+    for fq_file, read2_file, paired in files_manager.find_samples(directory):
+        name = VXdetector.sample_name(fq_file)
+        for engine in seconds:
+            start = time.perf_counter()
+            results[engine][name] = VXdetector.analyse_sample(
+                fq_file, read2_file, paired, path, threads, engine=engine)
+            seconds[engine] += time.perf_counter() - start
+    return {'seconds': seconds,
+            'speedup': seconds['bowtie2'] / max(seconds['kmer'], 1e-9),
+            'agreement': agreement(results['bowtie2'], results['kmer']),
+            'results': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='bench_engines', description=(
+        'Compares the k-mer engine with the bowtie2 pipeline.'))
+    parser.add_argument('directory', nargs='?', default=test_dir,
+                        help='Directory with the samples '
+                        '(default: the test data)')
+    parser.add_argument('-t', '--threads', type=int, default=1,
+                        help='Number of threads of bowtie2 and samtools')
+    args = parser.parse_args()
+    report = benchmark(args.directory, args.threads)
+    for name, row in report['results']['bowtie2'].items():
+        kmer_row = report['results']['kmer'].get(name) or dict()
+        print(f'{name:>24}: '
+              f'{(row or dict()).get("Sequenced variable region", "-"):>8} '
+              f'{kmer_row.get("Sequenced variable region", "-"):>8}')
+    result = report['agreement']
+    print(f'bowtie2: {report["seconds"]["bowtie2"]:.2f} s  '
+          f'kmer: {report["seconds"]["kmer"]:.2f} s  '
+          f'speedup: {report["speedup"]:.1f}x')
+    print(f'same region in {result["same_region"]:.0%} of '
+          f'{result["samples"]} samples, region columns differ by '
+          f'{result["mean_difference"]:.2f} (max '
+          f'{result["max_difference"]:.2f}) percentage points')
+
+
+if __name__ == '__main__':
+    main()
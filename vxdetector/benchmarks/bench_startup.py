@@ -0,0 +1,87 @@
+#!/usr/bin/python
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+commands = {
+    'import vxdetector': [sys.executable, '-c', 'import vxdetector'],
+    'import vxdetector.api': [sys.executable, '-c',
+                              'import vxdetector.api'],
+    'import vxdetector.VXdetector': [sys.executable, '-c',
+                                     'import vxdetector.VXdetector'],
+    'VXdetector --help': [sys.executable, '-m', 'vxdetector.VXdetector',
+                          '--help'],
+}
+# every command runs in a new interpreter, like a user starting the program
+
+
+def heavy_modules(module):
+    r'''Lists the heavy dependencies an import loads
+
+    Parameters
+    ----------
+    module : str
+        Name of the imported module.
+
+    Returns
+    -------
+    modules : list
+        numpy and pandas if the import loads them.
+
+    '''
+    code = (f'import sys, {module}; '
+            'print(" ".join(name for name in ("numpy", "pandas") '
+            'if name in sys.modules))')
+    output = subprocess.run([sys.executable, '-c', code], check=True,
+                            capture_output=True, text=True).stdout
+    return output.split()
+
+
+def benchmark(repeat):
+    r'''Times the startup of the program
+
+    Parameters
+    ----------
+    repeat : int
+        Number of times every command is run.
+
+    Returns
+    -------
+    seconds : dict
+        Median seconds of every command (see commands).
+
+    '''
+    seconds = dict()
+    for name, cmd in commands.items():
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+            times.append(time.perf_counter() - start)
+        seconds[name] = statistics.median(times)
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='bench_startup', description=(
+        'Times the import of the package and the start of the program.'))
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help='Number of runs of every command')
+    args = parser.parse_args()
+    seconds = benchmark(args.repeat)
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'pass'], check=True)
+    interpreter = time.perf_counter() - start
+    print(f'{"python -c pass":>30}: {interpreter * 1000:6.0f} ms')
+    for name, value in seconds.items():
+        print(f'{name:>30}: {value * 1000:6.0f} ms')
+    for module in ['vxdetector.api', 'vxdetector.VXdetector']:
+        loaded = ', '.join(heavy_modules(module)) or 'neither numpy nor pandas'
+        print(f'{module} loads: {loaded}')
+
+
+if __name__ == '__main__':
+    main()
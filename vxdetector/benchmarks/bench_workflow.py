@@ -0,0 +1,336 @@
+#!/usr/bin/python
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import vxdetector.Output_counter as Output_counter
+import vxdetector.VXdetector as VXdetector
+import vxdetector.benchmarks.synthetic as synthetic
+from vxdetector.profiler import rss_unit
+from vxdetector.interact_bowtie2 import (bowtie2_path, samtools_path,
+                                         bedtools_path, buildbowtie2)
+
+program_path = os.path.dirname(os.path.abspath(__file__))
+program_path = f'{os.path.dirname(os.path.dirname(program_path))}/'
+# the reference files are stored in the parent directory of the package
+baseline_file = f'{os.path.dirname(os.path.abspath(__file__))}/baseline.json'
+stages = ['mapping', 'conversion', 'intersect', 'counting', 'output']
+
+
+def map_reads(fq_file, read2_file, path, temp_path, paired, threads=1):
+    r'''Mapping stage of interact_bowtie2.mapbowtie2
+
+    bowtie2 writes its output to a .sam file instead of a pipe, so
+    the mapping is timed without the conversion.
+
+    '''
+    index_path = f'{path}Indexed_bt2/bowtie2'
+    if paired is True:
+        reads = f'-1 {fq_file} -2 {read2_file}'
+    else:
+        reads = f'-q -U {fq_file}'
+    subprocess.run(f'{bowtie2_path} -p {threads} -x {index_path} {reads} '
+                   f'--fast -S {temp_path}aligned.sam '
+                   f'2> {temp_path}bowtie2.log', shell=True, check=True)
+
+
+def convert(temp_path, paired, threads=1):
+    r'''Conversion stage of interact_bowtie2.mapbowtie2
+
+    Returns
+    -------
+    aligned_path : str
+        Path to the converted .bam (unpaired) or .bed (paired) file.
+
+    '''
+    sam_path = f'{temp_path}aligned.sam'
+    view = f'{samtools_path} view -@ {threads} -b -q 30 -S -F 4'
+    if paired is True:
+        aligned_path = f'{temp_path}paired.bed'
+        cmd = (f'{view} {sam_path} | {bedtools_path} bamtobed -bedpe '
+               f'-i stdin > {aligned_path} 2> {temp_path}bed.log')
+    else:
+        aligned_path = f'{temp_path}unpaired.bam'
+        cmd = f'{view} -o {aligned_path} {sam_path}'
+    subprocess.run(cmd, shell=True, check=True)
+    os.remove(sam_path)
+    return aligned_path
+
+
+def _timed(function, *args):
+    # runs in a fresh process, so the peak memory belongs to this stage
+    start = time.perf_counter()
+    result = function(*args)
+    seconds = time.perf_counter() - start
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return result, seconds, peak * rss_unit
+
+
+def measure(function, *args):
+    r'''Times a stage and records its peak memory
+
+    Parameters
+    ----------
+    function : callable
+        Stage function, has to be defined at module level.
+    args :
+        Arguments of the stage function.
+
+    Returns
+    -------
+    result :
+        Return value of the stage function.
+    seconds : float
+        Wall clock time of the stage.
+    peak_rss : int
+        Peak resident set size in bytes of the stage including the
+        programs it started.
+
+    '''
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(_timed, function, *args).result()
+
+
+def run_samples(path, truth, paired, threads=1, overlap_engine='bedtools'):
+    r'''Runs all stages of the workflow on the synthetic samples
+
+    Parameters
+    ----------
+    path : str
+        The program filepath.
+    truth : dict
+        Expected counts of every sample (see synthetic.simulate).
+    paired : Bool
+        Wether or not the samples are paired.
+    threads : int
+        Number of threads given to bowtie2 and samtools.
+    overlap_engine : str
+        See VXdetector.analyse_sample.
+
+    Returns
+    -------
+    timings : dict
+        Summed seconds and the largest peak memory of every stage.
+    result : dict
+        Result row of every sample.
+
+    '''
+    timings = {stage: {'seconds': 0.0, 'peak_rss': 0} for stage in stages}
+
+    def record(stage, function, *args):
+        value, seconds, peak = measure(function, *args)
+        timings[stage]['seconds'] += seconds
+        timings[stage]['peak_rss'] = max(timings[stage]['peak_rss'], peak)
+        return value
+
+    result = dict()
+    for fq_file in truth:
+        read2_file = fq_file.replace('_R1_', '_R2_')
+        temp_path = f'{tempfile.mkdtemp(prefix="bench_", dir=path)}/'
+        try:
+            record('mapping', map_reads, fq_file, read2_file, path,
+                   temp_path, paired, threads)
+            aligned_path = record('conversion', convert, temp_path, paired,
+                                  threads)
+            regions, no_overlap = record('intersect', VXdetector.find_overlap,
+                                         path, temp_path, aligned_path,
+                                         overlap_engine)
+            result[fq_file] = record('counting', Output_counter.create_row,
+                                     temp_path, paired, regions, no_overlap)
+        finally:
+            shutil.rmtree(temp_path)
+    with tempfile.NamedTemporaryFile(suffix='.csv') as output:
+        record('output', VXdetector.do_output, result, output.name, False)
+    return timings, result
+
+
+def max_error(truth, result):
+    r'''Largest deviation from the ground truth
+
+    Returns
+    -------
+    error : float
+        Largest difference in percentage points between the expected and
+        the measured share of a variable region over all samples
+        (see synthetic.proportions).
+
+    '''
+    error = 0.0
+    for fq_file, counts in truth.items():
+        expected = synthetic.proportions(counts)
+        measured = synthetic.proportions(result[fq_file])
+        error = max(error, max(abs(expected[key] - measured[key])
+                               for key in expected))
+    return error
+
+
+def benchmark(samples, reads, paired, threads=1, overlap_engine='bedtools',
+              read_length=150, regions=None, seed=0):
+    r'''Benchmarks the workflow on synthetic samples
+
+    Parameters
+    ----------
+    samples : int
+        Number of synthetic samples.
+    reads : int
+        Number of reads (pairs) per sample.
+    paired : Bool
+        Wether or not paired samples are created.
+    threads : int
+        Number of threads given to bowtie2 and samtools.
+    overlap_engine : str
+        See VXdetector.analyse_sample.
+    read_length : int
+        Length of the synthetic reads.
+    regions : list or None
+        Variable regions the reads are drawn from.
+    seed : int
+        Seed of the synthetic samples.
+
+    Returns
+    -------
+    report : dict
+        'stages' : throughput (reads per second) and peak memory (bytes)
+                   of every stage.
+        'results' : share of every variable region per sample.
+        'max_error' : largest deviation from the ground truth in
+                      percentage points.
+
+    '''
+    path = program_path
+    buildbowtie2(path, threads)
+    with tempfile.TemporaryDirectory() as out_dir:
+        out_dir = f'{out_dir}/'
+        truth = synthetic.simulate(out_dir, path, samples, reads, paired,
+                                   read_length, regions=regions, seed=seed)
+        timings, result = run_samples(path, truth, paired, threads,
+                                      overlap_engine)
+        report = {'stages': dict(), 'results': dict(),
+                  'max_error': max_error(truth, result)}
+        for stage, timing in timings.items():
+            report['stages'][stage] = {
+                'reads_per_s': samples * reads / max(timing['seconds'],
+                                                     1e-9),
+                'peak_rss': timing['peak_rss']}
+        for fq_file, row in result.items():
+            name = VXdetector.sample_name(fq_file)
+            report['results'][name] = synthetic.proportions(row)
+    return report
+
+
+def compare(report, baseline, tolerance=0.2, precision=0.01):
+    r'''Compares a benchmark with its baseline
+
+    Parameters
+    ----------
+    report : dict
+        Report of benchmark.
+    baseline : dict
+        Stored report of an earlier benchmark.
+    tolerance : float
+        Relative loss of throughput and relative increase of memory
+        that is still accepted.
+    precision : float
+        Accepted change of a result in percentage points.
+
+    Returns
+    -------
+    regressions : list
+        Description of every regression. Empty if there is none.
+
+    '''
+    regressions = []
+    for stage, old in baseline['stages'].items():
+        new = report['stages'].get(stage)
+        if new is None:
+            continue
+        if new['reads_per_s'] < old['reads_per_s'] * (1 - tolerance):
+            regressions.append(f'{stage}: throughput dropped from '
+                               f'{old["reads_per_s"]:.0f} to '
+                               f'{new["reads_per_s"]:.0f} reads/s')
+        if new['peak_rss'] > old['peak_rss'] * (1 + tolerance):
+            regressions.append(f'{stage}: peak memory rose from '
+                               f'{old["peak_rss"] / 1e6:.1f} to '
+                               f'{new["peak_rss"] / 1e6:.1f} MB')
+    for sample, old in baseline['results'].items():
+        new = report['results'].get(sample, dict())
+        for key, value in old.items():
+            if abs(new.get(key, float('nan')) - value) <= precision:
+                continue
+            regressions.append(f'{sample}: {key} changed from {value:.2f} '
+                               f'to {new.get(key, float("nan")):.2f}')
+    if report['max_error'] > baseline['max_error'] + precision:
+        regressions.append(f'deviation from the ground truth rose from '
+                           f'{baseline["max_error"]:.2f} to '
+                           f'{report["max_error"]:.2f} percentage points')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='bench_workflow', description=(
+        'Times every stage of the workflow on synthetic samples and '
+        'compares the results with a stored baseline.'))
+    parser.add_argument('-s', '--samples', type=int, default=4,
+                        help='Number of synthetic samples')
+    parser.add_argument('-n', '--reads', type=int, default=100000,
+                        help='Number of reads (pairs) per sample')
+    parser.add_argument('-p', '--paired', action='store_true',
+                        help='Creates paired samples')
+    parser.add_argument('-t', '--threads', type=int, default=1,
+                        help='Number of threads of bowtie2 and samtools')
+    parser.add_argument('--overlap-engine', dest='overlap_engine',
+                        choices=['bedtools', 'native'], default='bedtools')
+    parser.add_argument('--read-length', dest='read_length', type=int,
+                        default=150, help='Length of the synthetic reads')
+    parser.add_argument('--regions', nargs='+', default=None,
+                        help='Variable regions the reads are drawn from')
+    parser.add_argument('-b', '--baseline', default=baseline_file,
+                        help='JSON file with the stored baselines')
+    parser.add_argument('--save', action='store_true',
+                        help='Stores this run as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Accepted relative loss of throughput and '
+                        'increase of memory (default: 0.2)')
+    args = parser.parse_args()
+    layout = 'paired' if args.paired else 'unpaired'
+    scenario = (f'{layout}-{args.overlap_engine}-{args.samples}x{args.reads}'
+                f'-{args.read_length}bp')
+    report = benchmark(args.samples, args.reads, args.paired, args.threads,
+                       args.overlap_engine, args.read_length, args.regions)
+    for stage, values in report['stages'].items():
+        print(f'{stage:>10}: {values["reads_per_s"]:12.0f} reads/s  '
+              f'{values["peak_rss"] / 1e6:8.1f} MB')
+    print(f'deviation from the ground truth: {report["max_error"]:.2f} '
+          'percentage points')
+    baselines = dict()
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baselines = json.load(f)
+    if args.save is True:
+        baselines[scenario] = report
+        with open(args.baseline, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f'stored baseline "{scenario}"')
+    elif scenario not in baselines:
+        print(f'no baseline stored for "{scenario}"')
+    else:
+        regressions = compare(report, baselines[scenario], args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+        print(f'no regression against "{scenario}"')
+
+
+if __name__ == '__main__':
+    main()
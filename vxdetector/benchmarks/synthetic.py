@@ -0,0 +1,251 @@
+#!/usr/bin/python
+
+import random
+import numpy as np
+import vxdetector.interval_overlap as interval_overlap
+from vxdetector.Output_counter import regions_list
+
+complement = str.maketrans('ACGTNacgtn', 'TGCANtgcan')
+
+
+def read_fasta(fasta_file):
+    r'''FASTA reader
+
+    Parameters
+    ----------
+    fasta_file : str
+        Filepath to a fasta file (e.g. 85_otus.fasta).
+
+    Returns
+    -------
+    sequences : dict
+        Sequence of every entry with the entry name as key.
+
+    '''
+    sequences = dict()
+    name = None
+    with open(fasta_file, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('>'):
+                name = line[1:].split()[0]
+                sequences[name] = []
+            elif name is not None:
+                sequences[name].append(line)
+    return {name: ''.join(lines) for name, lines in sequences.items()}
+
+
+def read_windows(S_ref, regions=None):
+    r'''Reads the variable region windows
+
+    Parameters
+    ----------
+    S_ref : str
+        Filepath to the annoted_ref.bed.
+    regions : list or None
+        Variable regions which are returned. Default are all regions.
+
+    Returns
+    -------
+    windows : list
+        (chrom, start, end, region) tuples of all requested regions.
+
+    '''
+    windows = []
+    with open(S_ref, 'r') as f:
+        for line in f:
+            chrom, start, end, region = line.split()[:4]
+            if regions is None or region in regions:
+                windows.append((chrom, int(start), int(end), region))
+    return windows
+
+
+def simulate_reads(sequences, windows, reads, read_length=150,
+                   fragment_length=None, seed=0):
+    r'''Draws reads from variable region windows
+
+    Every read (pair) is drawn from a randomly chosen window. The read
+    starts at most half a read length in front of the region and ends
+    at most half a read length behind it, like an amplicon read
+    sequenced from a primer next to the region.
+
+    Parameters
+    ----------
+    sequences : dict
+        Reference sequences (see read_fasta).
+    windows : list
+        Windows the reads are drawn from (see read_windows).
+    reads : int
+        Number of reads (pairs).
+    read_length : int
+        Length of every read.
+    fragment_length : int or None
+        Length of the sequenced fragment. If given, reads are paired:
+        the forward read starts at the beginning of the fragment and
+        the backward read is the reverse complement of its end.
+    seed : int
+        Seed of the random number generator. The same seed always
+        yields the same reads.
+
+    Returns
+    -------
+    reads : list
+        (chrom, start, mate1, mate2) tuples. start is the 0-based
+        position of the forward read, mate2 is None for unpaired reads.
+
+    '''
+    span = read_length if fragment_length is None else fragment_length
+    windows = [window for window in windows
+               if len(sequences.get(window[0], '')) >= span]
+    if not windows:
+        raise ValueError('No variable region window is long enough for '
+                         f'fragments of {span} bases')
+    rng = random.Random(seed)
+    simulated = []
+    for _ in range(reads):
+        chrom, start, end, _ = rng.choice(windows)
+        sequence = sequences[chrom]
+        lowest = max(0, start - read_length // 2)
+        highest = min(len(sequence) - span, end - read_length // 2)
+        read_start = rng.randint(lowest, max(lowest, highest))
+        read_start = min(read_start, len(sequence) - span)
+        mate1 = sequence[read_start:read_start + read_length]
+        mate2 = None
+        if fragment_length is not None:
+            fragment_end = read_start + fragment_length
+            mate2 = sequence[fragment_end - read_length:fragment_end]
+            mate2 = mate2.translate(complement)[::-1]
+        simulated.append((chrom, read_start, mate1, mate2))
+    return simulated
+
+
+def write_fastq(fq_file, sequences, sample):
+    r'''Writes reads to a .fastq file
+
+    Parameters
+    ----------
+    fq_file : str
+        Filepath the reads are written to.
+    sequences : list
+        Read sequences.
+    sample : str
+        Name of the sample, used for the read names.
+
+    '''
+    with open(fq_file, 'w') as f:
+        for i, sequence in enumerate(sequences):
+            f.write(f'@{sample}.{i}\n{sequence}\n+\n'
+                    f'{"I" * len(sequence)}\n')
+
+
+def ground_truth(reference, simulated, read_length=150):
+    r'''Expected result of simulated reads
+
+    The reads are classified at their true origin with the same rules
+    as the aligned reads (see interval_overlap.classify). Paired reads
+    are classified by their forward read like the first mate reported
+    by "bedtools bamtobed -bedpe".
+
+    Parameters
+    ----------
+    reference : dict
+        Variable region reference (see interval_overlap.load_reference).
+    simulated : list
+        Reads as returned by simulate_reads.
+    read_length : int
+        Length of every read.
+
+    Returns
+    -------
+    counts : dict
+        Occurences of every variable region and the number of reads
+        (pairs) not aligned to a variable region under the key
+        'Not aligned to a variable region'.
+
+    '''
+    chroms = np.array([read[0] for read in simulated])
+    starts = np.array([read[1] for read in simulated])
+    hits, no_overlap = interval_overlap.classify(reference, chroms, starts,
+                                                 starts + read_length)
+    counts = {region: int(hit)
+              for region, hit in zip(regions_list, hits.sum(axis=0))}
+    counts['Not aligned to a variable region'] = int(no_overlap.sum())
+    return counts
+
+
+def proportions(row):
+    r'''Share of every variable region
+
+    Parameters
+    ----------
+    row : dict
+        Counts (see ground_truth) or a result row of
+        Output_counter.create_row.
+
+    Returns
+    -------
+    shares : dict
+        Share of V1 - V9 and 'Not aligned to a variable region' in
+        percent of their sum, independent of the unaligned reads.
+
+    '''
+    keys = regions_list + ['Not aligned to a variable region']
+    total = sum(row[key] for key in keys)
+    if total == 0:
+        return dict.fromkeys(keys, 0.0)
+    return {key: row[key] / total * 100 for key in keys}
+
+
+def simulate(out_dir, path, samples=1, reads=10000, paired=False,
+             read_length=150, fragment_length=None, regions=None, seed=0):
+    r'''Creates synthetic samples with known variable regions
+
+    Parameters
+    ----------
+    out_dir : str
+        Directory the .fastq files are written to.
+    path : str
+        The program filepath. Reads are drawn from the 85_otus.fasta
+        at the windows of the annoted_ref.bed.
+    samples : int
+        Number of samples.
+    reads : int
+        Number of reads (pairs) per sample.
+    paired : Bool
+        Wether or not backward reads are written as well.
+    read_length : int
+        Length of every read.
+    fragment_length : int or None
+        Length of the fragment of paired reads.
+        Default is twice the read length.
+    regions : list or None
+        Variable regions the reads are drawn from. Default are all regions.
+    seed : int
+        Seed of the first sample, every sample uses the next seed.
+
+    Returns
+    -------
+    truth : dict
+        Expected counts (see ground_truth) of every sample with the path
+        of its forward read file as key.
+
+    '''
+    sequences = read_fasta(f'{path}Indexed_bt2/85_otus.fasta')
+    windows = read_windows(f'{path}Indexed_bt2/annoted_ref.bed', regions)
+    reference = interval_overlap.load_reference(path)
+    if paired is True and fragment_length is None:
+        fragment_length = 2 * read_length
+    elif paired is False:
+        fragment_length = None
+    truth = dict()
+    for i in range(samples):
+        sample = f'synthetic{i}_S{i + 1}_L001'
+        simulated = simulate_reads(sequences, windows, reads, read_length,
+                                   fragment_length, seed + i)
+        fq_file = f'{out_dir}{sample}_R1_001.fastq'
+        write_fastq(fq_file, [read[2] for read in simulated], sample)
+        if paired is True:
+            write_fastq(f'{out_dir}{sample}_R2_001.fastq',
+                        [read[3] for read in simulated], sample)
+        truth[fq_file] = ground_truth(reference, simulated, read_length)
+    return truth
@@ -0,0 +1,139 @@
+#!/usr/bin/python
+
+import re
+
+count = r'^(\d+) \([\d.]+%\) '
+patterns = [(re.compile(r'^(\d+) reads; of these:$'), 'reads'),
+            (re.compile(count + 'were paired; of these:$'), 'paired'),
+            (re.compile(count + 'were unpaired; of these:$'), 'unpaired'),
+            (re.compile(count + 'aligned concordantly 0 times$'),
+             'concordant_0'),
+            (re.compile(count + 'aligned concordantly exactly 1 time$'),
+             'concordant_1'),
+            (re.compile(count + 'aligned concordantly >1 times$'),
+             'concordant_multi'),
+            (re.compile(count + 'aligned discordantly 1 time$'),
+             'discordant'),
+            (re.compile(r'^(\d+) mates make up the pairs; of these:$'),
+             'mates'),
+            (re.compile(count + 'aligned 0 times$'), 'aligned_0'),
+            (re.compile(count + 'aligned exactly 1 time$'), 'aligned_1'),
+            (re.compile(count + 'aligned >1 times$'), 'aligned_multi'),
+            (re.compile(r'^([\d.]+)% overall alignment rate$'),
+             'overall_rate')]
+# lines of the alignment summary bowtie2 writes to stderr
+fields = {'reads': int, 'paired': int, 'unpaired': int,
+          'concordant_0': int, 'concordant_1': int, 'concordant_multi': int,
+          'discordant': int, 'mates': int, 'aligned_0': int, 'aligned_1': int,
+          'aligned_multi': int, 'mates_aligned_0': int,
+          'mates_aligned_1': int, 'mates_aligned_multi': int,
+          'overall_rate': float, 'not_paired': int}
+# every field of the record and its type, 'not_paired' is not written by
+# bowtie2 but counted from the warnings of bedtools bamtobed
+paired_columns = ['Concordant 0 times [%]', 'Concordant exactly 1 time [%]',
+                  'Concordant >1 times [%]', 'Discordant [%]',
+                  'Mate alignment rate [%]']
+unpaired_columns = ['Aligned 0 times [%]', 'Aligned exactly 1 time [%]',
+                    'Aligned >1 times [%]']
+columns = paired_columns + unpaired_columns
+
+
+def parse_line(stats, line):
+    r'''Parses a line of the bowtie2 stderr output
+
+    Lines which are not part of the alignment summary (e.g. warnings)
+    are ignored, so the lines can be passed on while bowtie2 is running.
+
+    Parameters
+    ----------
+    stats : dict
+        Record the parsed field is added to (see fields). The counts of
+        the mates of pairs which did not align are prefixed with 'mates_'.
+    line : str
+        Line of the bowtie2 stderr output.
+
+    '''
+    line = line.strip()
+    for pattern, field in patterns:
+        match = pattern.match(line)
+        if match is None:
+            continue
+        if field.startswith('aligned_') and 'mates' in stats:
+            field = f'mates_{field}'
+        stats[field] = fields[field](match.group(1))
+        return
+
+
+def parse(lines):
+    r'''Parses the bowtie2 stderr output
+
+    Parameters
+    ----------
+    lines : iterable
+        Lines of the bowtie2 stderr output.
+
+    Returns
+    -------
+    stats : dict
+        Parsed alignment summary (see parse_line).
+
+    '''
+    stats = dict()
+    for line in lines:
+        parse_line(stats, line)
+    return stats
+
+
+def complete(stats):
+    r'''Checks if bowtie2 wrote a complete summary
+
+    Parameters
+    ----------
+    stats : dict
+        Parsed alignment summary.
+
+    Returns
+    -------
+    complete : Bool
+        False if bowtie2 ended with an error before the summary.
+
+    '''
+    return 'reads' in stats and 'overall_rate' in stats
+
+
+def create_row(stats):
+    r'''Output columns of the alignment summary
+
+    Parameters
+    ----------
+    stats : dict
+        Parsed alignment summary.
+
+    Returns
+    -------
+    new_row : dict
+        'Number of Reads', 'Unaligned Reads [%]' and the percentages of
+        the reads (pairs) in paired_columns or unpaired_columns.
+
+    '''
+    new_row = dict()
+    new_row['Number of Reads'] = stats['reads']
+    new_row['Unaligned Reads [%]'] = 100 - stats['overall_rate']
+    total = stats['reads'] or 1
+    if 'paired' in stats:
+        mates = stats.get('mates', 0)
+        mates_aligned = stats.get('mates_aligned_1', 0) \
+            + stats.get('mates_aligned_multi', 0)
+        values = [stats.get('concordant_0', 0), stats.get('concordant_1', 0),
+                  stats.get('concordant_multi', 0),
+                  stats.get('discordant', 0)]
+        for column, value in zip(paired_columns, values):
+            new_row[column] = value / total * 100
+        new_row['Mate alignment rate [%]'] = \
+            mates_aligned / mates * 100 if mates else 0.0
+    else:
+        values = [stats.get('aligned_0', 0), stats.get('aligned_1', 0),
+                  stats.get('aligned_multi', 0)]
+        for column, value in zip(unpaired_columns, values):
+            new_row[column] = value / total * 100
+    return new_row
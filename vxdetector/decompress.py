@@ -0,0 +1,487 @@
+#!/usr/bin/python
+
+import argparse
+import collections
+import itertools
+import os
+import queue
+import struct
+import sys
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+read_size = 1024 * 1024
+# compressed bytes read at once
+batch_blocks = 64
+# BGZF blocks decompressed by a worker at once (up to 4 MB)
+
+
+def is_gzip(filename):
+    r'''Checks the magic bytes of a file
+
+    Parameters
+    ----------
+    filename : str
+        Filepath to the file.
+
+    Returns
+    -------
+    gzip : Bool
+        Wether or not the file is gzip compressed. False if the file
+        cannot be read, the error is left to the program reading it.
+
+    '''
+    try:
+        with open(filename, 'rb') as f:
+            return f.read(2) == b'\x1f\x8b'
+    except OSError:
+        return False
+
+
+def _bgzf_header(header):
+    # returns the size of the extra field if the header belongs to a
+    # BGZF block, otherwise None
+    if len(header) < 12 or header[:4] != b'\x1f\x8b\x08\x04':
+        return None
+    xlen, = struct.unpack_from('<H', header, 10)
+    return xlen
+
+
+def is_bgzf(filename):
+    r'''Checks if a file is BGZF compressed
+
+    BGZF files (e.g. written by bgzip) consist of independent gzip
+    members of at most 64 KB, whose sizes are stored in the header.
+    They can be decompressed in parallel.
+
+    Parameters
+    ----------
+    filename : str
+        Filepath to the file.
+
+    Returns
+    -------
+    bgzf : Bool
+        Wether or not the first block is a BGZF block.
+
+    '''
+    try:
+        with open(filename, 'rb') as f:
+            header = f.read(12)
+            xlen = _bgzf_header(header)
+            if xlen is None:
+                return False
+            return _block_size(f.read(xlen)) is not None
+    except OSError:
+        return False
+
+
+def _block_size(extra):
+    # finds the BC subfield containing the block size - 1
+    i = 0
+    while i + 4 <= len(extra):
+        length, = struct.unpack_from('<H', extra, i + 2)
+        if extra[i:i + 2] == b'BC' and length == 2:
+            return struct.unpack_from('<H', extra, i + 4)[0] + 1
+        i += 4 + length
+    return None
+
+
+def read_blocks(f):
+    r'''Splits a BGZF file into its blocks
+
+    Parameters
+    ----------
+    f : file object
+        BGZF file opened in binary mode.
+
+    Yields
+    ------
+    block : tuple
+        (deflate data, crc32, size) of every block.
+
+    Raises
+    ------
+    ValueError
+        If a block is no BGZF block or the file is truncated.
+
+    '''
+    while True:
+        header = f.read(12)
+        if not header:
+            return
+        xlen = _bgzf_header(header)
+        if xlen is None:
+            raise ValueError('The file is not completely BGZF compressed')
+        extra = f.read(xlen)
+        size = _block_size(extra)
+        if size is None:
+            raise ValueError('The file is not completely BGZF compressed')
+        rest = f.read(size - 12 - xlen)
+        if len(rest) != size - 12 - xlen or len(rest) < 8:
+            raise EOFError('Compressed file ended before the '
+                           'end-of-stream marker was reached')
+        crc, isize = struct.unpack('<II', rest[-8:])
+        yield rest[:-8], crc, isize
+
+
+def inflate_blocks(blocks):
+    r'''Decompresses BGZF blocks
+
+    zlib releases the GIL, so several batches are decompressed by
+    threads at the same time.
+
+    Parameters
+    ----------
+    blocks : list
+        Blocks as returned by read_blocks.
+
+    Returns
+    -------
+    data : bytes
+        The decompressed blocks.
+
+    Raises
+    ------
+    ValueError
+        If the checksum or size of a block is wrong.
+
+    '''
+    data = []
+    for deflated, crc, isize in blocks:
+        block = zlib.decompress(deflated, -15)
+        if len(block) != isize or zlib.crc32(block) != crc:
+            raise ValueError('CRC check failed for a BGZF block')
+        data.append(block)
+    return b''.join(data)
+
+
+def bgzf_chunks(filename, workers=1):
+    r'''Decompresses a BGZF file with several threads
+
+    Parameters
+    ----------
+    filename : str
+        Filepath to the BGZF file.
+    workers : int
+        Number of threads decompressing blocks.
+
+    Yields
+    ------
+    data : bytes
+        The decompressed data in the order of the file.
+
+    '''
+    with open(filename, 'rb') as f, \
+         ThreadPoolExecutor(max_workers=workers) as executor:
+        blocks = read_blocks(f)
+        pending = collections.deque()
+        while True:
+            batch = list(itertools.islice(blocks, batch_blocks))
+            if batch:
+                pending.append(executor.submit(inflate_blocks, batch))
+            if pending and (not batch or len(pending) > 2 * workers):
+                yield pending.popleft().result()
+                # keeps every worker busy without reading the whole file
+            elif not batch:
+                return
+
+
+def gzip_chunks(filename):
+    r'''Decompresses a gzip file
+
+    Files consisting of several gzip members (e.g. concatenated
+    files) are decompressed completely.
+
+    Parameters
+    ----------
+    filename : str
+        Filepath to the gzip file.
+
+    Yields
+    ------
+    data : bytes
+        The decompressed data.
+
+    Raises
+    ------
+    EOFError
+        If the file is truncated.
+
+    '''
+    decompressor = zlib.decompressobj(31)
+    started = False
+    with open(filename, 'rb') as f:
+        while True:
+            data = f.read(read_size)
+            if not data:
+                break
+            while data:
+                started = True
+                yield decompressor.decompress(data)
+                data = b''
+                if decompressor.eof:
+                    data = decompressor.unused_data.lstrip(b'\0')
+                    decompressor = zlib.decompressobj(31)
+                    started = False
+                    # the next member starts after the end of this one,
+                    # zero padding at the end is ignored like by gzip
+    if started is True:
+        raise EOFError('Compressed file ended before the '
+                       'end-of-stream marker was reached')
+
+
+def plain_chunks(filename):
+    r'''Reads an uncompressed file in chunks of read_size bytes'''
+    with open(filename, 'rb') as f:
+        while True:
+            data = f.read(read_size)
+            if not data:
+                return
+            yield data
+
+
+def read_chunks(filename, workers=1):
+    r'''Decompresses a read file outside of the aligner
+
+    Parameters
+    ----------
+    filename : str
+        Filepath to a .fastq or .fastq.gz file.
+    workers : int
+        Number of threads decompressing a BGZF file in parallel. Other
+        gzip files are decompressed by a single background thread.
+
+    Returns
+    -------
+    chunks : generator
+        Yields the uncompressed data.
+
+    '''
+    if is_bgzf(filename):
+        return bgzf_chunks(filename, workers)
+    if is_gzip(filename):
+        return prefetch(gzip_chunks(filename))
+    return plain_chunks(filename)
+
+
+def prefetch(chunks, depth=4):
+    r'''Produces chunks in a background thread
+
+    The chunks are decompressed while the previous ones are written.
+
+    Parameters
+    ----------
+    chunks : iterable
+        Yields the chunks.
+    depth : int
+        Number of chunks produced ahead.
+
+    Yields
+    ------
+    data : bytes
+        The chunks in order. An Exception of the producer is raised
+        when its chunk would have been yielded.
+
+    '''
+    buffer = queue.Queue(depth)
+    end = object()
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for chunk in chunks:
+                if stop.is_set():
+                    return
+                buffer.put(chunk)
+            buffer.put(end)
+        except BaseException as e:
+            buffer.put(e)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            chunk = buffer.get()
+            if chunk is end:
+                return
+            if isinstance(chunk, BaseException):
+                raise chunk
+            yield chunk
+    finally:
+        stop.set()
+
+
+def records(chunks):
+    r'''Splits FASTQ data into records
+
+    Parameters
+    ----------
+    chunks : iterable
+        Yields the uncompressed data.
+
+    Yields
+    ------
+    record : bytes
+        Four lines of a FASTQ record including the newlines.
+
+    Raises
+    ------
+    ValueError
+        If the data does not look like FASTQ.
+
+    '''
+    rest = b''
+    for chunk in chunks:
+        lines = (rest + chunk).split(b'\n')
+        complete = (len(lines) - 1) // 4 * 4
+        for i in range(0, complete, 4):
+            if not lines[i].startswith(b'@'):
+                raise ValueError('This file does not look like a fastq file')
+            yield b'\n'.join(lines[i:i + 4]) + b'\n'
+        rest = b'\n'.join(lines[complete:])
+    lines = rest.rstrip(b'\n').split(b'\n') if rest.strip() else []
+    if len(lines) == 4 and lines[0].startswith(b'@'):
+        yield b'\n'.join(lines) + b'\n'
+        # the last record has no newline
+    elif lines:
+        raise ValueError('This file does not look like a fastq file')
+
+
+def interleave(chunks1, chunks2):
+    r'''Interleaves the records of paired read files
+
+    bowtie2 reads both mates from a single stream with --interleaved.
+
+    Parameters
+    ----------
+    chunks1, chunks2 : iterable
+        Uncompressed data of the forward and the reverse reads.
+
+    Yields
+    ------
+    data : bytes
+        Alternating records of both files in chunks of about
+        read_size bytes.
+
+    Raises
+    ------
+    ValueError
+        If the files have a different number of reads.
+
+    '''
+    data = []
+    size = 0
+    for mate1, mate2 in itertools.zip_longest(records(chunks1),
+                                              records(chunks2)):
+        if mate1 is None or mate2 is None:
+            raise ValueError('The read files have a different '
+                             'number of reads')
+        data += [mate1, mate2]
+        size += len(mate1) + len(mate2)
+        if size >= read_size:
+            yield b''.join(data)
+            data = []
+            size = 0
+    yield b''.join(data)
+
+
+def decompress_threads(threads):
+    r'''Number of decompression threads of a sample
+
+    bowtie2 keeps its threads, decompressing BGZF is about four times
+    faster than aligning, so a quarter of the threads are added.
+
+    '''
+    return max(1, threads // 4)
+
+
+def command(fasta_file, read2_file, paired, threads=1, offload=None):
+    r'''Command decompressing the reads for bowtie2
+
+    bowtie2 decompresses .gz files on its single input thread, which
+    limits the speed of the alignment if it uses several threads. The
+    reads are decompressed by a separate process instead and written to
+    the stdin of bowtie2, paired reads are interleaved.
+
+    Parameters
+    ----------
+    fasta_file : str
+        Path to a .fastq file (or .fastq.gz) containing the (forward) reads.
+    read2_file : str
+        Path to a .fastq file (or .fastq.gz) containing backwards reads.
+        Is disregarded if paired = False.
+    paired : Bool
+        Wether or not the reads are paired.
+    threads : int
+        Number of threads given to bowtie2.
+    offload : Bool or None
+        Forces (True) or disables (False) the decompression process.
+        None uses it if a read file is gzip compressed and bowtie2
+        uses more than one thread.
+
+    Returns
+    -------
+    command : list or None
+        Arguments of the decompression process. None if bowtie2 reads
+        the files itself.
+    reads : list
+        bowtie2 arguments of the reads.
+
+    '''
+    files = [fasta_file, read2_file] if paired is True else [fasta_file]
+    if offload is None:
+        offload = threads > 1 and any(is_gzip(file) for file in files)
+    if offload is False:
+        if paired is True:
+            return None, ['-1', fasta_file, '-2', read2_file]
+        return None, ['-q', '-U', fasta_file]
+    cmd = [sys.executable, os.path.abspath(__file__),
+           '-t', str(decompress_threads(threads))] + files
+    # the module only needs the standard library, so it runs as a script
+    # wherever the package is installed
+    if paired is True:
+        return cmd, ['--interleaved', '-']
+    return cmd, ['-q', '-U', '-']
+
+
+def main():
+    r'''Writes uncompressed reads to stdout
+
+    Iput otions
+        files :
+            One read file, or the forward and the reverse read file which
+            are interleaved
+        -t, --threads :
+            Number of threads decompressing BGZF files
+
+    '''
+    parser = argparse.ArgumentParser(prog='vxdetector.decompress',
+                                     description=(
+                                         'Decompresses read files for '
+                                         'bowtie2.'))
+    parser.add_argument('files', nargs='+',
+                        help='Read file or forward and reverse read file')
+    parser.add_argument('-t', '--threads', type=int, default=1,
+                        help='Number of threads decompressing BGZF files')
+    args = parser.parse_args()
+    if len(args.files) > 2:
+        parser.error('at most two read files can be given')
+    sources = [read_chunks(file, args.threads) for file in args.files]
+    output = sources[0] if len(sources) == 1 else interleave(*sources)
+    try:
+        for data in output:
+            sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
+    except BrokenPipeError:
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+        # the aligner stopped reading
+    except (ValueError, EOFError, OSError, zlib.error) as e:
+        print(f'vxdetector.decompress: {e}', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
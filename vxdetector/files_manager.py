@@ -1,5 +1,6 @@
 #!/usr/bin/python
 
+import hashlib
 import os
 import tempfile
 import shutil
@@ -34,7 +35,28 @@ def tmp_dir(path, temp_path):
         shutil.rmtree(temp_path)
 
 
-def get_lib(program_path=None):
+def checksum(filename):
+    r'''Calculates the sha256 checksum of a file
+
+    Parameters
+    ----------
+    filename : str
+        Filepath to the file.
+
+    Returns
+    -------
+    checksum : str
+        Hexadecimal sha256 digest of the file content.
+
+    '''
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_lib(program_path=None, output=True):
     r'''Checks necessary files
 
     This function checks if all necessery files are where they should be.
@@ -48,6 +70,10 @@ def get_lib(program_path=None):
     program_path : None or str
         Enables the user to manually call the function on a specific path.
         Mainly used for testing.
+    output : Bool
+        Wether or not the standard output folder is created. Callers
+        which do not write output files (see api.detect) leave the
+        program directory untouched.
 
     Returns
     -------
@@ -60,7 +86,7 @@ def get_lib(program_path=None):
         program_path = f"{os.path.dirname(program_path)}/"
     # finds the parent directory of the folder in which the
     # program is saved
-    if os.path.exists(f'{program_path}Output/'):
+    if output is False or os.path.exists(f'{program_path}Output/'):
         pass
     else:
         os.mkdir(f'{program_path}Output/')
@@ -87,3 +113,58 @@ def get_lib(program_path=None):
                                 'directory is missing.')
 
     return program_path
+
+
+def find_samples(directory):
+    r'''Finds all samples in a directory and its subdirectories
+
+    The directory tree is walked once with os.scandir. Forward and
+    reverse read files are paired from the listing of their directory,
+    so no file is looked up again. The samples of a directory are
+    yielded before its subdirectories are walked, so the analysis can
+    start while the rest of the tree is still listed.
+    Hidden files and directories are skipped like by glob.
+
+    Parameters
+    ----------
+    directory : str
+        Path to the directory containing the .fastq (or .fastq.gz) files.
+
+    Yields
+    ------
+    sample : tuple
+        (fq_file, read2_file, paired) of every sample. read2_file is
+        the path the reverse read file would have, paired signifies
+        wether or not it exists.
+
+    '''
+    pending = [directory]
+    while pending:
+        current = pending.pop()
+        files = dict()
+        subdirectories = []
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+                    try:
+                        if entry.is_dir():
+                            subdirectories.append(entry.path)
+                        elif '.fastq' in entry.name:
+                            files[entry.name] = entry.path
+                    except OSError:
+                        continue
+                        # e.g. a broken symbolic link
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            continue
+            # directories which vanished or cannot be read are skipped
+        for name in sorted(files):
+            if '_R2_' in name:
+                continue
+                # reverse reads belong to the sample of their forward reads
+            read2_name = name.replace('_R1_', '_R2_')
+            paired = '_R1_' in name and read2_name in files
+            yield (files[name], os.path.join(current, read2_name), paired)
+        pending.extend(sorted(subdirectories, reverse=True))
+        # subdirectories are walked in sorted order
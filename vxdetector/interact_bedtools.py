@@ -1,15 +1,14 @@
 #!/usr/bin/python
 
-import os
-import shutil
+import asyncio
+from functools import partial
+import vxdetector.pipeline as pipeline
+import vxdetector.profiler as profiler
+from vxdetector.interact_bowtie2 import tool_path
+from vxdetector.Output_counter import regions_list
 
-bedtools_path = shutil.which('bedtools')
-if bedtools_path is None:
-    bedtools_path = '$CONDA/bin/bedtools'
-# finds where bedtools is installed
 
-
-def no_overlap(path, temp_path, aligned_path):
+def no_overlap(path, temp_path, aligned_path, timeout=None):
     r'''Creates a no overlap file
 
     This function creates a file containing all reads that
@@ -30,19 +29,66 @@ def no_overlap(path, temp_path, aligned_path):
         Filepath of the converted Bowtie2 output file.
         This can either be a .bam or .bed file containing unpaired and
         paired reads respectivly.
+    timeout : float or None
+        Seconds after which bedtools is killed.
+
+    '''
+    with profiler.stage('no_overlap'):
+        asyncio.run(intersect_no_overlap(path, temp_path, aligned_path,
+                                         timeout))
+
+
+async def intersect_no_overlap(path, temp_path, aligned_path, timeout=None):
+    r'''Creates a no overlap file without blocking the event loop
+
+    See no_overlap.
 
     '''
     S_ref = f'{path}Indexed_bt2/annoted_ref.bed'
     noOver_filepath = f'{temp_path}noOver.bed'
-    os.system(f'{bedtools_path} intersect -v -f 0.5 -a \
-                {aligned_path} -b {S_ref} -bed > {noOver_filepath}')
+    await pipeline.run([[tool_path('bedtools'), 'intersect',
+                         '-v', '-f', '0.5', '-a', aligned_path, '-b', S_ref,
+                         '-bed']], stdout=noOver_filepath, timeout=timeout)
+
+
+async def intersect_overlap(path, temp_path, aligned_path, timeout=None):
+    r'''Creates the intersect file without blocking the event loop
+
+    See overlap.
+
+    '''
+    S_ref = f'{path}Indexed_bt2/annoted_ref.bed'
+    # reference "genome" Created by using a aligned greengenes databank and
+    # deleting all "-" while keeping track where the variable Regions are
+    BED_filepath = f'{temp_path}BED.bed'
+    await pipeline.run([[tool_path('bedtools'), 'intersect',
+                         '-f', '0.5', '-a', S_ref, '-b', aligned_path]],
+                       stdout=BED_filepath, timeout=timeout)
+    # Intersects the aligned bowtie2 Output file with the reference
+
 
+async def intersect(path, temp_path, aligned_path, timeout=None):
+    r'''Creates the overlap and the no overlap file at the same time
 
-def overlap(path, temp_path, aligned_path):
+    Both bedtools intersect calls only read the aligned file, so they
+    run concurrently. If one fails the other one is stopped.
+    See overlap.
+
+    '''
+    with profiler.stage('overlap'):
+        await pipeline.gather([
+            partial(intersect_overlap, path, temp_path, aligned_path,
+                    timeout),
+            partial(intersect_no_overlap, path, temp_path, aligned_path,
+                    timeout)])
+
+
+def overlap(path, temp_path, aligned_path, timeout=None):
     r'''Creates an overlap file
 
     This function creates a file containing all reads that
-    do overlap with a variable region.
+    do overlap with a variable region. The no overlap file
+    (see no_overlap) is created at the same time.
 
     Parameters
     ----------
@@ -56,13 +102,132 @@ def overlap(path, temp_path, aligned_path):
         Filepath of the converted Bowtie2 output file.
         This can either be a .bam or .bed file containing unpaired and
         paired reads respectivly.
+    timeout : float or None
+        Seconds after which bedtools is killed.
+
+    '''
+    asyncio.run(intersect(path, temp_path, aligned_path, timeout))
+
+
+def _length(start, end):
+    # bedtools treats zero length intervals as if they were
+    # one base longer on both sides (see interval_overlap.classify)
+    return (start - 1, end + 1) if start == end else (start, end)
+
+
+def count_wao(counts, line):
+    r'''Classifies a line of "bedtools intersect -wao"
+
+    Every aligned read (-a) is followed by one line per variable region
+    (-b) it intersects, or a single line without a region. The rules of
+    "bedtools intersect -f 0.5" are applied to every pair: the region is
+    counted if the read covers at least 50% of it, the read overlaps no
+    variable region if no region covers at least 50% of the read.
+
+    Parameters
+    ----------
+    counts : dict
+        Counts created by new_counts, updated in place.
+    line : str
+        Line of the -wao output.
+
+    '''
+    read, chrom, start, end, name, _ = line.rstrip('\n').rsplit('\t', 5)
+    if read != counts['read'] or (chrom, start, end) in counts['seen'] \
+       or start == '-1':
+        finish_read(counts)
+        counts['read'] = read
+        # a new read, identical reads are split by their repeated regions
+    if start == '-1':
+        return
+        # the read intersects no region
+    counts['seen'].add((chrom, start, end))
+    read_start, read_end = _length(*map(int, read.split('\t', 3)[1:3]))
+    ref_start, ref_end = _length(int(start), int(end))
+    overlap = min(read_end, ref_end) - max(read_start, ref_start)
+    if overlap <= 0:
+        return
+    if 2 * overlap >= ref_end - ref_start and name in counts['regions']:
+        counts['regions'][name] += 1
+    if 2 * overlap >= read_end - read_start:
+        counts['covered'] = True
+
+
+def finish_read(counts):
+    r'''Counts the previous read of count_wao
+
+    Parameters
+    ----------
+    counts : dict
+        Counts created by new_counts, updated in place.
+
+    '''
+    if counts['read'] is not None and counts['covered'] is False:
+        counts['no_overlap'] += 1
+    counts['read'] = None
+    counts['seen'] = set()
+    counts['covered'] = False
+
+
+def new_counts():
+    r'''Creates the counts of count_wao
+
+    Returns
+    -------
+    counts : dict
+        'regions' : occurences of every variable region.
+        'no_overlap' : number of reads which do not overlap with any
+            variable region.
+        'read', 'seen', 'covered' : the read which is classified.
+
+    '''
+    return {'regions': dict.fromkeys(regions_list, 0), 'no_overlap': 0,
+            'read': None, 'seen': set(), 'covered': False}
+
+
+async def intersect_counts(path, aligned_path, timeout=None):
+    r'''Counts the overlap and the no overlap in one pass
+
+    A single "bedtools intersect -wao" reads the aligned file once and
+    its output is classified while bedtools is running (see count_wao),
+    no intersect file is written.
+
+    Parameters
+    ----------
+    path : str
+        Program path and the directory where all it needs to
+        look for the annoted_ref.bed file.
+    aligned_path : str
+        Filepath of the converted Bowtie2 output file.
+        This can either be a .bam or .bed file containing unpaired and
+        paired reads respectivly.
+    timeout : float or None
+        Seconds after which bedtools is killed.
+
+    Returns
+    -------
+    regions : dict
+        Occurences of every variable region.
+        keys: ['V1', 'V2', 'V3', 'V4', 'V5', 'V6', 'V7', 'V8', 'V9']
+    no_overlap : int
+        Number of reads which do not overlap with any variable region.
 
     '''
     S_ref = f'{path}Indexed_bt2/annoted_ref.bed'
-    # reference "genome" Created by using a aligned greengenes databank and
-    # deleting all "-" while keeping track where the variable Regions are
-    BED_filepath = f'{temp_path}BED.bed'
-    os.system(f'{bedtools_path} intersect -f 0.5 -a {S_ref} -b \
-                {aligned_path} > {BED_filepath}')
-    # Intersects the aligned bowtie2 Output file with the reference
-    no_overlap(path, temp_path, aligned_path)
+    counts = new_counts()
+    with profiler.stage('overlap'):
+        await pipeline.run([[tool_path('bedtools'), 'intersect', '-wao',
+                             '-a', aligned_path, '-b', S_ref, '-bed']],
+                           stdout=partial(count_wao, counts),
+                           timeout=timeout)
+    finish_read(counts)
+    return counts['regions'], counts['no_overlap']
+
+
+def overlap_counts(path, aligned_path, timeout=None):
+    r'''Counts the overlap and the no overlap with bedtools
+
+    See intersect_counts.
+
+    '''
+    return asyncio.run(intersect_counts(path, aligned_path, timeout))
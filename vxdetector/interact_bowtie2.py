@@ -1,47 +1,165 @@
 #!/usr/bin/python
 
+import asyncio
+import json
 import os
 import shutil
+import subprocess
+import tempfile
+import vxdetector.pipeline as pipeline
+import vxdetector.bowtie2_stats as bowtie2_stats
+import vxdetector.decompress as decompress
+import vxdetector.scheduler as scheduler
+from vxdetector.files_manager import checksum
 
-bowtie2_path = shutil.which('bowtie2')
-if bowtie2_path is None:
-    bowtie2_path = '$CONDA/bin/bowtie2'
-samtools_path = shutil.which('samtools')
-if samtools_path is None:
-    samtools_path = '$CONDA/bin/samtools'
-bedtools_path = shutil.which('bedtools')
-if bedtools_path is None:
-    bedtools_path = '$CONDA/bin/bedtools'
-# finds where bowtie2, samtools and bedtools
-# are installed
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    # file locks are not available on Windows, concurrent builds
+    # are not guarded there
 
+min_mapq = 30
+# reads with a lower mapping-quality are discarded ("samtools view -q 30")
+tools = dict()
+# where bowtie2, samtools and bedtools are installed, they are only
+# searched when they are needed so importing stays fast
 
-def buildbowtie2(path):
+
+def tool_path(name):
+    r'''Finds where a program is installed
+
+    Parameters
+    ----------
+    name : str
+        Name of the program, e.g. 'bowtie2'.
+
+    Returns
+    -------
+    tool : str
+        Path of the program on the PATH or in $CONDA/bin/.
+
+    '''
+    if name not in tools:
+        tools[name] = shutil.which(name) or f'$CONDA/bin/{name}'
+    return os.path.expandvars(tools[name])
+
+
+def __getattr__(name):
+    # bowtie2_path, samtools_path and bedtools_path are looked up on
+    # first access
+    if name in ['bowtie2_path', 'samtools_path', 'bedtools_path']:
+        return tool_path(name[:-len('_path')])
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def index_ready(path):
+    r'''Checks if the bowtie2 index is complete
+
+    The fingerprint file written after a build lists every part of the
+    index with its size and the checksum of the 85_otus.fasta it was
+    built from.
+
+    Parameters
+    ----------
+    path : str
+        The program filepath. The directory where it needs to look
+        for the reference genome and the index files.
+
+    Returns
+    -------
+    ready : Bool
+        False if a part is missing or was not written completely or the
+        85_otus.fasta changed since the build.
+
+    '''
+    try:
+        with open(f'{path}Indexed_bt2/bowtie2.fingerprint', 'r') as f:
+            fingerprint = json.load(f)
+        if fingerprint['source'] != checksum(
+                f'{path}Indexed_bt2/85_otus.fasta'):
+            return False
+        for part, size in fingerprint['parts'].items():
+            if os.path.getsize(f'{path}Indexed_bt2/{part}') != size:
+                return False
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return False
+        # no fingerprint, a damaged one or a missing part
+    return len(fingerprint['parts']) > 0
+
+
+def buildbowtie2(path, threads=None, timeout=None):
     r'''Builds bowtie2 index
 
     This function builds an index for bowtie2 it is the equivalent
-    of building it manually with the "" command.
+    of building it manually with the "bowtie2-build" command.
 
     Parameters
     ----------
     path : str
         The program filepath. The directory where it needs to look
         for the reference genome and where the index should be saved.
+    threads : int or None
+        Number of threads bowtie2-build may use. Default are all
+        available cores.
+    timeout : float or None
+        Seconds after which bowtie2-build is killed.
 
     '''
-    input_ref = f'{path}Indexed_bt2/85_otus.fasta'
+    asyncio.run(build_index(path, threads, timeout))
+
+
+async def build_index(path, threads=None, timeout=None):
+    r'''Builds bowtie2 index without blocking the event loop
+
+    The index is built in a staging directory and only moved next to
+    the 85_otus.fasta once bowtie2-build succeeded, the fingerprint
+    (see index_ready) is written last. A file lock makes concurrent
+    invocations wait for a single build. See buildbowtie2.
+
+    '''
+    if index_ready(path):
+        return
+        # only builds an index if there isn't already a complete one
+    if threads is None:
+        threads = scheduler.available_cpus()
+    index_dir = f'{path}Indexed_bt2/'
+    input_ref = f'{index_dir}85_otus.fasta'
     # reference genome greengenes is used
-    output_path = f'{path}Indexed_bt2/bowtie2'
-    if os.path.exists(f'{output_path}.1.bt2'):
-        # only builds an index for the alignment if there isn't already one
-        pass
-    else:
-        os.system(f'{bowtie2_path}-build -f {input_ref} {output_path} '
-                  '> /dev/null')
-        # if a indexfile is missing a new index is build
+    with open(f'{index_dir}bowtie2.lock', 'a') as lock:
+        if fcntl is not None:
+            await asyncio.to_thread(fcntl.flock, lock.fileno(),
+                                    fcntl.LOCK_EX)
+            # waits without blocking the event loop, the lock is
+            # released when the file is closed
+        if index_ready(path):
+            return
+            # another invocation built the index while this one waited
+        source = checksum(input_ref)
+        staging = tempfile.mkdtemp(dir=index_dir, prefix='.bowtie2_build_')
+        try:
+            await pipeline.run([[f'{tool_path("bowtie2")}-build',
+                                 '--threads', str(threads), '-f', input_ref,
+                                 f'{staging}/bowtie2']], stdout=os.devnull,
+                               timeout=timeout)
+            if os.path.exists(f'{index_dir}bowtie2.fingerprint'):
+                os.remove(f'{index_dir}bowtie2.fingerprint')
+                # the old index is invalid while its parts are replaced
+            parts = dict()
+            for part in sorted(os.listdir(staging)):
+                parts[part] = os.path.getsize(f'{staging}/{part}')
+                os.replace(f'{staging}/{part}', f'{index_dir}{part}')
+            fd, temp_file = tempfile.mkstemp(dir=index_dir)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'source': source, 'parts': parts}, f)
+            os.replace(temp_file, f'{index_dir}bowtie2.fingerprint')
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+            # a failed build leaves no parts behind
 
 
-def mapbowtie2(fasta_file, read2_file, path, temp_path, paired):
+def mapbowtie2(fasta_file, read2_file, path, temp_path, paired, threads=1,
+               timeout=None, offload=None):
     r'''Maps reads against index
 
     This function maps read files against a previously build index.
@@ -69,6 +187,15 @@ def mapbowtie2(fasta_file, read2_file, path, temp_path, paired):
         Dictates wether bowtie2 alignes paired or unpaired reads.
         If paired is set to False bowtie2 will do an unpaired alignment
         otherwise it will do a paired one.
+    threads : int
+        Number of cores of the sample, split between bowtie2 and the
+        compression threads of samtools (see scheduler.split_threads).
+    timeout : float or None
+        Seconds after which all programs of the pipeline are killed.
+    offload : Bool or None
+        Wether or not .gz files are decompressed by a separate process
+        instead of bowtie2 (see decompress.command). None decides by the
+        files and the number of threads.
 
     Returns
     -------
@@ -81,6 +208,24 @@ def mapbowtie2(fasta_file, read2_file, path, temp_path, paired):
         a raised Exception (if only a single file was given) or to the current
         file being skipped (if a directory was given).
 
+    '''
+    return asyncio.run(map_reads(fasta_file, read2_file, path, temp_path,
+                                 paired, threads, timeout, offload=offload))
+
+
+async def map_reads(fasta_file, read2_file, path, temp_path, paired,
+                    threads=1, timeout=None, stats=None, offload=None):
+    r'''Maps reads against index without blocking the event loop
+
+    bowtie2, samtools and bedtools are connected by pipes. If samtools
+    or bedtools fail, the pipeline is stopped and the error is raised
+    (see pipeline.run). See mapbowtie2.
+
+    If stats is given, the alignment summary is parsed from the bowtie2
+    stderr while bowtie2 is running (see bowtie2_stats.parse_line) and
+    the improperly paired reads are counted from the bedtools bamtobed
+    warnings under 'not_paired'. No log files are written then.
+
     '''
     index_path = f'{path}Indexed_bt2/bowtie2'
     if os.path.exists(f'{index_path}.1.bt2') is False:
@@ -90,30 +235,76 @@ def mapbowtie2(fasta_file, read2_file, path, temp_path, paired):
     bed_logpath = f'{temp_path}bed.log'
     # declares various filepaths
     Error = False
+    if stats is None:
+        bowtie2_log, bed_log = log_path, bed_logpath
+    else:
+        stats['not_paired'] = 0
+
+        def bowtie2_log(line):
+            bowtie2_stats.parse_line(stats, line)
+
+        def bed_log(line):
+            stats['not_paired'] += 1
+            # each warning reprensents one improperly paired read
+    bowtie2_threads, samtools_threads = scheduler.split_threads(
+        threads, compress=paired is False)
+    # bowtie2 and samtools share the cores of the sample, only the
+    # .bam file of unpaired reads is compressed
+    bowtie2 = [tool_path('bowtie2')]
+    samtools = [tool_path('samtools'), 'view']
+    if bowtie2_threads > 1:
+        bowtie2 += ['-p', str(bowtie2_threads)]
+    if samtools_threads > 0:
+        samtools += ['-@', str(samtools_threads)]
+    bowtie2 += ['--mm', '-x', index_path]
+    # the index is memory-mapped, so bowtie2 processes running at the
+    # same time share its pages instead of each loading a copy
+    samtools += ['-u' if paired is True else '-b', '-q', str(min_mapq),
+                 '-S', '-F', '4']
+    # paired reads are piped into bedtools bamtobed as uncompressed BAM
+    decompressor, read_args = decompress.command(fasta_file, read2_file,
+                                                 paired, threads, offload)
     if paired is True:
         aligned_path = f'{temp_path}paired.bed'
-        cmd = f'{bowtie2_path} -x {index_path} -1 {fasta_file} \
-                -2 {read2_file} --fast 2> {log_path} | \
-                {samtools_path} view -b -q 30 -S -F 4 \
-                | {bedtools_path} bamtobed -bedpe -i stdin > {aligned_path} \
-                2> {bed_logpath}'
+        commands = [bowtie2 + read_args + ['--fast'],
+                    samtools,
+                    [tool_path('bedtools'), 'bamtobed', '-bedpe',
+                     '-i', 'stdin']]
+        stderr = [bowtie2_log, None, bed_log]
         # Should a backward read be found both files will be given to bowtie2.
         # After converting .sam to .bam a conversion to .bed is done to
         # properly mate the pairs
     else:
         aligned_path = f'{temp_path}unpaired.bam'
-        cmd = f'{bowtie2_path} -x {index_path} -q -U {fasta_file} \
-                 --fast 2> {log_path} | {samtools_path} view -b -q 30 -S -F 4 \
-                 -o {aligned_path}'
+        commands = [bowtie2 + read_args + ['--fast'],
+                    samtools + ['-o', aligned_path]]
+        stderr = [bowtie2_log, None]
         # Should no backward read be found it will just use the forward
         # read and does an alignment followed by a pipe to convert
         # the bowtie2 output .sam to a .bam file
-    os.system(cmd)
+    readers = commands[:1]
+    if decompressor is not None:
+        commands.insert(0, decompressor)
+        stderr.insert(0, None)
+        readers = commands[:2]
+        # the reads are decompressed outside of bowtie2 and written to
+        # its stdin
+    try:
+        await pipeline.run(commands, stdout=aligned_path if paired else None,
+                           stderr=stderr, timeout=timeout)
+    except subprocess.CalledProcessError as e:
+        if all(e.cmd is not cmd for cmd in readers):
+            raise
+        Error = True
+        # bowtie2 or the decompression exited with an error, samtools and
+        # bedtools were stopped
+    if stats is not None:
+        return aligned_path, Error or not bowtie2_stats.complete(stats)
     with open(log_path, 'r') as log:
         lines = log.readlines()
         try:
             int(lines[0].split()[0])
-        except ValueError:
+        except (IndexError, ValueError):
             Error = True
         # Checks if bowtie2 exited with an error
 
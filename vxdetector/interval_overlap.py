@@ -0,0 +1,349 @@
+#!/usr/bin/python
+
+import gzip
+import itertools
+import os
+import struct
+import tempfile
+from functools import lru_cache
+import numpy as np
+import vxdetector.read_output as read_output
+from vxdetector.files_manager import checksum
+from vxdetector.Output_counter import regions_list
+
+chunk_size = 100000
+# number of aligned intervals which are classified at once
+ref_consuming = (0, 2, 3, 7, 8)
+# BAM cigar operations (M, D, N, =, X) which consume the reference
+cache_keys = ['otus', 'starts', 'ends']
+# arrays stored in the compiled reference
+
+
+def parse_reference(S_ref):
+    r'''Parses the variable region reference
+
+    Parameters
+    ----------
+    S_ref : str
+        Filepath to the annoted_ref.bed file.
+
+    Returns
+    -------
+    reference : dict
+        'otus' : numpy.ndarray
+            Sorted OTU ids (str).
+        'starts', 'ends' : numpy.ndarray
+            int32 arrays of shape (OTUs, 9) containing the start and
+            end of V1 - V9 for every OTU. Missing regions are 0, 0.
+
+    '''
+    boundaries = dict()
+    with open(S_ref, 'r') as f:
+        for line in f:
+            chrom, start, end, name = line.split()[:4]
+            if chrom not in boundaries:
+                boundaries[chrom] = [[0, 0] for _ in regions_list]
+            boundaries[chrom][regions_list.index(name)] = [int(start),
+                                                           int(end)]
+    otus = np.array(sorted(boundaries))
+    bounds = np.array([boundaries[otu] for otu in otus],
+                      dtype=np.int32).reshape(len(otus), len(regions_list), 2)
+    return {'otus': otus,
+            'starts': np.ascontiguousarray(bounds[:, :, 0]),
+            'ends': np.ascontiguousarray(bounds[:, :, 1])}
+
+
+def compile_reference(path):
+    r'''Compiles the variable region reference
+
+    Parses the annoted_ref.bed and stores the boundary arrays as .npy
+    files in Indexed_bt2/annoted_ref_cache/ together with the checksum
+    of the annoted_ref.bed. Every file is written under a temporary
+    name first and then renamed, the checksum file is renamed last.
+
+    Parameters
+    ----------
+    path : str
+        Program path and the directory where it needs to
+        look for the annoted_ref.bed file.
+
+    Returns
+    -------
+    reference : dict
+        Variable region reference (see parse_reference).
+
+    '''
+    S_ref = f'{path}Indexed_bt2/annoted_ref.bed'
+    cache_path = f'{path}Indexed_bt2/annoted_ref_cache/'
+    os.makedirs(cache_path, exist_ok=True)
+    source_checksum = checksum(S_ref)
+    reference = parse_reference(S_ref)
+    for key in cache_keys:
+        fd, temp_file = tempfile.mkstemp(dir=cache_path, suffix='.npy')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, reference[key])
+        os.replace(temp_file, f'{cache_path}{key}.npy')
+    fd, temp_file = tempfile.mkstemp(dir=cache_path)
+    with os.fdopen(fd, 'w') as f:
+        f.write(source_checksum)
+    os.replace(temp_file, f'{cache_path}checksum')
+    return reference
+
+
+@lru_cache(maxsize=None)
+def load_reference(path):
+    r'''Loads the variable region reference
+
+    The compiled reference (see compile_reference) is memory-mapped,
+    so all processes share the same read-only pages. It is compiled
+    again if it is missing or the checksum of the annoted_ref.bed
+    changed. The result is cached so every process loads it only once.
+
+    Parameters
+    ----------
+    path : str
+        Program path and the directory where it needs to
+        look for the annoted_ref.bed file.
+
+    Returns
+    -------
+    reference : dict
+        Variable region reference (see parse_reference).
+
+    '''
+    cache_path = f'{path}Indexed_bt2/annoted_ref_cache/'
+    try:
+        with open(f'{cache_path}checksum', 'r') as f:
+            cached_checksum = f.read()
+        if cached_checksum == checksum(f'{path}Indexed_bt2/annoted_ref.bed'):
+            return {key: np.load(f'{cache_path}{key}.npy', mmap_mode='r')
+                    for key in cache_keys}
+    except (FileNotFoundError, ValueError):
+        pass
+    # the cache is missing, outdated or damaged
+    return compile_reference(path)
+
+
+def _adjust_zero_length(starts, ends):
+    # bedtools treats zero length intervals as if they were
+    # one base longer on both sides
+    zero = starts == ends
+    return np.where(zero, starts - 1, starts), np.where(zero, ends + 1, ends)
+
+
+def classify(reference, chroms, starts, ends):
+    r'''Classifies aligned intervals
+
+    Applies the rules of "bedtools intersect -f 0.5" to every aligned
+    interval at once.
+    A variable region is counted for an interval if the interval covers
+    at least 50% of the region (reference used as -a).
+    An interval does not overlap a variable region if no region covers
+    at least 50% of the interval (interval used as -a with -v).
+
+    Parameters
+    ----------
+    reference : dict
+        Variable region reference created by load_reference.
+    chroms : numpy.ndarray
+        OTU ids the intervals were aligned to (str).
+    starts, ends : numpy.ndarray
+        0-based, half open start and end of the aligned intervals.
+
+    Returns
+    -------
+    hits : numpy.ndarray
+        bool array of shape (intervals, 9). True if the interval
+        covers at least half of the region.
+    no_overlap : numpy.ndarray
+        bool array of shape (intervals,). True if no region covers
+        at least half of the interval.
+
+    '''
+    otus = reference['otus']
+    row = np.searchsorted(otus, chroms)
+    row[row == len(otus)] = 0
+    known = otus[row] == chroms
+    # intervals aligned to an OTU missing in the reference overlap nothing
+    ref_start, ref_end = _adjust_zero_length(reference['starts'][row],
+                                             reference['ends'][row])
+    starts, ends = _adjust_zero_length(np.asarray(starts, dtype=np.int64),
+                                       np.asarray(ends, dtype=np.int64))
+    starts = starts[:, None]
+    ends = ends[:, None]
+    overlap = np.minimum(ends, ref_end) - np.maximum(starts, ref_start)
+    intersects = (overlap > 0) & known[:, None]
+    hits = intersects & (2 * overlap >= ref_end - ref_start)
+    no_overlap = ~np.any(intersects & (2 * overlap >= ends - starts), axis=1)
+    return hits, no_overlap
+
+
+def count_overlap(reference, intervals, reads=None):
+    r'''Counts variable regions of aligned intervals
+
+    Parameters
+    ----------
+    reference : dict
+        Variable region reference created by load_reference.
+    intervals : iterable
+        Yields (chroms, starts, ends) chunks of aligned intervals
+        as returned by read_intervals, followed by the read names if
+        reads is given.
+    reads : dict or None
+        Writer of the per-read output (see read_output.start). The
+        regions of every read are written chunk by chunk.
+
+    Returns
+    -------
+    regions : dict
+        Occurences of every variable region.
+        keys: ['V1', 'V2', 'V3', 'V4', 'V5', 'V6', 'V7', 'V8', 'V9']
+    no_overlap : int
+        Number of intervals which do not overlap with any variable region.
+
+    '''
+    counts = np.zeros(len(regions_list), dtype=np.int64)
+    no_overlap = 0
+    for chroms, starts, ends, *names in intervals:
+        hits, no_over = classify(reference, chroms, starts, ends)
+        if reads is not None:
+            read_output.add(reads, names[0], chroms, starts, ends, hits)
+        counts += hits.sum(axis=0)
+        no_overlap += int(no_over.sum())
+    regions = dict(zip(regions_list, (int(c) for c in counts)))
+    return regions, no_overlap
+
+
+def to_chunks(records, size=None):
+    r'''Groups aligned intervals into NumPy chunks
+
+    Parameters
+    ----------
+    records : iterable
+        Yields (chrom, start, end) tuples of aligned intervals. Further
+        values of the tuples (e.g. the read name) become further arrays.
+    size : int or None
+        Maximal number of intervals per chunk. Default is chunk_size.
+
+    Returns
+    -------
+    intervals : generator
+        Yields (chroms, starts, ends) NumPy arrays of at most
+        size intervals.
+
+    '''
+    if size is None:
+        size = chunk_size
+    records = iter(records)
+    while True:
+        chunk = list(itertools.islice(records, size))
+        if not chunk:
+            return
+        yield tuple(np.array([record[i] for record in chunk])
+                    for i in range(len(chunk[0])))
+
+
+def _bed_records(aligned_path, names=False):
+    with open(aligned_path, 'r') as f:
+        for line in f:
+            if names is False:
+                fields = line.split('\t', 3)
+                if len(fields) < 3:
+                    continue
+                yield fields[0], int(fields[1]), int(fields[2])
+                continue
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 3:
+                continue
+            name = fields[6] if len(fields) >= 10 else \
+                fields[3] if len(fields) > 3 else ''
+            # .bedpe files have the name in the 7th column
+            yield fields[0], int(fields[1]), int(fields[2]), name
+
+
+def _bam_records(aligned_path, names=False):
+    with gzip.open(aligned_path, 'rb') as f:
+        if f.read(4) != b'BAM\1':
+            raise ValueError(f'{aligned_path} is not a BAM file')
+        l_text, = struct.unpack('<i', f.read(4))
+        f.read(l_text)
+        n_ref, = struct.unpack('<i', f.read(4))
+        otus = []
+        for _ in range(n_ref):
+            l_name, = struct.unpack('<i', f.read(4))
+            otus.append(f.read(l_name).rstrip(b'\0').decode())
+            f.read(4)
+        # reads the reference names from the header
+        while True:
+            size = f.read(4)
+            if len(size) < 4:
+                break
+            block = f.read(struct.unpack('<i', size)[0])
+            ref_id, pos, l_read_name, n_cigar_op, flag = struct.unpack_from(
+                '<iiB3xHH', block)
+            if ref_id < 0 or flag & 4:
+                continue
+                # skips unmapped reads
+            cigar = struct.unpack_from(f'<{n_cigar_op}I', block,
+                                       32 + l_read_name)
+            length = sum(op >> 4 for op in cigar if op & 15 in ref_consuming)
+            if names is False:
+                yield otus[ref_id], pos, pos + max(length, 1)
+                continue
+            yield (otus[ref_id], pos, pos + max(length, 1),
+                   block[32:31 + l_read_name].decode())
+
+
+def read_intervals(aligned_path, names=False):
+    r'''Reads aligned intervals
+
+    Reads the converted Bowtie2 output file in chunks. For .bed files
+    (unpaired .bed or paired .bedpe files) the first three columns are
+    used, just like bedtools does.
+
+    Parameters
+    ----------
+    aligned_path : str
+        Filepath of the converted Bowtie2 output file.
+        This can either be a .bam or .bed file containing unpaired and
+        paired reads respectivly.
+    names : Bool
+        Wether or not the read names are read as well.
+
+    Returns
+    -------
+    intervals : generator
+        Yields (chroms, starts, ends) NumPy arrays of at most
+        chunk_size intervals, followed by the read names if names
+        is True.
+
+    '''
+    if aligned_path.endswith('.bam'):
+        return to_chunks(_bam_records(aligned_path, names))
+    return to_chunks(_bed_records(aligned_path, names))
+
+
+def overlap_counts(path, aligned_path, reads=None):
+    r'''In-process replacement of overlap and no_overlap
+
+    Parameters
+    ----------
+    path : str
+        Program path and the directory where it needs to
+        look for the annoted_ref.bed file.
+    aligned_path : str
+        Filepath of the converted Bowtie2 output file.
+    reads : dict or None
+        Writer of the per-read output (see read_output.start).
+
+    Returns
+    -------
+    regions : dict
+        Occurences of every variable region (see count_overlap).
+    no_overlap : int
+        Number of reads which do not overlap with any variable region.
+
+    '''
+    return count_overlap(load_reference(path),
+                         read_intervals(aligned_path, reads is not None),
+                         reads)
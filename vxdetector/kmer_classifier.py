@@ -0,0 +1,535 @@
+#!/usr/bin/python
+
+import gzip
+import os
+import tempfile
+from functools import lru_cache
+from itertools import islice
+import numpy as np
+import vxdetector.interval_overlap as interval_overlap
+import vxdetector.Output_counter as Output_counter
+from vxdetector.Output_counter import regions_list
+
+kmer_size = 15
+# k-mers of 15 bases are unique within the 16S gene but tolerate the
+# sequencing errors of a 150 base read
+batch_size = 20000
+# reads (pairs) which are classified at once
+stride = 4
+# only every fourth k-mer of a read is looked up, a read still has
+# more than 30 of them
+min_hits = 0.2
+# share of the k-mers of a read which must be found in the reference
+# for the read to count as aligned
+reference_bit = len(regions_list)
+# bit of the mask set for every k-mer of the 16S reference
+bucket_bits = 22
+# the k-mers are found through a table of their leading 22 bits
+cache_keys = ['kmers', 'masks', 'offsets', 'lengths']
+# arrays stored in the compiled index
+code_table = np.full(256, 4, dtype=np.uint8)
+for code, bases in enumerate([b'Aa', b'Cc', b'Gg', b'Tt']):
+    code_table[list(bases)] = code
+# 2 bit code of every base, all other characters are invalid (4)
+
+
+def _pack(codes, k, n):
+    # 2 bit packed k-mers of the first n positions. K-mers of twice the
+    # length are built from two halves, so only log2(k) passes are needed.
+    dtype = codes.dtype.type
+    blocks = {1: codes}
+    size = 1
+    while 2 * size <= k:
+        blocks[2 * size] = (blocks[size][:-size] << dtype(2 * size)) \
+            | blocks[size][size:]
+        size *= 2
+    value = None
+    offset = 0
+    for size in sorted(blocks, reverse=True):
+        if offset + size > k:
+            continue
+        part = blocks[size][offset:offset + n]
+        if value is None:
+            value = part
+        else:
+            value = (value << dtype(2 * size)) | part
+        offset += size
+    return value
+
+
+def kmers(sequences, k=None, stride=1):
+    r'''Canonical k-mers of DNA sequences
+
+    All sequences are encoded at once. A k-mer and its reverse complement
+    share the same canonical value (the smaller one), so reads of both
+    strands find the same reference k-mers. K-mers containing a base
+    other than A, C, G or T are skipped.
+
+    Parameters
+    ----------
+    sequences : list
+        DNA sequences (bytes).
+    k : int or None
+        Length of the k-mers (at most 32). Default is kmer_size.
+    stride : int
+        Only every stride-th k-mer and the last k-mer of every
+        sequence are returned.
+
+    Returns
+    -------
+    values : numpy.ndarray
+        Canonical k-mers, uint32 for k up to 16 and uint64 otherwise.
+    owners : numpy.ndarray
+        Index of the sequence every k-mer belongs to.
+    positions : numpy.ndarray
+        Start of every k-mer within its sequence.
+
+    '''
+    if k is None:
+        k = kmer_size
+    dtype = np.uint32 if k <= 16 else np.uint64
+    lengths = np.array([len(sequence) for sequence in sequences],
+                       dtype=np.int64)
+    codes = code_table[np.frombuffer(b'N'.join(sequences), dtype=np.uint8)]
+    # the sequences are separated by an invalid base
+    n = len(codes) - k + 1
+    if n <= 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return np.zeros(0, dtype=dtype), empty, empty
+    starts = np.cumsum(lengths + 1) - (lengths + 1)
+    count = np.maximum(lengths - k + stride, 0) // stride
+    last = (lengths >= k) & ((lengths - k) % stride != 0)
+    owners = np.repeat(np.arange(len(sequences)), count + last)
+    first = np.cumsum(count + last) - (count + last)
+    positions = (np.arange(len(owners)) - first[owners]) * stride
+    positions = np.minimum(positions, lengths[owners] - k)
+    # every stride-th k-mer and the last k-mer of every sequence
+    index = starts[owners] + positions
+    invalid = np.concatenate([[0], np.cumsum(codes > 3)])
+    valid = invalid[index + k] - invalid[index] == 0
+    codes = (codes & 3).astype(dtype)
+    forward = _pack(codes, k, n)
+    reverse = _pack(dtype(3) - codes[::-1], k, n)[::-1]
+    # the reverse complement is packed like the reversed sequence
+    index = index[valid]
+    values = np.minimum(forward[index], reverse[index])
+    return values, owners[valid], positions[valid]
+
+
+def read_fasta(fasta_file):
+    r'''FASTA reader
+
+    Parameters
+    ----------
+    fasta_file : str
+        Filepath to a fasta file (e.g. 85_otus.fasta).
+
+    Returns
+    -------
+    sequences : generator
+        Yields (name, sequence) of every entry, the sequence as bytes.
+
+    '''
+    name = None
+    lines = []
+    with open(fasta_file, 'rb') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith(b'>'):
+                if name is not None:
+                    yield name, b''.join(lines)
+                name = line[1:].split()[0].decode()
+                lines = []
+            elif name is not None:
+                lines.append(line)
+    if name is not None:
+        yield name, b''.join(lines)
+
+
+def parse_index(path):
+    r'''Builds the k-mer index of the variable regions
+
+    Every k-mer of the 85_otus.fasta is assigned to the variable region
+    of its OTU its central base lies in (see annoted_ref.bed).
+    K-mers found in several OTUs carry the regions of all of them.
+
+    Parameters
+    ----------
+    path : str
+        Program path and the directory where it needs to look for the
+        annoted_ref.bed and 85_otus.fasta files.
+
+    Returns
+    -------
+    index : dict
+        'kmers' : numpy.ndarray
+            Sorted unique canonical k-mers, uint32 for the kmer_size
+            of 15 (see kmers).
+        'masks' : numpy.ndarray
+            uint16 bit mask of every k-mer. Bit i is set for the variable
+            region regions_list[i], bit reference_bit for every k-mer.
+        'offsets' : numpy.ndarray
+            Position of the first k-mer of every bucket (leading
+            bucket_bits bits of a k-mer) in 'kmers'.
+        'lengths' : numpy.ndarray
+            Median length of V1 - V9 over all OTUs.
+
+    '''
+    k = kmer_size
+    reference = interval_overlap.load_reference(path)
+    otus = reference['otus']
+    values, masks = [], []
+    batch = list()
+
+    def add(batch):
+        names = np.array([name for name, _ in batch])
+        batch_values, owners, positions = kmers(
+            [sequence for _, sequence in batch], k)
+        row = np.searchsorted(otus, names)
+        row[row == len(otus)] = 0
+        known = otus[row] == names
+        # OTUs missing in the reference only belong to the 16S gene
+        centers = (positions + k // 2)[:, None]
+        starts = reference['starts'][row][owners]
+        ends = reference['ends'][row][owners]
+        inside = (starts <= centers) & (centers < ends) \
+            & known[owners][:, None]
+        batch_masks = np.full(len(batch_values), 1 << reference_bit,
+                              dtype=np.uint16)
+        for i in range(len(regions_list)):
+            batch_masks[inside[:, i]] |= np.uint16(1 << i)
+        values.append(batch_values)
+        masks.append(batch_masks)
+
+    for entry in read_fasta(f'{path}Indexed_bt2/85_otus.fasta'):
+        batch.append(entry)
+        if len(batch) == 500:
+            add(batch)
+            batch = list()
+    if batch:
+        add(batch)
+    # a few hundred sequences at a time keep the memory small
+    values = np.concatenate(values) if values else \
+        np.zeros(0, np.uint32 if k <= 16 else np.uint64)
+    masks = np.concatenate(masks) if masks else np.zeros(0, np.uint16)
+    order = np.argsort(values, kind='stable')
+    values = values[order]
+    masks = masks[order]
+    first = np.flatnonzero(np.concatenate([[True],
+                                           values[1:] != values[:-1]]))
+    if len(values):
+        masks = np.bitwise_or.reduceat(masks, first)
+    lengths = np.array([np.median(column[column > 0]) if np.any(column > 0)
+                        else 0.0 for column in
+                        (reference['ends'] - reference['starts']).T])
+    # OTUs without a region are not part of its median length
+    values = values[first]
+    offsets = np.searchsorted(values >> np.uint64(2 * k - bucket_bits),
+                              np.arange(2 ** bucket_bits + 1,
+                                        dtype=np.uint64)).astype(np.uint32)
+    return {'kmers': values, 'masks': masks, 'offsets': offsets,
+            'lengths': lengths}
+
+
+def lookup(index, values):
+    r'''Looks up k-mers in the index
+
+    The bucket of every k-mer is read from the offsets table, so only
+    the few k-mers of the same bucket are compared.
+
+    Parameters
+    ----------
+    index : dict
+        K-mer index created by load_index.
+    values : numpy.ndarray
+        Canonical k-mers (see kmers).
+
+    Returns
+    -------
+    masks : numpy.ndarray
+        Mask of every k-mer (see parse_index), 0 if it is not part
+        of the reference.
+
+    '''
+    reference = index['kmers']
+    if len(reference) == 0:
+        return np.zeros(len(values), dtype=np.uint16)
+    bucket = (values >> np.uint64(2 * kmer_size - bucket_bits)).astype(
+        np.int64)
+    row = index['offsets'][bucket].astype(np.int64)
+    end = index['offsets'][bucket + 1].astype(np.int64)
+    active = np.flatnonzero(row < end)
+    while len(active):
+        active = active[reference[row[active]] < values[active]]
+        row[active] += 1
+        active = active[row[active] < end[active]]
+        # moves on within the bucket until the k-mer is reached
+    row = np.minimum(row, len(reference) - 1)
+    found = (row < end) & (reference[row] == values)
+    return np.where(found, index['masks'][row], 0).astype(np.uint16)
+
+
+def index_checksum(path, k):
+    # the index changes with both reference files and the k-mer length
+    return ':'.join([
+        interval_overlap.checksum(f'{path}Indexed_bt2/annoted_ref.bed'),
+        interval_overlap.checksum(f'{path}Indexed_bt2/85_otus.fasta'),
+        str(k)])
+
+
+def compile_index(path):
+    r'''Compiles the k-mer index
+
+    Stores the arrays of parse_index as .npy files in
+    Indexed_bt2/kmer_cache/ together with the checksum of the reference
+    files (see interval_overlap.compile_reference).
+
+    Parameters
+    ----------
+    path : str
+        Program path and the directory where it needs to look for the
+        annoted_ref.bed and 85_otus.fasta files.
+
+    Returns
+    -------
+    index : dict
+        K-mer index (see parse_index).
+
+    '''
+    cache_path = f'{path}Indexed_bt2/kmer_cache/'
+    os.makedirs(cache_path, exist_ok=True)
+    source_checksum = index_checksum(path, kmer_size)
+    index = parse_index(path)
+    for key in cache_keys:
+        fd, temp_file = tempfile.mkstemp(dir=cache_path, suffix='.npy')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, index[key])
+        os.replace(temp_file, f'{cache_path}{key}.npy')
+    fd, temp_file = tempfile.mkstemp(dir=cache_path)
+    with os.fdopen(fd, 'w') as f:
+        f.write(source_checksum)
+    os.replace(temp_file, f'{cache_path}checksum')
+    return index
+
+
+@lru_cache(maxsize=None)
+def load_index(path):
+    r'''Loads the k-mer index
+
+    The compiled index is memory-mapped, so all processes share the same
+    read-only pages. It is compiled again if it is missing or one of the
+    reference files changed.
+
+    Parameters
+    ----------
+    path : str
+        Program path and the directory where it needs to look for the
+        annoted_ref.bed and 85_otus.fasta files.
+
+    Returns
+    -------
+    index : dict
+        K-mer index (see parse_index).
+
+    '''
+    cache_path = f'{path}Indexed_bt2/kmer_cache/'
+    try:
+        with open(f'{cache_path}checksum', 'r') as f:
+            cached_checksum = f.read()
+        if cached_checksum == index_checksum(path, kmer_size):
+            return {key: np.load(f'{cache_path}{key}.npy', mmap_mode='r')
+                    for key in cache_keys}
+    except (FileNotFoundError, ValueError):
+        pass
+    # the cache is missing, outdated or damaged
+    return compile_index(path)
+
+
+def _spans(selected, owners, positions, lengths, k, stride):
+    # bases of every sequence covered by the selected k-mers. The centers
+    # of the k-mers are counted, the ends of a sequence are added if its
+    # first or last k-mer is selected and half of the gap between two
+    # looked up k-mers otherwise. K-mers are sorted by sequence and
+    # position.
+    owners = owners[selected]
+    positions = positions[selected]
+    spans = np.zeros(len(lengths), dtype=np.int64)
+    if len(owners) == 0:
+        return spans
+    change = np.flatnonzero(owners[1:] != owners[:-1]) + 1
+    first = positions[np.concatenate([[0], change])]
+    last = positions[np.concatenate([change - 1, [len(owners) - 1]])]
+    owners = owners[np.concatenate([[0], change])]
+    spans[owners] = last - first + 1 \
+        + np.where(first == 0, k // 2, (stride - 1) // 2) \
+        + np.where(last == lengths[owners] - k, k - 1 - k // 2, stride // 2)
+    return spans
+
+
+def classify(index, sequences, mates=1):
+    r'''Classifies reads by their k-mers
+
+    A read (pair) is aligned if at least min_hits of its k-mers are
+    found in the reference. Like "bedtools intersect -f 0.5" a variable
+    region is counted if the read covers at least half of its median
+    length. An aligned read does not overlap a variable region if no
+    region covers at least half of the read. Pairs are classified by
+    their leftmost mate like the first mate of "bedtools bamtobed -bedpe".
+
+    Parameters
+    ----------
+    index : dict
+        K-mer index created by load_index.
+    sequences : list
+        Sequences (bytes) of the reads. For pairs all forward reads are
+        followed by the backward reads in the same order.
+    mates : int
+        1 for unpaired and 2 for paired reads.
+
+    Returns
+    -------
+    aligned : numpy.ndarray
+        bool array of shape (reads,). True if the read was found
+        in the reference.
+    hits : numpy.ndarray
+        bool array of shape (reads, 9). True if the read covers at
+        least half of the region.
+    no_overlap : numpy.ndarray
+        bool array of shape (reads,). True if the read is aligned but
+        lies outside of the variable regions.
+
+    '''
+    n = len(sequences) // mates
+    values, owners, positions = kmers(sequences, stride=stride)
+    masks = lookup(index, values)
+    found = masks > 0
+    total = np.bincount(owners % n, minlength=n)
+    matched = np.bincount(owners % n, weights=found, minlength=n)
+    aligned = (total > 0) & (matched >= np.maximum(min_hits * total, 1))
+    # all mates of a pair together decide if it is aligned
+    lengths = np.array([len(sequence) for sequence in sequences],
+                       dtype=np.int64)
+    spans = np.stack([_spans((masks >> i) & 1 == 1, owners, positions,
+                             lengths, kmer_size, stride)
+                      for i in range(len(regions_list))], axis=1)
+    mate = np.zeros(n, dtype=np.int64)
+    if mates == 2:
+        first = np.where(np.any(spans > 0, axis=1),
+                         np.argmax(spans > 0, axis=1), len(regions_list))
+        mate = (first[n:] < first[:n]).astype(np.int64)
+        # the mate covering the first variable region is the leftmost
+    chosen = mate * n + np.arange(n)
+    hits = (2 * spans[chosen] >= np.asarray(index['lengths'])) \
+        & (np.asarray(index['lengths']) > 0) & aligned[:, None]
+    no_overlap = aligned & (2 * spans[chosen].max(axis=1)
+                            < lengths[chosen])
+    return aligned, hits, no_overlap
+
+
+def read_batches(fq_file, read2_file, paired, size=None):
+    r'''Reads the sequences of a sample in batches
+
+    Parameters
+    ----------
+    fq_file : str
+        Path to a .fastq file (or .fastq.gz) containing the (forward) reads.
+    read2_file : str
+        Path to a .fastq file (or .fastq.gz) containing backwards reads.
+        Is disregarded if paired = False.
+    paired : Bool
+        Wether or not the reads are paired.
+    size : int or None
+        Maximal number of reads (pairs) per batch. Default is batch_size.
+
+    Returns
+    -------
+    batches : generator
+        Yields the sequences of at most size reads (pairs) as expected
+        by classify.
+
+    Raises
+    ------
+    ValueError
+        If a file does not look like a fastq file.
+
+    '''
+    if size is None:
+        size = batch_size
+    files = [fq_file, read2_file] if paired is True else [fq_file]
+    handles = [(gzip.open if file.endswith('.gz') else open)(file, 'rb')
+               for file in files]
+    try:
+        while True:
+            mates = []
+            for f in handles:
+                lines = list(islice(f, 4 * size))
+                if len(lines) % 4 != 0 \
+                   or not all(line.startswith(b'@') for line in lines[::4]) \
+                   or not all(line.startswith(b'+') for line in lines[2::4]):
+                    raise ValueError('This file does not look like a '
+                                     'fastq file')
+                mates.append([line.rstrip() for line in lines[1::4]])
+            n = min(len(sequences) for sequences in mates)
+            if n == 0:
+                return
+            yield [sequence for sequences in mates
+                   for sequence in sequences[:n]]
+    except OSError as e:
+        raise ValueError('This file does not look like a fastq file') from e
+        # e.g. a file ending with .gz which is not compressed
+    finally:
+        for f in handles:
+            f.close()
+
+
+def analyse(fq_file, read2_file, path, paired):
+    r'''Analyses a sample without alignment
+
+    Alternative to the bowtie2 pipeline which classifies the reads by
+    their k-mers in NumPy batches (see classify).
+
+    Parameters
+    ----------
+    fq_file : str
+        Path to a .fastq file (or .fastq.gz) containing the (forward) reads.
+    read2_file : str
+        Path to a .fastq file (or .fastq.gz) containing backwards reads.
+        Is disregarded if paired = False.
+    path : str
+        The program filepath.
+    paired : Bool
+        Wether or not the reads are paired.
+
+    Returns
+    -------
+    new_row : dict or None
+        Dictionary with the columns of Output_counter.create_row. None if
+        the file does not look like a fastq file.
+    counts : dict
+        Number of 'reads', 'aligned' reads, occurences of the 'regions'
+        and reads with 'no_overlap'.
+
+    '''
+    index = load_index(path)
+    counts = {'reads': 0, 'aligned': 0, 'no_overlap': 0}
+    regions = np.zeros(len(regions_list), dtype=np.int64)
+    try:
+        for sequences in read_batches(fq_file, read2_file, paired):
+            aligned, hits, no_overlap = classify(index, sequences,
+                                                 2 if paired else 1)
+            counts['reads'] += len(aligned)
+            counts['aligned'] += int(aligned.sum())
+            counts['no_overlap'] += int(no_overlap.sum())
+            regions += hits.sum(axis=0)
+    except ValueError:
+        return None, counts
+    counts['regions'] = dict(zip(regions_list, (int(c) for c in regions)))
+    new_row = dict()
+    new_row['Number of Reads'] = counts['reads']
+    new_row['Unaligned Reads [%]'] = 100.0
+    if counts['reads'] > 0:
+        new_row['Unaligned Reads [%]'] = 100 * (
+            counts['reads'] - counts['aligned']) / counts['reads']
+    return Output_counter.region_count(None, paired, new_row,
+                                       dict(counts['regions']),
+                                       counts['no_overlap'], 0), counts
@@ -0,0 +1,281 @@
+#!/usr/bin/python
+
+import io
+import itertools
+import os
+import subprocess
+import threading
+import vxdetector.interval_overlap as interval_overlap
+import vxdetector.pipeline as pipeline
+import vxdetector.sam_stream as sam_stream
+import vxdetector.bowtie2_stats as bowtie2_stats
+from vxdetector.interact_bowtie2 import tool_path
+from vxdetector.subsample import read_fastq
+
+default_batch = 64
+# samples aligned by one bowtie2 process
+
+
+def tag_record(record, sample):
+    r'''Prefixes the read name of a FASTQ record with a sample id
+
+    Parameters
+    ----------
+    record : bytes
+        FASTQ record (four lines).
+    sample : int
+        Position of the sample in its batch.
+
+    Returns
+    -------
+    record : bytes
+        The record with the read name "<sample>:<read name>".
+
+    Raises
+    ------
+    ValueError
+        If the record does not look like a FASTQ record.
+
+    '''
+    lines = record.split(b'\n')
+    if len(lines) != 5 or lines[4] != b'' or not lines[0].startswith(b'@') \
+       or not lines[2].startswith(b'+'):
+        raise ValueError('This file does not look like a fastq file')
+    return b'@%d:' % sample + record[1:]
+
+
+def tag_samples(samples, failed):
+    r'''Joins the reads of several samples into one stream
+
+    Parameters
+    ----------
+    samples : list
+        (fq_file, read2_file, paired) of every sample of the batch. All
+        samples need to be either paired or unpaired.
+    failed : set
+        The position of every sample whose files do not look like fastq
+        files or whose read files differ in length is added. The reads
+        of the sample up to the error are still written.
+
+    Returns
+    -------
+    records : generator
+        Yields the tagged records, both mates of a pair are
+        interleaved.
+
+    '''
+    for sample, (fq_file, read2_file, paired) in enumerate(samples):
+        try:
+            if paired is False:
+                for record in read_fastq(fq_file):
+                    yield tag_record(record, sample)
+                continue
+            for mate1, mate2 in itertools.zip_longest(read_fastq(fq_file),
+                                                      read_fastq(read2_file)):
+                if mate1 is None or mate2 is None:
+                    raise ValueError('The read files have a different '
+                                     'number of reads')
+                yield tag_record(mate1, sample) + tag_record(mate2, sample)
+        except (ValueError, OSError, EOFError):
+            failed.add(sample)
+            # e.g. a damaged .gz file, the sample is skipped
+
+
+def summarise(lines, stats, paired):
+    r'''Counts the alignment summary of bowtie2 from its SAM output
+
+    The summary bowtie2 writes to stderr covers all samples of a batch,
+    so it is recounted for every sample. Reads with an XS:i tag aligned
+    more than once.
+
+    Parameters
+    ----------
+    lines : iterable
+        SAM records of one sample (without header).
+    stats : dict
+        Summary the counts are added to (see bowtie2_stats.fields).
+    paired : Bool
+        Wether or not the reads have paired mates.
+
+    Returns
+    -------
+    lines : generator
+        Yields every line unchanged, so the records can be counted
+        at the same time (see sam_stream.count_sam).
+
+    '''
+    keys = ['paired', 'concordant_1', 'concordant_multi', 'discordant',
+            'mates_aligned_0', 'mates_aligned_1', 'mates_aligned_multi'] \
+        if paired else ['unpaired', 'aligned_0', 'aligned_1', 'aligned_multi']
+    for key in keys + ['reads']:
+        stats.setdefault(key, 0)
+    pending = None
+    for line in lines:
+        yield line
+        flag = int(line.split('\t', 2)[1])
+        if flag & 0x900:
+            continue
+            # secondary and supplementary alignments
+        if flag & 4:
+            alignment = '0'
+        elif '\tXS:i:' in line:
+            alignment = 'multi'
+        else:
+            alignment = '1'
+        if paired is False:
+            stats['reads'] += 1
+            stats['unpaired'] += 1
+            stats[f'aligned_{alignment}'] += 1
+            continue
+        if pending is None:
+            pending = (flag, alignment)
+            continue
+        mates = [pending, (flag, alignment)]
+        pending = None
+        stats['reads'] += 1
+        stats['paired'] += 1
+        if flag & 2:
+            multi = any(mate[1] == 'multi' for mate in mates)
+            stats['concordant_multi' if multi else 'concordant_1'] += 1
+        elif all(mate[1] == '1' for mate in mates):
+            stats['discordant'] += 1
+            # both mates aligned once but not concordantly
+        else:
+            for _, mate_alignment in mates:
+                stats[f'mates_aligned_{mate_alignment}'] += 1
+    if paired is True:
+        stats['concordant_0'] = stats['reads'] - stats['concordant_1'] \
+            - stats['concordant_multi']
+        stats['mates'] = 2 * (stats['concordant_0'] - stats['discordant'])
+        aligned = 2 * (stats['reads'] - stats['concordant_0']
+                       + stats['discordant']) \
+            + stats['mates_aligned_1'] + stats['mates_aligned_multi']
+        total = 2 * stats['reads']
+    else:
+        aligned = stats['aligned_1'] + stats['aligned_multi']
+        total = stats['reads']
+    stats['overall_rate'] = round(aligned / total * 100, 2) if total else 0.0
+    # bowtie2 reports the rate with two decimals
+
+
+def demultiplex(lines, reference, paired):
+    r'''Counts the SAM output of a batch for every sample
+
+    The reads of every sample follow each other (bowtie2 --reorder),
+    so the records are grouped by their sample id while they are read.
+
+    Parameters
+    ----------
+    lines : iterable
+        Lines of the SAM output of a batch.
+    reference : dict
+        Variable region reference created by
+        interval_overlap.load_reference.
+    paired : Bool
+        Wether or not the reads have paired mates.
+
+    Returns
+    -------
+    results : dict
+        (counts, stats) of every sample id, see sam_stream.count_sam and
+        summarise.
+
+    '''
+    records = (line for line in lines if not line.startswith('@'))
+    results = dict()
+    for sample, group in itertools.groupby(
+            records, key=lambda line: line.split(':', 1)[0]):
+        stats = dict()
+        counts = sam_stream.count_sam(summarise(group, stats, paired),
+                                      reference, paired)
+        results[int(sample)] = (counts, stats)
+    return results
+
+
+def analyse_batch(samples, path, threads=1, timeout=None):
+    r'''Aligns several samples with a single bowtie2 process
+
+    Small samples spend most of their time starting bowtie2 and loading
+    the index. The reads of all samples are written to the stdin of one
+    bowtie2 process instead, the read names are prefixed with the
+    position of their sample (see tag_samples) and the SAM output is
+    demultiplexed into a result per sample (see demultiplex).
+
+    Parameters
+    ----------
+    samples : list
+        (fq_file, read2_file, paired) of every sample. All samples need
+        to be either paired or unpaired.
+    path : str
+        The program filepath. The directory where it needs to look
+        for the index files and the annoted_ref.bed.
+    threads : int
+        Number of threads given to bowtie2.
+    timeout : float or None
+        Seconds after which bowtie2 is killed and a TimeoutError is
+        raised.
+
+    Returns
+    -------
+    rows : list
+        Result of every sample in the order of samples
+        (see sam_stream.create_row). None if the sample does not look
+        like a fastq file, has no reads or bowtie2 ended with an error.
+
+    '''
+    if len({paired for _, _, paired in samples}) > 1:
+        raise ValueError('A batch can not mix paired and unpaired samples')
+    if not samples:
+        return []
+    paired = samples[0][2]
+    index_path = f'{path}Indexed_bt2/bowtie2'
+    if os.path.exists(f'{index_path}.1.bt2') is False:
+        raise FileNotFoundError(f'No Index files found under "{index_path}"')
+    cmd = [tool_path('bowtie2'), '-p', str(threads), '--mm',
+           '--reorder', '-x', index_path, '--fast']
+    if paired is True:
+        cmd += ['--interleaved', '-']
+    else:
+        cmd += ['-q', '-U', '-']
+    reference = interval_overlap.load_reference(path)
+    failed = set()
+    summary = dict()
+
+    def feed(stdin):
+        try:
+            for record in tag_samples(samples, failed):
+                stdin.write(record)
+        except BrokenPipeError:
+            pass
+            # bowtie2 ended early, the error is found in its summary
+        finally:
+            try:
+                stdin.close()
+            except BrokenPipeError:
+                pass
+
+    with pipeline.spawn(cmd, timeout, stdin=subprocess.PIPE,
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.PIPE) as process:
+        feeder = threading.Thread(target=feed, args=(process.stdin,))
+        drain = threading.Thread(target=lambda: [
+            bowtie2_stats.parse_line(summary, line)
+            for line in io.TextIOWrapper(process.stderr)])
+        feeder.start()
+        drain.start()
+        results = demultiplex(io.TextIOWrapper(process.stdout), reference,
+                              paired)
+        feeder.join()
+        drain.join()
+    # bowtie2 is killed on a timeout or an Exception (see pipeline.spawn)
+    if process.returncode != 0 or not bowtie2_stats.complete(summary):
+        return [None] * len(samples)
+        # bowtie2 ended with an error, no sample of the batch is complete
+    rows = []
+    for sample in range(len(samples)):
+        if sample in failed or sample not in results:
+            rows.append(None)
+            continue
+        counts, stats = results[sample]
+        rows.append(sam_stream.create_row(stats, paired, counts))
+    return rows
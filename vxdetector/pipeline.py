@@ -0,0 +1,277 @@
+#!/usr/bin/python
+
+import asyncio
+import os
+import signal
+import subprocess
+import threading
+from contextlib import contextmanager
+
+
+def _kill(process):
+    # every command runs in its own session, so wrapper scripts (e.g. the
+    # bowtie2 perl wrapper) are killed together with the programs they started
+    if process.returncode is None:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+async def _read_lines(stream, consumer):
+    # passes every line to the consumer while the command is running
+    while True:
+        line = await stream.readline()
+        if not line:
+            return
+        consumer(line.decode(errors='replace'))
+
+
+async def _wait(processes, killed, readers, check):
+    # waits for all processes, if check is True the rest is killed as soon
+    # as one failed
+    waiting = {asyncio.ensure_future(process.wait()): process
+               for process in processes}
+    while waiting:
+        done, _ = await asyncio.wait(waiting,
+                                     return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            waiting.pop(task)
+            if check is True and task.result() != 0:
+                for process in processes:
+                    if process.returncode is None:
+                        killed.add(process.pid)
+                        _kill(process)
+    await asyncio.gather(*readers)
+    return [process.returncode for process in processes]
+
+
+async def run(commands, stdin=None, stdout=None, stderr=None, timeout=None,
+              check=True):
+    r'''Runs commands connected by pipes
+
+    Every command reads the output of the previous command through an
+    OS pipe, the data does not pass through Python. No shell is used.
+
+    Parameters
+    ----------
+    commands : list
+        Argument lists of the commands in the order of the pipeline.
+    stdin : str or None
+        Filepath the first command reads from. None inherits stdin.
+    stdout : str, callable or None
+        Filepath the last command writes to. A callable is called with
+        every line of its output while it is running. None inherits
+        stdout.
+    stderr : list or None
+        Filepath, callable or None for every command. A callable
+        is called with every line the command writes to stderr while
+        it is running. None inherits stderr.
+    timeout : float or None
+        Seconds after which all commands are killed.
+    check : Bool
+        Wether or not a nonzero exit raises an Exception. If False
+        all commands run to their end.
+
+    Returns
+    -------
+    returncodes : list
+        Exit code of every command.
+
+    Raises
+    ------
+    subprocess.CalledProcessError
+        If check is True and a command exited nonzero. The remaining
+        commands are killed immediately. The first command in pipeline
+        order which was not killed is reported.
+    TimeoutError
+        If the commands did not finish within timeout seconds.
+
+    '''
+    if stderr is None:
+        stderr = [None] * len(commands)
+    processes = []
+    readers = []
+    killed = set()
+    source = None
+    try:
+        if stdin is not None:
+            source = os.open(stdin, os.O_RDONLY)
+        for i, cmd in enumerate(commands):
+            if i == len(commands) - 1:
+                read_end = None
+                sink = None
+                if callable(stdout):
+                    sink = asyncio.subprocess.PIPE
+                elif stdout is not None:
+                    sink = os.open(stdout,
+                                   os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+            else:
+                read_end, sink = os.pipe()
+            error = None
+            if callable(stderr[i]):
+                error = asyncio.subprocess.PIPE
+            elif stderr[i] is not None:
+                error = os.open(stderr[i],
+                                os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+            try:
+                processes.append(await asyncio.create_subprocess_exec(
+                    *cmd, stdin=source, stdout=sink, stderr=error,
+                    start_new_session=True))
+            except BaseException:
+                if read_end is not None:
+                    os.close(read_end)
+                raise
+            finally:
+                for fd in [source, sink, error]:
+                    if fd is not None and fd >= 0:
+                        os.close(fd)
+                        # the child holds its own copy
+                source = None
+            source = read_end
+            if i == len(commands) - 1 and callable(stdout):
+                readers.append(asyncio.ensure_future(
+                    _read_lines(processes[-1].stdout, stdout)))
+            if callable(stderr[i]):
+                readers.append(asyncio.ensure_future(
+                    _read_lines(processes[-1].stderr, stderr[i])))
+        returncodes = await asyncio.wait_for(
+            _wait(processes, killed, readers, check), timeout)
+    except BaseException as e:
+        if source is not None:
+            os.close(source)
+        for reader in readers:
+            reader.cancel()
+        for process in processes:
+            _kill(process)
+        for process in processes:
+            await process.wait()
+        if isinstance(e, (asyncio.TimeoutError, TimeoutError)):
+            raise TimeoutError(f'"{" ".join(commands[0])}" did not finish '
+                               f'within {timeout} s') from None
+        raise
+        # cancellation (e.g. Ctrl-C) and errors never leave orphans behind
+    if check is True:
+        for cmd, process in zip(commands, processes):
+            if process.returncode == -signal.SIGKILL \
+               and process.pid in killed:
+                continue
+                # killed because another command failed
+            if process.returncode != 0:
+                raise subprocess.CalledProcessError(process.returncode, cmd)
+    return returncodes
+
+
+@contextmanager
+def spawn(cmd, timeout=None, **kwargs):
+    r'''Runs a command whose pipes are used by the caller
+
+    For commands which are fed or read by Python threads and can not be
+    connected by run. Like in run, the command runs in its own session
+    and is killed together with the programs it started if the block is
+    left by an Exception (e.g. KeyboardInterrupt) or timeout expired.
+
+    Parameters
+    ----------
+    cmd : list
+        Argument list of the command.
+    timeout : float or None
+        Seconds after which the command is killed.
+    **kwargs
+        Passed on to subprocess.Popen (e.g. stdin, stdout, stderr).
+
+    Yields
+    ------
+    process : subprocess.Popen
+        The running command. It has ended when the block is left.
+
+    Raises
+    ------
+    TimeoutError
+        If the command was killed because timeout expired.
+
+    '''
+    process = subprocess.Popen(cmd, start_new_session=True, **kwargs)
+    expired = threading.Event()
+    timer = None
+    if timeout is not None:
+        def expire():
+            expired.set()
+            _kill(process)
+            # the pipes are closed, so the threads using them end
+
+        timer = threading.Timer(timeout, expire)
+        timer.daemon = True
+        timer.start()
+    try:
+        yield process
+    except BaseException:
+        _kill(process)
+        raise
+    finally:
+        if timer is not None:
+            timer.cancel()
+        for pipe in [process.stdin, process.stdout, process.stderr]:
+            if pipe is not None:
+                try:
+                    pipe.close()
+                except BrokenPipeError:
+                    pass
+        process.wait()
+    if expired.is_set():
+        raise TimeoutError(f'"{" ".join(cmd)}" did not finish '
+                           f'within {timeout} s')
+
+
+async def gather(functions, limit=None):
+    r'''Runs coroutine functions concurrently
+
+    Parameters
+    ----------
+    functions : iterable
+        Coroutine functions without arguments (e.g. functools.partial).
+        May be a generator, every coroutine starts as soon as it is
+        produced (and a slot is free).
+    limit : int or None
+        Maximal number of coroutines running at the same time.
+        None runs all at once.
+
+    Returns
+    -------
+    results : list
+        Results in the order of functions.
+
+    Raises
+    ------
+    Exception
+        The first Exception raised by a coroutine. All other coroutines
+        are cancelled, which kills their commands.
+
+    '''
+    semaphore = asyncio.Semaphore(limit) if limit else None
+
+    async def limited(function):
+        if semaphore is None:
+            return await function()
+        async with semaphore:
+            return await function()
+
+    def check(task):
+        if not task.cancelled() and task.exception() is not None:
+            failed.append(task)
+
+    tasks = []
+    failed = []
+    try:
+        for function in functions:
+            tasks.append(asyncio.ensure_future(limited(function)))
+            tasks[-1].add_done_callback(check)
+            await asyncio.sleep(0)
+            # started coroutines run while further functions are produced
+            if failed:
+                raise failed[0].exception()
+        return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,224 @@
+#!/usr/bin/python
+
+import argparse
+import contextvars
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+rss_unit = 1 if sys.platform == 'darwin' else 1024
+# ru_maxrss is given in bytes on macOS and in kilobytes on Linux
+profile_file = None
+# set by enable, every process of a run appends to the same file
+current_sample = contextvars.ContextVar('current_sample', default=None)
+# samples analysed concurrently by asyncio tasks keep their own name
+running = []
+running_lock = threading.Lock()
+# stages of this process which have not ended yet
+
+
+def enable(profile, sample=None):
+    r'''Enables the profiling of the current process
+
+    Parameters
+    ----------
+    profile : str or None
+        Filepath of the JSON-lines file the stages are appended to.
+        None disables the profiling.
+    sample : str or None
+        Name of the sample the following stages belong to.
+
+    '''
+    global profile_file
+    profile_file = profile
+    current_sample.set(sample)
+
+
+def io_counters():
+    r'''Bytes read and written by this process and its finished children
+
+    Returns
+    -------
+    counters : tuple
+        (bytes read, bytes written) including pipes and the page cache
+        or (None, None) where /proc is not available.
+
+    '''
+    try:
+        with open('/proc/self/io', 'r') as f:
+            fields = dict(line.split(': ') for line in f.read().splitlines())
+    except OSError:
+        return None, None
+    return int(fields['rchar']), int(fields['wchar'])
+
+
+def _delta(after, before):
+    if after is None or before is None:
+        return None
+    return after - before
+
+
+@contextmanager
+def stage(name):
+    r'''Records a stage of the workflow
+
+    Wall time, CPU time of this process and of the programs it started
+    (bowtie2, samtools, bedtools), peak memory and the bytes read and
+    written are appended as one JSON line to the profile file.
+    Does nothing if profiling is not enabled.
+
+    CPU time, memory and I/O are only known for the whole process and
+    all its children. If a stage of another sample ran in the same
+    process at the same time (concurrent asyncio tasks or threads),
+    they can not be attributed to the stage: the record is marked as
+    'shared' and only its wall time is reported. Samples analysed by
+    separate processes (--jobs) are not affected.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage (e.g. 'mapbowtie2').
+
+    '''
+    if profile_file is None:
+        yield
+        return
+    entry = {'sample': current_sample.get(), 'shared': False}
+    with running_lock:
+        for other in running:
+            if other['sample'] != entry['sample']:
+                other['shared'] = True
+                entry['shared'] = True
+        running.append(entry)
+    before_self = resource.getrusage(resource.RUSAGE_SELF)
+    before_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    before_read, before_written = io_counters()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - start
+        after_self = resource.getrusage(resource.RUSAGE_SELF)
+        after_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        after_read, after_written = io_counters()
+        with running_lock:
+            running.remove(entry)
+        record = {
+            'sample': current_sample.get(), 'stage': name, 'pid': os.getpid(),
+            'wall_s': wall,
+            'cpu_s': (after_self.ru_utime + after_self.ru_stime
+                      - before_self.ru_utime - before_self.ru_stime),
+            'child_cpu_s': (after_children.ru_utime + after_children.ru_stime
+                            - before_children.ru_utime
+                            - before_children.ru_stime),
+            'peak_rss': max(after_self.ru_maxrss,
+                            after_children.ru_maxrss) * rss_unit,
+            'bytes_read': _delta(after_read, before_read),
+            'bytes_written': _delta(after_written, before_written)}
+        # peak_rss is the high-water mark of this process and of its
+        # largest child up to the end of the stage
+        if entry['shared'] is True:
+            for key in ['cpu_s', 'child_cpu_s', 'peak_rss', 'bytes_read',
+                        'bytes_written']:
+                record[key] = None
+            # the counters include the programs of the other samples
+        record['shared'] = entry['shared']
+        with open(profile_file, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+            # a single short append per record, so parallel samples do
+            # not interleave their lines
+
+
+def read_profile(profile):
+    r'''Reads a profile
+
+    Parameters
+    ----------
+    profile : str
+        Filepath of the JSON-lines file written by stage.
+
+    Returns
+    -------
+    records : list
+        One dictionary per recorded stage.
+
+    '''
+    with open(profile, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summary(records):
+    r'''Sums up the stages of a run
+
+    Parameters
+    ----------
+    records : list
+        Records as returned by read_profile.
+
+    Returns
+    -------
+    stages : list
+        One dictionary per stage name with the number of calls, the
+        summed wall, CPU and child CPU time, the largest peak memory
+        and the summed bytes. Sorted by wall time, the hottest stage
+        comes first. Shared stages (see stage) only add their wall
+        time, 'shared' counts them.
+
+    '''
+    stages = dict()
+    for record in records:
+        total = stages.setdefault(record['stage'], {
+            'stage': record['stage'], 'calls': 0, 'wall_s': 0.0,
+            'cpu_s': 0.0, 'child_cpu_s': 0.0, 'peak_rss': 0,
+            'bytes_read': 0, 'bytes_written': 0, 'shared': 0})
+        total['calls'] += 1
+        total['shared'] += record.get('shared', False) is True
+        for key in ['wall_s', 'cpu_s', 'child_cpu_s', 'bytes_read',
+                    'bytes_written']:
+            total[key] += record[key] or 0
+        total['peak_rss'] = max(total['peak_rss'],
+                                record['peak_rss'] or 0)
+    return sorted(stages.values(), key=lambda total: total['wall_s'],
+                  reverse=True)
+
+
+def main():
+    r'''Prints the hottest stages of a profiled run
+
+    The profile is written by VXdetector with the --profile option.
+    The CPU, memory and I/O columns leave out shared stages, which ran
+    at the same time as another sample in the same process.
+
+    '''
+    parser = argparse.ArgumentParser(prog='vxdetector.profiler', description=(
+        'Summarizes a profile written by VXdetector --profile'))
+    parser.add_argument('profile', help='JSON-lines profile of a run')
+    parser.add_argument('-n', '--top', type=int, default=5,
+                        help='Number of slowest single stages listed')
+    args = parser.parse_args()
+    records = read_profile(args.profile)
+    wall = sum(record['wall_s'] for record in records) or 1
+    print(f'{"stage":<14}{"calls":>6}{"wall [s]":>11}{"share":>7}'
+          f'{"child cpu [s]":>15}{"peak [MB]":>11}{"read [MB]":>11}'
+          f'{"written [MB]":>14}{"shared":>8}')
+    for total in summary(records):
+        print(f'{total["stage"]:<14}{total["calls"]:>6}'
+              f'{total["wall_s"]:>11.2f}{total["wall_s"] / wall:>7.0%}'
+              f'{total["child_cpu_s"]:>15.2f}'
+              f'{total["peak_rss"] / 1e6:>11.1f}'
+              f'{total["bytes_read"] / 1e6:>11.1f}'
+              f'{total["bytes_written"] / 1e6:>14.1f}'
+              f'{total["shared"]:>8}')
+    print('\nslowest stages:')
+    for record in sorted(records, key=lambda record: record['wall_s'],
+                         reverse=True)[:args.top]:
+        print(f'{record["wall_s"]:>9.2f} s  {record["stage"]:<14}'
+              f'{record["sample"] or "-"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/python
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from glob import glob
+import numpy as np
+from vxdetector.Output_counter import regions_list
+
+dtype = np.dtype([('read', '<u8'), ('otu', '<i8'), ('start', '<i4'),
+                  ('end', '<i4'), ('regions', '<u2')])
+# one record per read (pair), bit i of 'regions' is set for
+# regions_list[i]
+region_bits = (1 << np.arange(len(regions_list))).astype(np.uint16)
+
+
+def read_hash(names):
+    r'''Hashes read names
+
+    Parameters
+    ----------
+    names : iterable
+        Read names (str). Mates of a pair share their name.
+
+    Returns
+    -------
+    hashes : numpy.ndarray
+        First 8 bytes of the BLAKE2b digest of every name (uint64).
+
+    '''
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(name.encode(),
+                                        digest_size=8).digest(), 'little')
+         for name in names), dtype=np.uint64, count=len(names))
+
+
+def otu_ids(chroms):
+    r'''Converts OTU names to integers
+
+    Parameters
+    ----------
+    chroms : numpy.ndarray
+        OTU ids the reads were aligned to (str).
+
+    Returns
+    -------
+    otus : numpy.ndarray
+        Greengenes ids as int64, -1 for a name which is no number.
+
+    '''
+    try:
+        return chroms.astype(np.int64)
+    except ValueError:
+        return np.array([int(chrom) if chrom.isdigit() else -1
+                         for chrom in chroms], dtype=np.int64)
+
+
+def start(directory, sample):
+    r'''Starts the per-read output of a sample
+
+    The chunks are written to a hidden folder which replaces
+    "<directory>/<sample>" once the sample is finished, so readers
+    never see the output of an unfinished sample.
+
+    Parameters
+    ----------
+    directory : str
+        Directory of the per-read output of all samples.
+    sample : str
+        Name of the sample.
+
+    Returns
+    -------
+    writer : dict
+        State of the output which is passed to add and finish.
+
+    '''
+    os.makedirs(directory, exist_ok=True)
+    return {'path': os.path.join(directory, sample),
+            'temp_path': tempfile.mkdtemp(prefix=f'.{sample}.',
+                                          dir=directory),
+            'parts': 0, 'rows': 0}
+
+
+def add(writer, names, chroms, starts, ends, hits):
+    r'''Writes the regions of a chunk of reads
+
+    Every chunk becomes an uncompressed .npy record array, which is
+    memory-mapped when it is loaded (see load).
+
+    Parameters
+    ----------
+    writer : dict
+        Output created by start.
+    names : numpy.ndarray
+        Read names.
+    chroms : numpy.ndarray
+        OTU ids the reads were aligned to.
+    starts, ends : numpy.ndarray
+        0-based, half open start and end of the aligned reads (pairs).
+    hits : numpy.ndarray
+        bool array of shape (reads, 9) as returned by
+        interval_overlap.classify.
+
+    '''
+    records = np.empty(len(names), dtype=dtype)
+    records['read'] = read_hash(names)
+    records['otu'] = otu_ids(chroms)
+    records['start'] = starts
+    records['end'] = ends
+    records['regions'] = hits @ region_bits
+    np.save(os.path.join(writer['temp_path'],
+                         f'part-{writer["parts"]:05d}.npy'), records)
+    writer['parts'] += 1
+    writer['rows'] += len(records)
+
+
+def finish(writer):
+    r'''Publishes the per-read output of a finished sample
+
+    Parameters
+    ----------
+    writer : dict
+        Output created by start.
+
+    '''
+    if writer['temp_path'] is None:
+        return
+        # the output was discarded
+    with open(os.path.join(writer['temp_path'], 'reads.json'), 'w') as f:
+        json.dump({'rows': writer['rows'], 'parts': writer['parts'],
+                   'regions': regions_list}, f)
+    if os.path.exists(writer['path']):
+        old_path = tempfile.mkdtemp(prefix='.old.',
+                                    dir=os.path.dirname(writer['path']))
+        os.replace(writer['path'], os.path.join(old_path, 'reads'))
+        shutil.rmtree(old_path)
+        # the output of an earlier run is replaced
+    os.replace(writer['temp_path'], writer['path'])
+    writer['temp_path'] = None
+
+
+def discard(writer):
+    r'''Removes the per-read output of a failed sample
+
+    Parameters
+    ----------
+    writer : dict or None
+        Output created by start.
+
+    '''
+    if writer is not None and writer['temp_path'] is not None:
+        shutil.rmtree(writer['temp_path'], ignore_errors=True)
+        writer['temp_path'] = None
+
+
+@contextmanager
+def writing(directory, sample):
+    r'''Per-read output of a sample
+
+    Parameters
+    ----------
+    directory : str or None
+        Directory of the per-read output. None disables it.
+    sample : str
+        Name of the sample.
+
+    Yields
+    ------
+    writer : dict or None
+        Output created by start. It is published when the block ends
+        unless it was discarded, if an Exception is raised it is
+        removed.
+
+    '''
+    if directory is None:
+        yield None
+        return
+    writer = start(directory, sample)
+    try:
+        yield writer
+    except BaseException:
+        discard(writer)
+        raise
+    finish(writer)
+
+
+def load(path, mmap=True):
+    r'''Loads the per-read output of a sample
+
+    Parameters
+    ----------
+    path : str
+        Folder of the sample ("<directory>/<sample>").
+    mmap : Bool
+        Wether or not the chunks are memory-mapped instead of read.
+
+    Returns
+    -------
+    parts : list
+        Record array (see dtype) of every chunk in the order they were
+        written. numpy.concatenate joins them.
+
+    '''
+    if os.path.exists(os.path.join(path, 'reads.json')) is False:
+        raise FileNotFoundError(f'"{path}" is no complete per-read output')
+    return [np.load(part, mmap_mode='r' if mmap else None)
+            for part in sorted(glob(os.path.join(path, 'part-*.npy')))]
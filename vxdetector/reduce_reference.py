@@ -0,0 +1,245 @@
+#!/usr/bin/python
+
+import argparse
+import json
+import os
+import tempfile
+import vxdetector.VXdetector as VXdetector
+import vxdetector.files_manager as files_manager
+import vxdetector.scheduler as scheduler
+from vxdetector.interact_bowtie2 import buildbowtie2
+from vxdetector.files_manager import checksum
+from vxdetector.kmer_classifier import read_fasta
+from vxdetector.Output_counter import agreement
+
+default_flank = 150
+# bases kept on both sides of V1 - V9, one read length so reads
+# overlapping the first or last region still align completely
+
+
+def read_annotation(S_ref):
+    r'''Reads the variable region boundaries of every OTU
+
+    Parameters
+    ----------
+    S_ref : str
+        Filepath to the annoted_ref.bed file.
+
+    Returns
+    -------
+    annotation : dict
+        List of (start, end, region) of every OTU in the order of
+        the file.
+
+    '''
+    annotation = dict()
+    with open(S_ref, 'r') as f:
+        for line in f:
+            chrom, start, end, name = line.split()[:4]
+            annotation.setdefault(chrom, []).append((int(start), int(end),
+                                                     name))
+    return annotation
+
+
+def _write(filename, lines):
+    # the file is only replaced once it was written completely
+    fd, temp_file = tempfile.mkstemp(dir=os.path.dirname(filename))
+    with os.fdopen(fd, 'w') as f:
+        f.writelines(lines)
+    os.replace(temp_file, filename)
+
+
+def reduce_files(path, bundle, flank=default_flank, trim=True):
+    r'''Writes the reduced reference files
+
+    OTUs without variable regions in the annoted_ref.bed cannot be
+    assigned to a region and are left out. If trim is set, every
+    sequence is cut to its V1 - V9 span plus flank bases on both sides.
+    OTUs which are then identical in sequence and region boundaries are
+    represented by the first of them. The reduced 85_otus.fasta and
+    annoted_ref.bed are written to the Indexed_bt2 folder of the bundle.
+
+    Parameters
+    ----------
+    path : str
+        The program filepath. The directory where it needs to look
+        for the full annoted_ref.bed and 85_otus.fasta.
+    bundle : str
+        Directory the bundle is written to.
+    flank : int
+        Bases kept before the first and after the last variable region.
+    trim : Bool
+        Wether or not the sequences are trimmed to their variable regions.
+
+    Returns
+    -------
+    report : dict
+        Number of 'otus' and 'bases' of the full and the reduced
+        reference, the 'flank', 'trim' and the checksums of the
+        full reference files ('source').
+
+    '''
+    bundle = os.path.join(bundle, '')
+    os.makedirs(f'{bundle}Indexed_bt2', exist_ok=True)
+    S_ref = f'{path}Indexed_bt2/annoted_ref.bed'
+    input_ref = f'{path}Indexed_bt2/85_otus.fasta'
+    annotation = read_annotation(S_ref)
+    seen = dict()
+    fasta_lines = []
+    bed_lines = []
+    report = {'otus': [0, 0], 'bases': [0, 0]}
+    for otu, sequence in read_fasta(input_ref):
+        report['otus'][0] += 1
+        report['bases'][0] += len(sequence)
+        if otu not in annotation:
+            continue
+            # reads of this OTU can never be counted for a region
+        regions = annotation[otu]
+        offset = 0
+        if trim is True:
+            offset = max(min(start for start, _, _ in regions) - flank, 0)
+            end = max(end for _, end, _ in regions) + flank
+            sequence = sequence[offset:end]
+        regions = tuple((start - offset, end - offset, name)
+                        for start, end, name in regions)
+        if seen.setdefault((sequence, regions), otu) != otu:
+            continue
+            # the same sequence with the same regions is already included
+        report['otus'][1] += 1
+        report['bases'][1] += len(sequence)
+        fasta_lines.append(f'>{otu}\n{sequence.decode()}\n')
+        bed_lines.extend(f'{otu}\t{start}\t{end}\t{name}\n'
+                         for start, end, name in regions)
+    _write(f'{bundle}Indexed_bt2/85_otus.fasta', fasta_lines)
+    _write(f'{bundle}Indexed_bt2/annoted_ref.bed', bed_lines)
+    report.update({'flank': flank, 'trim': trim,
+                   'source': {'annoted_ref.bed': checksum(S_ref),
+                              '85_otus.fasta': checksum(input_ref)}})
+    return report
+
+
+def build_bundle(path, bundle, flank=default_flank, trim=True, threads=1):
+    r'''Builds a reduced reference bundle
+
+    The reduced reference files (see reduce_files) and their bowtie2
+    index are written to the Indexed_bt2 folder of the bundle, so the
+    bundle can be used in place of the program path
+    (see VXdetector.workflow).
+
+    Parameters
+    ----------
+    path : str
+        The program filepath with the full reference.
+    bundle : str
+        Directory the bundle is written to.
+    flank : int
+        Bases kept before the first and after the last variable region.
+    trim : Bool
+        Wether or not the sequences are trimmed to their variable regions.
+    threads : int
+        Number of threads bowtie2-build may use.
+
+    Returns
+    -------
+    report : dict
+        See reduce_files. Also written to the bundle.json of the bundle.
+
+    '''
+    bundle = os.path.join(bundle, '')
+    if os.path.exists(f'{bundle}bundle.json'):
+        os.remove(f'{bundle}bundle.json')
+        # the bundle is incomplete until its index was built again
+    report = reduce_files(path, bundle, flank, trim)
+    buildbowtie2(bundle, threads)
+    _write(f'{bundle}bundle.json', [json.dumps(report, indent=1)])
+    # written last, a bundle without it was not completed
+    return report
+
+
+def compare(path, bundle, directory, threads=1):
+    r'''Compares the reduced with the full reference
+
+    Every sample of the directory is analysed with both references.
+
+    Parameters
+    ----------
+    path : str
+        The program filepath with the full reference.
+    bundle : str
+        Directory of the reduced reference bundle.
+    directory : str
+        Directory containing the .fastq (or .fastq.gz) files.
+    threads : int
+        Number of threads given to bowtie2 and samtools.
+
+    Returns
+    -------
+    report : dict
+        'index_size' : bytes of the full and the reduced bowtie2 index.
+        'agreement' : results of the reduced reference compared to the
+            full reference (see Output_counter.agreement).
+
+    '''
+    bundle = os.path.join(bundle, '')
+    buildbowtie2(path, threads)
+    results = {path: dict(), bundle: dict()}
+    for fq_file, read2_file, paired in files_manager.find_samples(directory):
+        for reference in results:
+            results[reference][VXdetector.sample_name(fq_file)] = \
+                VXdetector.analyse_sample(fq_file, read2_file, paired,
+                                          reference, threads)
+    return {'index_size': [scheduler.index_size(path),
+                           scheduler.index_size(bundle)],
+            'agreement': agreement(results[path], results[bundle])}
+
+
+def main():
+    r'''Builds a reduced reference bundle
+
+    Iput otions
+        bundle :
+            Directory the bundle is written to
+        --flank :
+            Bases kept on both sides of the variable regions
+        --no-trim :
+            Keeps the full sequences, only duplicates are removed
+        --compare :
+            Directory of samples the accuracy is compared on
+        -t, --threads :
+            Number of threads of bowtie2-build and bowtie2
+
+    '''
+    parser = argparse.ArgumentParser(
+        prog='vxdetector.reduce_reference', description=(
+            'Builds a smaller reference without duplicate OTUs which '
+            'VXdetector uses with --reference'))
+    parser.add_argument('bundle', help='Directory the bundle is written to')
+    parser.add_argument('--flank', type=int, default=default_flank,
+                        help='Bases kept on both sides of V1 - V9 '
+                        f'(default: {default_flank})')
+    parser.add_argument('--no-trim', dest='trim', action='store_false',
+                        help='Keeps the full sequences of the OTUs')
+    parser.add_argument('--compare', dest='directory', default=None,
+                        help='Reports the difference to the full reference '
+                        'on the samples of this directory')
+    parser.add_argument('-t', '--threads', type=int, default=1,
+                        help='Number of threads of bowtie2')
+    args = parser.parse_args()
+    path = files_manager.get_lib()
+    report = build_bundle(path, args.bundle, args.flank, args.trim,
+                          args.threads)
+    print(f'OTUs: {report["otus"][0]} -> {report["otus"][1]}  '
+          f'bases: {report["bases"][0]} -> {report["bases"][1]}')
+    if args.directory is not None:
+        comparison = compare(path, args.bundle, args.directory, args.threads)
+        full, reduced = comparison['index_size']
+        result = comparison['agreement']
+        print(f'index: {full / 1e6:.1f} MB -> {reduced / 1e6:.1f} MB')
+        print(f'same region in {result["same_region"]:.0%} of '
+              f'{result["samples"]} samples, region columns differ by '
+              f'{result["mean_difference"]:.2f} (max '
+              f'{result["max_difference"]:.2f}) percentage points')
+
+
+if __name__ == '__main__':
+    main()
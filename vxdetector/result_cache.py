@@ -0,0 +1,164 @@
+#!/usr/bin/python
+
+import hashlib
+import json
+import os
+import tempfile
+from vxdetector.files_manager import checksum
+from vxdetector.interact_bowtie2 import min_mapq
+
+cache_version = 1
+# increase if the analysis changes in a way that alters cached results
+pipeline_parameters = {'mapq': min_mapq, 'fraction': 0.5,
+                       'preset': '--fast', 'version': cache_version}
+default_size = 100 * 1024 ** 2
+# default size limit of the cache in bytes
+
+
+def cache_dir(path):
+    r'''Location of the result cache
+
+    Parameters
+    ----------
+    path : str
+        The program filepath.
+
+    Returns
+    -------
+    cache_path : str
+        Directory in which cached results are stored.
+
+    '''
+    return f'{path}Output/cache/'
+
+
+def reference_fingerprint(path):
+    r'''Fingerprint of the reference
+
+    Parameters
+    ----------
+    path : str
+        The program filepath. The directory where it needs to look for
+        the annoted_ref.bed and the 85_otus.fasta the index is built from.
+
+    Returns
+    -------
+    fingerprint : str
+        Combined checksum of both reference files.
+
+    '''
+    return ':'.join([checksum(f'{path}Indexed_bt2/annoted_ref.bed'),
+                     checksum(f'{path}Indexed_bt2/85_otus.fasta')])
+
+
+def sample_key(fq_file, read2_file, paired, fingerprint, parameters=None):
+    r'''Content address of a sample
+
+    Parameters
+    ----------
+    fq_file : str
+        Path to a .fastq file (or .fastq.gz) containing the (forward) reads.
+    read2_file : str
+        Path to the backwards reads. Is disregarded if paired = False.
+    paired : Bool
+        Wether or not the reads are paired.
+    fingerprint : str
+        Fingerprint of the reference (see reference_fingerprint).
+    parameters : dict or None
+        Additional parameters changing the result (e.g. subsampling).
+
+    Returns
+    -------
+    key : str
+        sha256 over the content of the read files, the reference
+        fingerprint and all pipeline parameters.
+
+    '''
+    files = [checksum(fq_file)]
+    if paired is True:
+        files.append(checksum(read2_file))
+    settings = dict(pipeline_parameters, paired=paired,
+                    parameters=parameters)
+    content = json.dumps([files, fingerprint, settings], sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def lookup(cache_path, key):
+    r'''Returns a cached result
+
+    A hit marks the entry as recently used.
+
+    Parameters
+    ----------
+    cache_path : str
+        Directory of the cache.
+    key : str
+        Key of the sample (see sample_key).
+
+    Returns
+    -------
+    new_row : dict or None
+        The cached result or None if the sample is not cached.
+
+    '''
+    entry = f'{cache_path}{key}.json'
+    try:
+        with open(entry, 'r') as f:
+            new_row = json.load(f)
+        os.utime(entry)
+    except (FileNotFoundError, ValueError):
+        return None
+    return new_row
+
+
+def store(cache_path, key, new_row):
+    r'''Stores a result in the cache
+
+    The entry is written under a temporary name and renamed, so
+    concurrent runs never read incomplete entries.
+
+    Parameters
+    ----------
+    cache_path : str
+        Directory of the cache.
+    key : str
+        Key of the sample (see sample_key).
+    new_row : dict
+        Result of the sample.
+
+    '''
+    os.makedirs(cache_path, exist_ok=True)
+    fd, temp_file = tempfile.mkstemp(dir=cache_path, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(new_row, f)
+    os.replace(temp_file, f'{cache_path}{key}.json')
+
+
+def evict(cache_path, max_size=default_size):
+    r'''Removes the least recently used entries
+
+    Parameters
+    ----------
+    cache_path : str
+        Directory of the cache.
+    max_size : int
+        Size limit of the cache in bytes.
+
+    '''
+    if os.path.exists(cache_path) is False:
+        return
+    entries = []
+    for entry in os.scandir(cache_path):
+        if entry.name.endswith('.json'):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    size = sum(entry[1] for entry in entries)
+    for _, entry_size, entry_path in sorted(entries):
+        if size <= max_size:
+            break
+        try:
+            os.remove(entry_path)
+        except FileNotFoundError:
+            pass
+            # already removed by a concurrent run
+        size -= entry_size
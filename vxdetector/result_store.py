@@ -0,0 +1,382 @@
+#!/usr/bin/python
+
+import argparse
+import csv
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import sys
+import time
+from collections import Counter
+from numbers import Real
+from vxdetector.result_cache import pipeline_parameters
+from vxdetector.result_writer import format_value, mode
+
+busy_timeout = 60
+# seconds a writer waits for the lock of a concurrent run
+schema = '''
+CREATE TABLE IF NOT EXISTS runs (
+    run INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    project TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    parameters TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS samples (
+    id INTEGER PRIMARY KEY,
+    run INTEGER NOT NULL REFERENCES runs (run),
+    project TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    sample TEXT NOT NULL,
+    region TEXT,
+    result TEXT NOT NULL,
+    UNIQUE (run, sample)
+);
+CREATE INDEX IF NOT EXISTS samples_key
+    ON samples (project, fingerprint, sample, run);
+CREATE INDEX IF NOT EXISTS samples_region ON samples (region);
+CREATE TABLE IF NOT EXISTS sample_values (
+    id INTEGER NOT NULL REFERENCES samples (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (id, name)
+) WITHOUT ROWID;
+CREATE VIEW IF NOT EXISTS latest AS
+    SELECT * FROM samples AS s
+    WHERE run = (SELECT max(run) FROM samples AS t
+                 WHERE t.project = s.project
+                 AND t.fingerprint = s.fingerprint
+                 AND t.sample = s.sample);
+'''
+# numeric columns are stored once more as rows of sample_values, so
+# averages are computed by SQLite, latest holds the newest result of
+# every sample of a project analysed with the same parameters
+
+
+def store_path(path):
+    r'''Default location of the result store
+
+    Parameters
+    ----------
+    path : str
+        The program filepath.
+
+    Returns
+    -------
+    store_path : str
+        SQLite database in the standard Output folder.
+
+    '''
+    return f'{path}Output/results.sqlite'
+
+
+def parameter_fingerprint(reference_fingerprint, parameters=None):
+    r'''Fingerprint of the settings of a run
+
+    Parameters
+    ----------
+    reference_fingerprint : str
+        Fingerprint of the reference
+        (see result_cache.reference_fingerprint).
+    parameters : dict or None
+        Additional parameters changing the result (e.g. subsampling).
+
+    Returns
+    -------
+    fingerprint : str
+        sha256 over the reference fingerprint and all pipeline
+        parameters. Results with the same fingerprint are comparable.
+
+    '''
+    content = json.dumps([reference_fingerprint, pipeline_parameters,
+                          parameters], sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def connect(filename):
+    r'''Opens the result store
+
+    The database is created if it does not exist. It uses write-ahead
+    logging, so queries never block writers and several runs may
+    append to the same store at once: every sample is written in its
+    own transaction and a writer waits up to busy_timeout seconds for
+    another one.
+
+    Parameters
+    ----------
+    filename : str
+        Filepath to the SQLite database.
+
+    Returns
+    -------
+    connection : sqlite3.Connection
+        Connection to the store.
+
+    '''
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(filename, timeout=busy_timeout,
+                                 isolation_level='IMMEDIATE')
+    connection.execute('PRAGMA journal_mode = WAL')
+    connection.execute('PRAGMA synchronous = NORMAL')
+    # a commit only waits for the log, a crash may lose the last
+    # samples but never corrupts the store
+    connection.execute('PRAGMA foreign_keys = ON')
+    connection.executescript(schema)
+    return connection
+
+
+def start_run(connection, project, fingerprint, parameters=None):
+    r'''Registers a run
+
+    Parameters
+    ----------
+    connection : sqlite3.Connection
+        Connection created by connect.
+    project : str
+        Name of the project, e.g. the name of the input directory.
+    fingerprint : str
+        Fingerprint of the settings (see parameter_fingerprint).
+    parameters : dict or None
+        Parameters of the run, stored for reference.
+
+    Returns
+    -------
+    run : dict
+        'run' : id of the run.
+        'project', 'fingerprint' : as given.
+
+    '''
+    with connection:
+        cursor = connection.execute(
+            'INSERT INTO runs (started, project, fingerprint, parameters) '
+            'VALUES (?, ?, ?, ?)',
+            (time.time(), project, fingerprint,
+             json.dumps(parameters, sort_keys=True)))
+    return {'run': cursor.lastrowid, 'project': project,
+            'fingerprint': fingerprint}
+
+
+def add(connection, run, sample, new_row):
+    r'''Appends the result of a sample
+
+    Parameters
+    ----------
+    connection : sqlite3.Connection
+        Connection created by connect.
+    run : dict
+        Run created by start_run.
+    sample : str
+        Name of the sample.
+    new_row : dict
+        Result of the sample (see Output_counter.create_row).
+
+    '''
+    values = [(name, float(value)) for name, value in new_row.items()
+              if isinstance(value, Real) and not isinstance(value, bool)
+              and not math.isnan(value)]
+    # missing and non-numeric values are skipped like by pandas
+    with connection:
+        connection.execute('DELETE FROM samples WHERE run = ? AND sample = ?',
+                           (run['run'], sample))
+        cursor = connection.execute(
+            'INSERT INTO samples (run, project, fingerprint, sample, region, '
+            'result) VALUES (?, ?, ?, ?, ?, ?)',
+            (run['run'], run['project'], run['fingerprint'], sample,
+             new_row.get('Sequenced variable region'), json.dumps(new_row)))
+        connection.executemany(
+            'INSERT INTO sample_values (id, name, value) VALUES (?, ?, ?)',
+            [(cursor.lastrowid, name, value) for name, value in values])
+
+
+def _where(project=None, region=None, fingerprint=None):
+    # filters on the latest results
+    clauses = []
+    parameters = []
+    for column, value in [('project', project), ('region', region),
+                          ('fingerprint', fingerprint)]:
+        if value is not None:
+            clauses.append(f'{column} = ?')
+            parameters.append(value)
+    if not clauses:
+        return '', parameters
+    return 'WHERE ' + ' AND '.join(clauses), parameters
+
+
+def results(connection, project=None, region=None, fingerprint=None):
+    r'''Latest result of every sample
+
+    Parameters
+    ----------
+    connection : sqlite3.Connection
+        Connection created by connect.
+    project, region, fingerprint : str or None
+        Only samples of this project, whose sequenced variable region
+        is region or which were analysed with these settings.
+
+    Returns
+    -------
+    results : list
+        (project, sample, new_row) tuples sorted by project and sample.
+
+    '''
+    where, parameters = _where(project, region, fingerprint)
+    return [(row[0], row[1], json.loads(row[2])) for row in
+            connection.execute(f'SELECT project, sample, result FROM latest '
+                               f'{where} ORDER BY project, sample',
+                               parameters)]
+
+
+def summary(connection, project=None, region=None, fingerprint=None):
+    r'''Cohort statistics of the stored results
+
+    The statistics are the ones do_statistic of VXdetector writes for
+    a directory, computed over the latest result of every sample.
+
+    Parameters
+    ----------
+    connection : sqlite3.Connection
+        Connection created by connect.
+    project, region, fingerprint : str or None
+        Filters like in results.
+
+    Returns
+    -------
+    summaries : list
+        A dict per project and fingerprint sorted by project:
+        'project', 'fingerprint' : str
+        'samples' : int
+            Number of samples.
+        'average', 'std_dev' : dict
+            Mean and sample standard deviation of every numeric column.
+            'Sequenced variable region' of the average holds the mode.
+
+    '''
+    where, parameters = _where(project, region, fingerprint)
+    summaries = dict()
+    for project, fingerprint, samples in connection.execute(
+            f'SELECT project, fingerprint, count(*) FROM latest {where} '
+            f'GROUP BY project, fingerprint', parameters):
+        summaries[project, fingerprint] = {
+            'project': project, 'fingerprint': fingerprint,
+            'samples': samples, 'average': dict(), 'std_dev': dict(),
+            'regions': Counter()}
+    for project, fingerprint, region, n in connection.execute(
+            f'SELECT project, fingerprint, region, count(*) FROM latest '
+            f'{where} GROUP BY project, fingerprint, region', parameters):
+        if region is not None:
+            summaries[project, fingerprint]['regions'][region] = n
+    for project, fingerprint, name, n, mean, squares in connection.execute(
+            f'''WITH chosen AS (SELECT id, project, fingerprint FROM latest
+                                {where}),
+                     means AS (SELECT project, fingerprint, name,
+                                      count(*) AS n, avg(value) AS mean
+                               FROM chosen JOIN sample_values USING (id)
+                               GROUP BY project, fingerprint, name)
+                SELECT project, fingerprint, name, n, mean,
+                       sum((value - mean) * (value - mean))
+                FROM chosen JOIN sample_values USING (id)
+                JOIN means USING (project, fingerprint, name)
+                GROUP BY project, fingerprint, name''', parameters):
+        statistics = summaries[project, fingerprint]
+        statistics['average'][name] = mean
+        if n > 1:
+            statistics['std_dev'][name] = math.sqrt(squares / (n - 1))
+        # the squared deviations are summed in a second pass over the
+        # values, which is exact unlike the sum of squares
+    for statistics in summaries.values():
+        statistics['average']['Sequenced variable region'] = mode(
+            {'regions': statistics.pop('regions')})
+        if 'Not properly paired' not in statistics['average']:
+            statistics['average']['Not properly paired'] = 'not paired'
+            # adds 'Not properly paired' column if reads are unpaired
+    return [summaries[key] for key in sorted(summaries)]
+
+
+def write_summary(summaries, columns, target):
+    r'''Writes cohort statistics in the csv format of VXdetector
+
+    Parameters
+    ----------
+    summaries : list
+        Statistics returned by summary.
+    columns : list
+        Output columns in their order.
+    target : file object
+        Opened output file (e.g. sys.stdout).
+
+    '''
+    writer = csv.writer(target, lineterminator='\n')
+    writer.writerow(['', 'Project', 'Samples'] + list(columns))
+    for statistics in summaries:
+        for descriptor, row in [('Average', statistics['average']),
+                                ('Standard deviation', statistics['std_dev'])]:
+            writer.writerow([descriptor, statistics['project'],
+                             statistics['samples']]
+                            + [format_value(row.get(column), True)
+                               for column in columns])
+
+
+def main():
+    r'''Prints cohort statistics of a result store
+
+    Iput otions
+        store :
+            SQLite database written by VXdetector --store
+        -p, --project :
+            Only samples of this project
+        -r, --region :
+            Only samples of this sequenced variable region
+        -f, --fingerprint :
+            Only samples analysed with these settings
+        --samples :
+            Prints the latest result of every sample instead
+
+    '''
+    from vxdetector.VXdetector import output_columns, optional_columns
+    parser = argparse.ArgumentParser(prog='vxdetector.result_store',
+                                     description=(
+                                         'Summarizes the results stored by '
+                                         'VXdetector --store'))
+    parser.add_argument('store', help='SQLite database of the results')
+    parser.add_argument('-p', '--project', default=None,
+                        help='Only samples of this project')
+    parser.add_argument('-r', '--region', default=None,
+                        help='Only samples of this sequenced variable region')
+    parser.add_argument('-f', '--fingerprint', default=None,
+                        help='Only samples analysed with these settings')
+    parser.add_argument('--samples', action='store_true',
+                        help='Prints the latest result of every sample')
+    args = parser.parse_args()
+    if os.path.exists(args.store) is False:
+        parser.error(f'"{args.store}" does not exist')
+    connection = connect(args.store)
+    try:
+        filters = (args.project, args.region, args.fingerprint)
+        if args.samples is True:
+            rows = results(connection, *filters)
+            present = set().union(*(new_row for _, _, new_row in rows))
+            columns = output_columns + [column for column in optional_columns
+                                        if column in present]
+            writer = csv.writer(sys.stdout, lineterminator='\n')
+            writer.writerow(['', 'Project'] + columns)
+            for project, sample, new_row in rows:
+                writer.writerow([sample, project]
+                                + [format_value(new_row.get(column))
+                                   for column in columns])
+        else:
+            summaries = summary(connection, *filters)
+            present = set().union(*(statistics['average']
+                                    for statistics in summaries))
+            columns = output_columns + [column for column in optional_columns
+                                        if column in present]
+            write_summary(summaries, columns, sys.stdout)
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+#!/usr/bin/python
+
+import csv
+import json
+import math
+import tempfile
+from collections import Counter
+from numbers import Integral, Real
+
+
+def new_statistics():
+    r'''Creates empty online statistics
+
+    Returns
+    -------
+    statistics : dict
+        'columns' : dict
+            Welford state (n, mean, m2) of every column and wether
+            all its values were numeric.
+        'regions' : collections.Counter
+            Occurences of every 'Sequenced variable region'.
+
+    '''
+    return {'columns': dict(), 'regions': Counter()}
+
+
+def update_statistics(statistics, new_row):
+    r'''Adds a sample to the online statistics
+
+    Mean and variance are updated with Welford's algorithm, so memory
+    does not grow with the number of samples.
+
+    Parameters
+    ----------
+    statistics : dict
+        Statistics created by new_statistics.
+    new_row : dict
+        Result of a sample (see Output_counter.create_row).
+
+    '''
+    for column, value in new_row.items():
+        state = statistics['columns'].setdefault(
+            column, {'n': 0, 'mean': 0.0, 'm2': 0.0, 'numeric': True})
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            continue
+            # missing values are skipped like by pandas
+        if isinstance(value, bool) or not isinstance(value, Real):
+            state['numeric'] = False
+            continue
+        value = float(value)
+        state['n'] += 1
+        delta = value - state['mean']
+        state['mean'] += delta / state['n']
+        state['m2'] += delta * (value - state['mean'])
+    region = new_row.get('Sequenced variable region')
+    if region is not None:
+        statistics['regions'][region] += 1
+
+
+def remove_statistics(statistics, new_row):
+    r'''Removes a sample added before from the online statistics
+
+    Parameters
+    ----------
+    statistics : dict
+        Statistics the sample was added to with update_statistics.
+    new_row : dict
+        The result added before.
+
+    '''
+    for column, value in new_row.items():
+        state = statistics['columns'][column]
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            continue
+        if isinstance(value, bool) or not isinstance(value, Real):
+            continue
+            # a column stays non-numeric once it held a string
+        value = float(value)
+        state['n'] -= 1
+        if state['n'] == 0:
+            state['mean'] = 0.0
+            state['m2'] = 0.0
+            continue
+        delta = value - state['mean']
+        state['mean'] -= delta / state['n']
+        state['m2'] -= delta * (value - state['mean'])
+        # reverses the Welford step of update_statistics
+    region = new_row.get('Sequenced variable region')
+    if region is not None:
+        statistics['regions'][region] -= 1
+        if statistics['regions'][region] == 0:
+            del statistics['regions'][region]
+
+
+def mode(statistics):
+    r'''Most common sequenced variable region(s)
+
+    Returns
+    -------
+    region : str
+        All regions with the highest count in sorted order joined by " / ".
+
+    '''
+    if not statistics['regions']:
+        return ''
+    highest = max(statistics['regions'].values())
+    return ' / '.join(sorted(str(region) for region, n
+                             in statistics['regions'].items()
+                             if n == highest))
+
+
+def statistic_rows(statistics, columns):
+    r'''Average and standard deviation rows
+
+    Parameters
+    ----------
+    statistics : dict
+        Statistics updated with every sample.
+    columns : list
+        Output columns.
+
+    Returns
+    -------
+    average, std_dev : dict
+        Mean and sample standard deviation of every numeric column.
+        'Sequenced variable region' holds the mode and a non-numeric
+        'Not properly paired' column the value 'not paired'.
+
+    '''
+    average = dict()
+    std_dev = dict()
+    for column in columns:
+        state = statistics['columns'].get(column)
+        if state is None or state['numeric'] is False or state['n'] == 0:
+            continue
+        average[column] = state['mean']
+        if state['n'] > 1:
+            std_dev[column] = math.sqrt(state['m2'] / (state['n'] - 1))
+    average['Sequenced variable region'] = mode(statistics)
+    if 'Not properly paired' not in average:
+        average['Not properly paired'] = 'not paired'
+        # adds 'Not properly paired' column if reads are unpaired
+    return average, std_dev
+
+
+def format_value(value, as_float=False):
+    r'''Formats a cell like pandas.DataFrame.to_csv
+
+    Parameters
+    ----------
+    value :
+        Cell value.
+    as_float : Bool
+        Wether or not integers are written as floats (numeric columns
+        of a directory are float columns because of the average row).
+
+    Returns
+    -------
+    cell : str
+        The formatted value, missing values are empty.
+
+    '''
+    if value is None:
+        return ''
+    if isinstance(value, Integral) and not isinstance(value, bool):
+        return repr(float(value)) if as_float else str(int(value))
+    if isinstance(value, Real) and not isinstance(value, bool):
+        return '' if math.isnan(value) else repr(float(value))
+    return str(value)
+
+
+def start(temp_dir=None):
+    r'''Starts writing results
+
+    Every result is appended to a spool file as soon as the sample is
+    analysed. Only the sample names and their position in the spool
+    file are kept in memory.
+
+    Parameters
+    ----------
+    temp_dir : str or None
+        Directory the spool file is created in.
+
+    Returns
+    -------
+    writer : dict
+        'spool' : file object of the spool file.
+        'index' : dict
+            Offset of the latest result of every sample name.
+        'statistics' : online statistics (see new_statistics).
+        'columns' : all columns seen so far.
+
+    '''
+    return {'spool': tempfile.TemporaryFile('w+', dir=temp_dir),
+            'index': dict(), 'statistics': new_statistics(), 'columns': dict()}
+
+
+def add(writer, name, new_row):
+    r'''Writes the result of a sample
+
+    A result added for the same name again replaces the previous one,
+    which is removed from the statistics.
+
+    Parameters
+    ----------
+    writer : dict
+        Writer created by start.
+    name : str
+        Name of the sample.
+    new_row : dict
+        Result of the sample.
+
+    '''
+    spool = writer['spool']
+    if name in writer['index']:
+        spool.seek(writer['index'][name])
+        remove_statistics(writer['statistics'], json.loads(spool.readline()))
+    spool.seek(0, 2)
+    writer['index'][name] = spool.tell()
+    spool.write(json.dumps(new_row) + '\n')
+    spool.flush()
+    update_statistics(writer['statistics'], new_row)
+    writer['columns'].update(dict.fromkeys(new_row))
+
+
+def finish(writer, targets, columns, single_file):
+    r'''Writes the collected results to all targets in one pass
+
+    The output is the same as do_output of VXdetector: a header, the
+    average and standard deviation rows (directories only) and the
+    samples sorted by name.
+
+    Parameters
+    ----------
+    writer : dict
+        Writer created by start.
+    targets : list
+        Filepaths or open file objects (e.g. sys.stdout).
+    columns : list
+        Output columns in their order.
+    single_file : Bool
+        Signifies wether a directory or a single file was given.
+
+    '''
+    statistics = writer['statistics']
+    numeric = {column for column, state in statistics['columns'].items()
+               if state['numeric'] is True and state['n'] > 0}
+    as_float = single_file is False
+    files = []
+    try:
+        for target in targets:
+            if isinstance(target, str):
+                files.append(open(target, 'w', newline=''))
+            else:
+                files.append(target)
+        writers = [csv.writer(f, lineterminator='\n') for f in files]
+
+        def write(row):
+            for csv_writer in writers:
+                csv_writer.writerow(row)
+
+        write([''] + list(columns))
+        if single_file is False and writer['index']:
+            average, std_dev = statistic_rows(statistics, columns)
+            for descriptor, row in [('Average', average),
+                                    ('Standard deviation', std_dev)]:
+                write([descriptor] + [format_value(row.get(column), True)
+                                      for column in columns])
+        spool = writer['spool']
+        for name, offset in sorted(writer['index'].items()):
+            spool.seek(offset)
+            new_row = json.loads(spool.readline())
+            write([name] + [format_value(new_row.get(column),
+                                         as_float and column in numeric)
+                            for column in columns])
+    finally:
+        for f, target in zip(files, targets):
+            if isinstance(target, str):
+                f.close()
+            else:
+                f.flush()
+        writer['spool'].close()
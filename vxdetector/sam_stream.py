@@ -0,0 +1,271 @@
+#!/usr/bin/python
+
+import contextlib
+import os
+import re
+import subprocess
+import threading
+import vxdetector.Output_counter as Output_counter
+import vxdetector.pipeline as pipeline
+import vxdetector.bowtie2_stats as bowtie2_stats
+import vxdetector.interval_overlap as interval_overlap
+import vxdetector.decompress as decompress
+import vxdetector.read_output as read_output
+from vxdetector.interact_bowtie2 import min_mapq, tool_path
+from vxdetector.Output_counter import regions_list
+
+cigar_pattern = re.compile(r'(\d+)([MIDNSHP=X])')
+
+
+def reference_length(cigar):
+    r'''Length of an alignment on the reference
+
+    Parameters
+    ----------
+    cigar : str
+        CIGAR string of a SAM record.
+
+    Returns
+    -------
+    length : int
+        Number of reference bases covered by the alignment.
+
+    '''
+    return sum(int(length) for length, op in cigar_pattern.findall(cigar)
+               if op in 'MDN=X')
+
+
+def _filtered_records(lines):
+    # yields (name, flag, chrom, start, end) of all mapped records with
+    # the required mapping-quality
+    for line in lines:
+        if line.startswith('@'):
+            continue
+        fields = line.split('\t', 6)
+        flag = int(fields[1])
+        if flag & 4 or int(fields[4]) < min_mapq:
+            continue
+        start = int(fields[3]) - 1
+        yield (fields[0], flag, fields[2], start,
+               start + reference_length(fields[5]))
+
+
+def _pairs(records, counts, names=False):
+    # mates have to follow each other like for "bedtools bamtobed -bedpe".
+    # Reads without their mate are counted as not properly paired.
+    pending = None
+    for record in records:
+        if pending is None:
+            if record[1] & 1:
+                pending = record
+            continue
+        if pending[0] != record[0]:
+            counts['not_paired'] += 1
+            pending = record if record[1] & 1 else None
+            continue
+        mate1 = pending[2:]
+        mate2 = record[2:]
+        pending = None
+        if (mate1[0], mate1[1]) > (mate2[0], mate2[1]):
+            mate1 = mate2
+            # bamtobed reports the leftmost mate first
+        counts['intervals'] += 1
+        yield mate1 + record[:1] if names is True else mate1
+        # the name is only needed by the per-read output
+    if pending is not None:
+        counts['not_paired'] += 1
+
+
+def _singles(records, counts, names=False):
+    for record in records:
+        counts['intervals'] += 1
+        yield record[2:] + record[:1] if names is True else record[2:]
+
+
+def iter_counts(lines, reference, paired, size=None, reads=None):
+    r'''Counts variable regions in a SAM stream chunk by chunk
+
+    The SAM records are filtered, paired and classified while they
+    are read, so memory use does not depend on the number of reads.
+
+    Parameters
+    ----------
+    lines : iterable
+        Lines of a SAM file (e.g. the bowtie2 stdout).
+    reference : dict
+        Variable region reference created by
+        interval_overlap.load_reference.
+    paired : Bool
+        Wether or not the reads have paired mates.
+    size : int or None
+        Number of reads (pairs) classified at once.
+        Default is interval_overlap.chunk_size.
+    reads : dict or None
+        Writer of the per-read output (see read_output.start).
+
+    Returns
+    -------
+    counts : generator
+        Yields the running counts (see count_sam) after every chunk
+        and once more after the stream ended.
+
+    '''
+    counts = {'regions': dict.fromkeys(regions_list, 0), 'no_overlap': 0,
+              'not_paired': 0, 'intervals': 0}
+    records = _filtered_records(lines)
+    if paired is True:
+        records = _pairs(records, counts, reads is not None)
+    else:
+        records = _singles(records, counts, reads is not None)
+    chunks = interval_overlap.to_chunks(records, size)
+    for chroms, starts, ends, *names in chunks:
+        hits, no_overlap = interval_overlap.classify(reference, chroms,
+                                                     starts, ends)
+        if reads is not None:
+            read_output.add(reads, names[0], chroms, starts, ends, hits)
+        for region, hit in zip(regions_list, hits.sum(axis=0)):
+            counts['regions'][region] += int(hit)
+        counts['no_overlap'] += int(no_overlap.sum())
+        yield counts
+    yield counts
+
+
+def count_sam(lines, reference, paired, reads=None):
+    r'''Counts variable regions in a SAM stream
+
+    Parameters
+    ----------
+    lines : iterable
+        Lines of a SAM file (e.g. the bowtie2 stdout).
+    reference : dict
+        Variable region reference created by
+        interval_overlap.load_reference.
+    paired : Bool
+        Wether or not the reads have paired mates.
+    reads : dict or None
+        Writer of the per-read output (see read_output.start).
+
+    Returns
+    -------
+    counts : dict
+        'regions' : dict
+            Occurences of every variable region.
+        'no_overlap' : int
+            Number of reads (pairs) not aligned to a variable region.
+        'not_paired' : int
+            Number of reads whose mate was missing.
+        'intervals' : int
+            Number of reads (pairs) which passed the filters.
+
+    '''
+    for counts in iter_counts(lines, reference, paired, reads=reads):
+        pass
+    return counts
+
+
+def stream_bowtie2(fasta_file, read2_file, path, paired, threads=1,
+                   reads=None, timeout=None):
+    r'''Maps reads and counts variable regions without intermediate files
+
+    bowtie2 writes SAM to a pipe which is consumed by count_sam while the
+    alignment is still running. The bowtie2 summary is parsed from
+    stderr instead of a log file (see bowtie2_stats.parse_line).
+
+    Parameters
+    ----------
+    fasta_file : str
+        Path to a .fastq file (or .fastq.gz). This file contains the (forward)
+        reads which are mapped against the reference.
+    read2_file : str
+        Path to a .fastq file (or .fastq.gz) containing backwards reads.
+        Is disregarded if paired = False.
+    path : str
+        The program filepath. The directory where it needs to look
+        for the index files and the annoted_ref.bed.
+    paired : Bool
+        Dictates wether bowtie2 alignes paired or unpaired reads.
+    threads : int
+        Number of threads given to bowtie2.
+    reads : dict or None
+        Writer of the per-read output (see read_output.start).
+    timeout : float or None
+        Seconds after which bowtie2 and the decompression are killed
+        and a TimeoutError is raised.
+
+    Returns
+    -------
+    counts : dict
+        See count_sam.
+    stats : dict
+        Parsed alignment summary of bowtie2.
+    Error : Bool
+        Wether or not bowtie2 ended with an error.
+
+    '''
+    index_path = f'{path}Indexed_bt2/bowtie2'
+    if os.path.exists(f'{index_path}.1.bt2') is False:
+        raise FileNotFoundError(f'No Index files found under "{index_path}"')
+        # raises an Exception if the Index files cannot be found
+    decompressor, read_args = decompress.command(fasta_file, read2_file,
+                                                 paired, threads)
+    cmd = [tool_path('bowtie2'), '-p', str(threads), '--mm',
+           '-x', index_path, '--fast'] + read_args
+    reference = interval_overlap.load_reference(path)
+    stats = dict()
+    with contextlib.ExitStack() as stack:
+        source = None
+        if decompressor is not None:
+            source = stack.enter_context(pipeline.spawn(
+                decompressor, timeout, stdout=subprocess.PIPE))
+            # the reads are decompressed outside of bowtie2
+            # (see decompress.command)
+        process = stack.enter_context(pipeline.spawn(
+            cmd, timeout, stdin=None if source is None else source.stdout,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True))
+        if source is not None:
+            source.stdout.close()
+            # bowtie2 holds its own copy of the pipe
+        drain = threading.Thread(target=lambda: [
+            bowtie2_stats.parse_line(stats, line)
+            for line in process.stderr])
+        drain.start()
+        # reads stderr in the background so the pipe can not block
+        # bowtie2
+        counts = count_sam(process.stdout, reference, paired, reads)
+        drain.join()
+        process.wait()
+        if source is not None and process.returncode != 0:
+            source.kill()
+            # bowtie2 stopped reading
+    # both programs are killed on a timeout or an Exception
+    # (e.g. KeyboardInterrupt)
+    Error = process.returncode != 0 or not bowtie2_stats.complete(stats) \
+        or (source is not None and source.returncode != 0)
+    # Checks if bowtie2 or the decompression exited with an error
+    return counts, stats, Error
+
+
+def create_row(stats, paired, counts):
+    r'''Creates the Output of a streamed sample
+
+    Parameters
+    ----------
+    stats : dict
+        Parsed alignment summary of bowtie2.
+    paired : Bool
+        Wether or not the reads have paired mates.
+    counts : dict
+        Counts returned by count_sam.
+
+    Returns
+    -------
+    new_row : dict
+        Dictionary containing all analysed information about current read file
+        (see Output_counter.create_row).
+
+    '''
+    new_row = bowtie2_stats.create_row(stats)
+    return Output_counter.region_count(None, paired, new_row,
+                                       dict(counts['regions']),
+                                       counts['no_overlap'],
+                                       counts['not_paired'])
@@ -0,0 +1,148 @@
+#!/usr/bin/python
+
+import os
+from glob import glob
+
+pipeline_buffer = 512 * 1024 ** 2
+# estimated memory (in bytes) used by one sample in addition to
+# the bowtie2 index: bowtie2 read buffers, samtools and bedtools
+
+
+def available_cpus():
+    r'''Counts usable cores
+
+    Returns
+    -------
+    cpus : int
+        Number of cores this process is allowed to run on.
+
+    '''
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def available_memory():
+    r'''Reads the available memory
+
+    Returns
+    -------
+    memory : int or None
+        Available physical memory in bytes. None if it cannot be
+        determined on this platform.
+
+    '''
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def index_size(path):
+    r'''Size of the bowtie2 index
+
+    Parameters
+    ----------
+    path : str
+        The program filepath. The directory where it needs to look
+        for the index files.
+
+    Returns
+    -------
+    size : int
+        Summed size of all index files in bytes.
+
+    '''
+    return sum(os.path.getsize(f) for f in
+               glob(f'{path}Indexed_bt2/bowtie2*.bt2'))
+
+
+def sample_memory(path):
+    r'''Estimates the memory cost of a single sample
+
+    Every bowtie2 process loads the whole index, so the cost of one
+    sample is the size of the index plus the buffers of the pipeline.
+
+    Parameters
+    ----------
+    path : str
+        The program filepath. The directory where it needs to look
+        for the index files.
+
+    Returns
+    -------
+    memory : int
+        Estimated memory in bytes needed to analyse one sample.
+
+    '''
+    return index_size(path) + pipeline_buffer
+
+
+def plan(threads, samples, memory_per_sample, memory=None, jobs=None):
+    r'''Splits a core budget between samples
+
+    The number of samples processed at the same time is limited by
+    the core budget, the number of samples, the available memory
+    and (if given) the user requested number of jobs. All remaining
+    cores are handed to bowtie2 and samtools of each sample, which
+    share them (see split_threads).
+
+    Parameters
+    ----------
+    threads : int
+        Total number of cores which may be used.
+    samples : int
+        Number of samples which need to be analysed.
+    memory_per_sample : int
+        Estimated memory in bytes needed to analyse one sample.
+    memory : int or None
+        Available memory in bytes. If None memory is not limiting.
+    jobs : int or None
+        Upper limit of samples processed at the same time.
+
+    Returns
+    -------
+    workers : int
+        Number of samples processed at the same time.
+    threads_per_sample : int
+        Number of cores of every sample, split between bowtie2 and
+        samtools by split_threads.
+
+    '''
+    threads = max(1, threads)
+    workers = min(threads, max(1, samples))
+    if jobs is not None:
+        workers = min(workers, max(1, jobs))
+    if memory is not None and memory_per_sample > 0:
+        workers = min(workers, max(1, memory // memory_per_sample))
+        # never starts more samples than fit into memory
+    threads_per_sample = max(1, threads // workers)
+    return workers, threads_per_sample
+
+
+def split_threads(threads, compress=True):
+    r'''Splits the cores of a sample between bowtie2 and samtools
+
+    samtools view only needs threads of its own to compress BAM, a
+    quarter of the cores are given to it then. The single main thread
+    of samtools mostly waits for bowtie2 and is not counted below four
+    cores.
+
+    Parameters
+    ----------
+    threads : int
+        Number of cores of the sample (see plan).
+    compress : Bool
+        Wether or not samtools writes compressed BAM.
+
+    Returns
+    -------
+    bowtie2_threads : int
+        Number of threads given to bowtie2 ("-p").
+    samtools_threads : int
+        Number of additional samtools threads ("-@").
+
+    '''
+    threads = max(1, threads)
+    samtools = threads // 4 if compress is True else 0
+    return threads - samtools, max(0, samtools - 1)
@@ -0,0 +1,319 @@
+#!/usr/bin/python
+
+import argparse
+import json
+import mmap
+import os
+import socketserver
+import stat
+import sys
+import threading
+from glob import glob
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import vxdetector.VXdetector as VXdetector
+import vxdetector.bowtie2_stats as bowtie2_stats
+import vxdetector.files_manager as files_manager
+
+max_request_size = 1024 ** 2
+# requests only contain file paths
+
+
+def map_index(path):
+    r'''Memory-maps the bowtie2 index
+
+    bowtie2 runs with --mm, so every bowtie2 process maps the same
+    files. While the server holds the maps, the pages of the index stay
+    in the page cache and the processes start without reading it again.
+
+    Parameters
+    ----------
+    path : str
+        Directory containing the Indexed_bt2 folder.
+
+    Returns
+    -------
+    maps : list
+        Read-only mmap.mmap of every part of the index.
+
+    '''
+    maps = []
+    for part in sorted(glob(f'{path}Indexed_bt2/bowtie2*.bt2')):
+        if os.path.getsize(part) == 0:
+            continue
+            # empty files cannot be mapped
+        with open(part, 'rb') as f:
+            index_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(index_map, 'madvise'):
+            index_map.madvise(mmap.MADV_WILLNEED)
+            # reads the index ahead of the first sample
+        maps.append(index_map)
+    return maps
+
+
+def start(path, threads=1, jobs=1, overlap_engine='native', stream=False,
+          engine='bowtie2', alignment_stats=False):
+    r'''Loads everything the requests share
+
+    Parameters
+    ----------
+    path : str
+        Directory containing the Indexed_bt2 folder
+        (see VXdetector.find_reference).
+    threads : int
+        Number of threads given to bowtie2 and samtools of every sample.
+    jobs : int
+        Number of samples analysed at the same time. Further requests
+        wait until a sample is finished.
+    overlap_engine, stream, engine :
+        See VXdetector.analyse_sample. The in-process overlap engine
+        keeps the variable regions loaded between the requests.
+    alignment_stats : Bool
+        Wether or not the columns of the bowtie2 alignment summary
+        are returned.
+
+    Returns
+    -------
+    settings : dict
+        Settings of the server and the loaded references.
+
+    '''
+    VXdetector.prepare_reference(path, None, overlap_engine, stream,
+                                 None, engine)
+    maps = map_index(path) if engine == 'bowtie2' else []
+    return {'path': path, 'threads': threads, 'overlap_engine': overlap_engine,
+            'stream': stream, 'engine': engine,
+            'alignment_stats': alignment_stats, 'maps': maps,
+            'slots': threading.BoundedSemaphore(jobs)}
+
+
+def analyse(settings, request):
+    r'''Analyses the sample of a request
+
+    Parameters
+    ----------
+    settings : dict
+        Settings created by start.
+    request : dict
+        'fq_file' : path to the .fastq file (or .fastq.gz) containing the
+            (forward) reads.
+        'read2_file' : optional path to the backward reads. If it is not
+            given the reverse read file is searched like by VXdetector.
+
+    Returns
+    -------
+    response : dict
+        'sample' : name of the sample.
+        'result' : result of the sample (see Output_counter.create_row).
+
+    Raises
+    ------
+    ValueError
+        If the request is invalid, the file does not look like a fastq
+        file or has no reads of the required mapping-quality.
+    FileNotFoundError
+        If a read file does not exist.
+
+    '''
+    if not isinstance(request, dict) \
+       or not isinstance(request.get('fq_file'), str):
+        raise ValueError('The request needs a "fq_file"')
+    fq_file = request['fq_file']
+    read2_file = request.get('read2_file')
+    if read2_file is None:
+        read2_file, paired = VXdetector.find_read2(fq_file)
+    else:
+        paired = True
+    for read_file in [fq_file, read2_file] if paired else [fq_file]:
+        if os.path.isfile(read_file) is False:
+            raise FileNotFoundError(f'"{read_file}" does not exist')
+    with settings['slots']:
+        new_row = VXdetector.analyse_sample(
+            fq_file, read2_file, paired, settings['path'],
+            settings['threads'], overlap_engine=settings['overlap_engine'],
+            stream=settings['stream'], strict=True, engine=settings['engine'])
+    if settings['alignment_stats'] is False:
+        new_row = {key: value for key, value in new_row.items()
+                   if key not in bowtie2_stats.columns}
+    return {'sample': VXdetector.sample_name(fq_file), 'result': new_row}
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    r'''Answers the requests of the server
+
+    GET /health returns the settings of the server, POST /analyse
+    analyses the sample of a JSON request (see analyse).
+
+    '''
+    server_version = 'vxdetector'
+
+    def reply(self, status, body):
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        if self.path != '/health':
+            self.reply(404, {'error': f'Unknown path "{self.path}"'})
+            return
+        settings = self.server.settings
+        self.reply(200, {'status': 'ok', 'engine': settings['engine'],
+                         'overlap_engine': settings['overlap_engine'],
+                         'reference': settings['path']})
+
+    def do_POST(self):
+        if self.path != '/analyse':
+            self.reply(404, {'error': f'Unknown path "{self.path}"'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            if length > max_request_size:
+                raise ValueError('The request is too large')
+            request = json.loads(self.rfile.read(length) or b'null')
+            response = analyse(self.server.settings, request)
+        except (ValueError, FileNotFoundError) as e:
+            self.reply(400, {'error': str(e)})
+            return
+        except Exception as e:
+            self.reply(500, {'error': f'{type(e).__name__}: {e}'})
+            return
+            # e.g. bowtie2 was killed, the server keeps running
+        self.reply(200, response)
+
+    def address_string(self):
+        if isinstance(self.client_address, tuple):
+            return super().address_string()
+        return 'unix socket'
+        # clients of a unix socket have no address
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn,
+                     socketserver.UnixStreamServer):
+    r'''HTTP server listening on a unix socket'''
+    daemon_threads = True
+
+
+def remove_socket(socket_path):
+    r'''Removes the unix socket of a stopped server
+
+    Parameters
+    ----------
+    socket_path : str
+        Filepath of the socket. Nothing happens if it does not exist.
+
+    Raises
+    ------
+    FileExistsError
+        If the path is no socket (e.g. a mistyped --socket), no other
+        file is ever removed.
+
+    '''
+    try:
+        mode = os.lstat(socket_path).st_mode
+    except FileNotFoundError:
+        return
+    if stat.S_ISSOCK(mode) is False:
+        raise FileExistsError(f'"{socket_path}" exists and is no socket')
+    os.remove(socket_path)
+
+
+def make_server(settings, socket_path=None, host='127.0.0.1', port=8765):
+    r'''Creates the server
+
+    Parameters
+    ----------
+    settings : dict
+        Settings created by start.
+    socket_path : str or None
+        If given the server listens on this unix socket, otherwise on
+        host and port.
+    host : str
+        Address the server listens on, only local clients by default.
+    port : int
+        Port the server listens on, 0 picks a free port.
+
+    Returns
+    -------
+    server : socketserver.BaseServer
+        Server which is started with serve_forever.
+
+    '''
+    if socket_path is not None:
+        remove_socket(socket_path)
+        # the socket of a server which was stopped
+        server = UnixHTTPServer(socket_path, RequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), RequestHandler)
+    server.settings = settings
+    return server
+
+
+def main():
+    r'''Starts the server
+
+    Iput otions
+        -s, --socket :
+            Unix socket the server listens on
+        --host, --port :
+            Local address the server listens on otherwise
+        -j, --jobs :
+            Number of samples analysed at the same time
+        -t, --threads :
+            Number of threads of bowtie2 and samtools per sample
+        --overlap-engine, --stream, --engine, --reference,
+        --alignment-stats :
+            See VXdetector
+
+    '''
+    parser = argparse.ArgumentParser(prog='vxdetector.server', description=(
+        'Keeps the references loaded and analyses samples on request. '
+        'POST {"fq_file": ...} to /analyse.'))
+    parser.add_argument('-s', '--socket', dest='socket_path', default=None,
+                        help='Unix socket the server listens on')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='Address the server listens on '
+                        '(default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765,
+                        help='Port the server listens on (default: 8765)')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Number of samples analysed at the same time')
+    parser.add_argument('-t', '--threads', type=int, default=1,
+                        help='Number of threads of bowtie2 and samtools '
+                        'per sample')
+    parser.add_argument('--overlap-engine', dest='overlap_engine',
+                        choices=['bedtools', 'native'], default='native',
+                        help='Intersects the reads with bedtools or with the '
+                        'in-process engine (default)')
+    parser.add_argument('--stream', action='store_true',
+                        help='Counts the bowtie2 output without '
+                        'intermediate files')
+    parser.add_argument('--engine', choices=['bowtie2', 'kmer'],
+                        default='bowtie2',
+                        help='Aligns the reads with bowtie2 or classifies '
+                        'them by their k-mers')
+    parser.add_argument('--reference', default=None,
+                        help='Directory of a reduced reference bundle')
+    parser.add_argument('--alignment-stats', dest='alignment_stats',
+                        action='store_true',
+                        help='Adds the bowtie2 alignment summary')
+    args = parser.parse_args()
+    path = VXdetector.find_reference(files_manager.get_lib(), args.reference)
+    settings = start(path, args.threads, args.jobs, args.overlap_engine,
+                     args.stream, args.engine, args.alignment_stats)
+    server = make_server(settings, args.socket_path, args.host, args.port)
+    print(f'listening on {args.socket_path or server.server_address}',
+          file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket_path is not None:
+            remove_socket(args.socket_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,309 @@
+#!/usr/bin/python
+
+import gzip
+import io
+import os
+import random
+import subprocess
+import threading
+import zlib
+from itertools import islice, zip_longest
+from statistics import NormalDist
+import vxdetector.interval_overlap as interval_overlap
+import vxdetector.pipeline as pipeline
+import vxdetector.sam_stream as sam_stream
+import vxdetector.bowtie2_stats as bowtie2_stats
+from vxdetector.interact_bowtie2 import tool_path
+
+batch_size = 10000
+# reads (pairs) fed to bowtie2 between two convergence checks
+input_errors = (OSError, EOFError, zlib.error)
+# raised while reading a truncated, corrupt or unpaired input
+
+
+def read_fastq(fq_file):
+    r'''FASTQ reader
+
+    Parameters
+    ----------
+    fq_file : str
+        Path to a .fastq file (or .fastq.gz).
+
+    Returns
+    -------
+    records : generator
+        Yields every record as bytes (four lines).
+
+    '''
+    opener = gzip.open if fq_file.endswith('.gz') else open
+    with opener(fq_file, 'rb') as f:
+        while True:
+            record = b''.join(islice(f, 4))
+            if not record:
+                return
+            yield record
+
+
+def read_records(fq_file, read2_file, paired):
+    r'''Reads (pairs of) FASTQ records
+
+    Parameters
+    ----------
+    fq_file : str
+        Path to a .fastq file (or .fastq.gz) containing the (forward) reads.
+    read2_file : str
+        Path to a .fastq file (or .fastq.gz) containing backwards reads.
+        Is disregarded if paired = False.
+    paired : Bool
+        Wether or not the reads are paired.
+
+    Returns
+    -------
+    records : generator
+        Yields single records or both mates joined (interleaved).
+
+    Raises
+    ------
+    EOFError
+        If both files contain a different number of reads.
+
+    '''
+    if paired is True:
+        for mate1, mate2 in zip_longest(read_fastq(fq_file),
+                                        read_fastq(read2_file)):
+            if mate1 is None or mate2 is None:
+                raise EOFError(f'"{fq_file}" and "{read2_file}" contain a '
+                               f'different number of reads')
+            yield mate1 + mate2
+    else:
+        yield from read_fastq(fq_file)
+
+
+def reservoir(records, reads, seed=0):
+    r'''Deterministic reservoir sample
+
+    Parameters
+    ----------
+    records : iterable
+        FASTQ records (see read_records).
+    reads : int
+        Number of records in the sample.
+    seed : int
+        Seed of the random number generator. The same seed always
+        yields the same sample.
+
+    Returns
+    -------
+    sample : list
+        At most reads records in the order of the input.
+    total : int
+        Number of records in the input.
+
+    '''
+    rng = random.Random(seed)
+    sample = []
+    total = 0
+    for total, record in enumerate(records, start=1):
+        if len(sample) < reads:
+            sample.append((total, record))
+        else:
+            j = rng.randrange(total)
+            if j < reads:
+                sample[j] = (total, record)
+    sample.sort()
+    # keeps the order of the input
+    return [record for _, record in sample], total
+
+
+def confidence_width(counts, confidence=0.95):
+    r'''Half width of the confidence intervals of all proportions
+
+    The proportion of every variable region and of reads not aligned
+    to a variable region is estimated from the reads counted so far.
+
+    Parameters
+    ----------
+    counts : dict
+        Running counts as yielded by sam_stream.iter_counts.
+    confidence : float
+        Confidence level of the intervals.
+
+    Returns
+    -------
+    width : float
+        Largest half width (normal approximation) over all proportions
+        in percentage points. Infinite if nothing was counted yet.
+
+    '''
+    values = list(counts['regions'].values()) + [counts['no_overlap']]
+    total = sum(values)
+    if total == 0:
+        return float('inf')
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    return max(z * (p * (1 - p) / total) ** 0.5 * 100
+               for p in (v / total for v in values))
+
+
+def align_records(records, path, paired, threads=1, tolerance=None,
+                  confidence=0.95, timeout=None):
+    r'''Feeds FASTQ records to bowtie2 and counts variable regions
+
+    The records are written to the stdin of a single bowtie2 process
+    in batches of batch_size. If a tolerance is given no further
+    batches are written once every proportion is known within the
+    tolerance, the reads already written are still counted.
+
+    Parameters
+    ----------
+    records : iterable
+        FASTQ records (see read_records).
+    path : str
+        The program filepath.
+    paired : Bool
+        Wether or not the records contain both mates.
+    threads : int
+        Number of threads given to bowtie2.
+    tolerance : float or None
+        Half width of the confidence intervals (in percentage points)
+        at which the alignment stops. If None all records are aligned.
+    confidence : float
+        Confidence level of the intervals.
+    timeout : float or None
+        Seconds after which bowtie2 is killed and a TimeoutError is
+        raised.
+
+    Returns
+    -------
+    counts : dict
+        See sam_stream.count_sam.
+    stats : dict
+        Parsed alignment summary of bowtie2.
+    Error : Bool
+        Wether or not bowtie2 ended with an error or the records could
+        not be read (see input_errors).
+
+    '''
+    index_path = f'{path}Indexed_bt2/bowtie2'
+    if os.path.exists(f'{index_path}.1.bt2') is False:
+        raise FileNotFoundError(f'No Index files found under "{index_path}"')
+    cmd = [tool_path('bowtie2'), '-p', str(threads), '--mm',
+           '-x', index_path, '--fast']
+    if paired is True:
+        cmd += ['--interleaved', '-']
+    else:
+        cmd += ['-q', '-U', '-']
+    reference = interval_overlap.load_reference(path)
+    stop = threading.Event()
+    stats = dict()
+    failed = []
+
+    def feed(stdin):
+        try:
+            records_iter = iter(records)
+            while not stop.is_set():
+                batch = list(islice(records_iter, batch_size))
+                if not batch:
+                    break
+                stdin.write(b''.join(batch))
+                stdin.flush()
+        except BrokenPipeError:
+            pass
+            # bowtie2 ended early, the error is found in its summary
+        except Exception as error:
+            failed.append(error)
+            # bowtie2 would count the reads written so far as a
+            # complete sample
+        finally:
+            try:
+                stdin.close()
+            except BrokenPipeError:
+                pass
+
+    with pipeline.spawn(cmd, timeout, stdin=subprocess.PIPE,
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.PIPE) as process:
+        feeder = threading.Thread(target=feed, args=(process.stdin,))
+        drain = threading.Thread(target=lambda: [
+            bowtie2_stats.parse_line(stats, line)
+            for line in io.TextIOWrapper(process.stderr)])
+        feeder.start()
+        drain.start()
+        for counts in sam_stream.iter_counts(io.TextIOWrapper(process.stdout),
+                                             reference, paired, batch_size):
+            if tolerance is not None and \
+               confidence_width(counts, confidence) <= tolerance:
+                stop.set()
+        stop.set()
+        feeder.join()
+        drain.join()
+    # bowtie2 is killed on a timeout or an Exception (see pipeline.spawn)
+    for error in failed:
+        if not isinstance(error, input_errors):
+            raise error
+    Error = process.returncode != 0 or not bowtie2_stats.complete(stats) \
+        or len(failed) > 0
+    # Checks if bowtie2 exited with an error or the input was damaged
+    return counts, stats, Error
+
+
+def analyse(fq_file, read2_file, path, paired, threads=1, reads=None,
+            tolerance=None, confidence=0.95, seed=0, timeout=None):
+    r'''Analyses a subsample of a FASTQ file
+
+    Either a deterministic reservoir sample of a fixed number of reads
+    is aligned or reads are aligned in batches until the proportions
+    of all regions converged (see align_records).
+
+    Parameters
+    ----------
+    fq_file : str
+        Path to a .fastq file (or .fastq.gz) containing the (forward) reads.
+    read2_file : str
+        Path to a .fastq file (or .fastq.gz) containing backwards reads.
+        Is disregarded if paired = False.
+    path : str
+        The program filepath.
+    paired : Bool
+        Wether or not the reads are paired.
+    threads : int
+        Number of threads given to bowtie2.
+    reads : int or None
+        Size of the reservoir sample. If None the reads are aligned
+        until they converged.
+    tolerance : float or None
+        See align_records.
+    confidence : float
+        See align_records.
+    seed : int
+        Seed of the reservoir sample.
+    timeout : float or None
+        See align_records.
+
+    Returns
+    -------
+    new_row : dict or None
+        Dictionary containing all analysed information about the sample
+        (see Output_counter.create_row) and 'Reads used'. None if
+        bowtie2 ended with an error or the input could not be read.
+    counts : dict
+        See sam_stream.count_sam.
+
+    '''
+    records = read_records(fq_file, read2_file, paired)
+    total = None
+    if reads is not None:
+        try:
+            records, total = reservoir(records, reads, seed)
+        except input_errors:
+            return None, sam_stream.count_sam([], None, paired)
+            # skips a damaged input like a bowtie2 error, nothing was
+            # counted
+    counts, stats, Error = align_records(records, path, paired, threads,
+                                         tolerance, confidence, timeout)
+    if Error is True:
+        return None, counts
+    new_row = sam_stream.create_row(stats, paired, counts)
+    new_row['Reads used'] = new_row['Number of Reads']
+    if total is not None:
+        new_row['Number of Reads'] = total
+    return new_row, counts
@@ -1,6 +1,8 @@
 #!/usr/bin/python
 
 import unittest
+import tempfile
+import shutil
 import os
 import vxdetector.Output_counter as oc
 
@@ -120,6 +122,14 @@ class test_create_row(unittest.TestCase):
         new_row = oc.create_row(test_data, paired=False)
         self.assertEqual(new_row, row)
 
+    def test_given_counts(self):
+        test_data = f'{self.data_path}unpaired/'
+        regions = {'V1': 0, 'V2': 0, 'V3': 0, 'V4': 6935, 'V5': 6307,
+                   'V6': 0, 'V7': 0, 'V8': 0, 'V9': 0}
+        new_row = oc.create_row(test_data, False, regions, 0)
+        self.assertEqual(new_row, oc.create_row(test_data, paired=False))
+        self.assertEqual(regions['V4'], 6935)
+
     def test_raise(self):
         with self.assertRaises(FileNotFoundError) as cm:
             oc.create_row(self.data_path, paired=False)
@@ -132,3 +142,60 @@ class test_create_row(unittest.TestCase):
         self.assertEqual(f'It seems {no_log_path}bowtie2.log is missing. '
                          'Check if you deleted the temp_dir',
                          str(cm.exception))
+
+
+class test_count_regions(unittest.TestCase):
+    def setUp(self):
+        self.data_path = f'{os.path.dirname(__file__)}/test_data/'
+        self.fp_tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.fp_tmpdir)
+
+    def test_test_data(self):
+        for test_data in ['paired/', 'unpaired/']:
+            with open(f'{self.data_path}{test_data}BED.bed') as f:
+                bed_data = f.read()
+            expected = [bed_data.count(region) for region in oc.regions_list]
+            counts = oc.count_regions(f'{self.data_path}{test_data}BED.bed')
+            self.assertEqual(counts.tolist(), expected)
+
+    def test_name_column(self):
+        BED_path = f'{self.fp_tmpdir}/BED.bed'
+        with open(BED_path, 'w') as f:
+            f.write('V1\t1\t5\tV4\n'
+                    'otu\t1\t5\tV10\n'
+                    'otu\t1\t5\tV2\textra\tV3\n'
+                    'otu\t1\t5\n'
+                    'otu\t1\t5\tV9')
+        counts = oc.count_regions(BED_path)
+        self.assertEqual(counts.tolist(), [0, 1, 0, 1, 0, 0, 0, 0, 1])
+
+    def test_chunks(self):
+        read_size = oc.read_size
+        oc.read_size = 7
+        try:
+            counts = oc.count_regions(f'{self.data_path}paired/BED.bed')
+        finally:
+            oc.read_size = read_size
+        self.assertEqual(counts.tolist(), [0, 0, 0, 3702, 3459, 1, 0, 0, 0])
+
+
+class test_agreement(unittest.TestCase):
+    def row(self, region, v4):
+        row = dict.fromkeys(oc.agreement_columns, 0.0)
+        row.update({'Sequenced variable region': region, 'V4': v4,
+                    'Not aligned to a variable region': 100 - v4})
+        return row
+
+    def test_agreement(self):
+        expected = {'a': self.row('V4', 90.0), 'b': self.row('V4', 80.0),
+                    'c': None}
+        result = {'a': self.row('V4', 89.0), 'b': self.row('V34', 40.0),
+                  'c': self.row('V4', 1.0)}
+        agreement = oc.agreement(expected, result)
+        self.assertEqual(agreement['samples'], 2)
+        self.assertEqual(agreement['same_region'], 0.5)
+        self.assertEqual(agreement['max_difference'], 40.0)
+        self.assertAlmostEqual(agreement['mean_difference'],
+                               82 / (2 * len(oc.agreement_columns)))
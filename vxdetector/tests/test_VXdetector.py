@@ -1,12 +1,17 @@
 #!/usr/bin/python
 
 import unittest
+import asyncio
+import time
 import tempfile
 import io
 import os
+import subprocess
 import sys
+from unittest import mock
 from glob import glob
 import pandas as pd
+import pytest
 import vxdetector.VXdetector as vx
 import shutil
 
@@ -95,6 +100,51 @@ class test_do_output(unittest.TestCase):
         self.assertTrue(os.path.exists(new_file))
 
 
+class test_optional_columns(unittest.TestCase):
+    def test_reads_used(self):
+        result = {'a': {column: 1.0 for column in vx.output_columns},
+                  'b': {column: 3.0 for column in vx.output_columns}}
+        result['a']['Sequenced variable region'] = 'V4'
+        result['b']['Sequenced variable region'] = 'V4'
+        result['a']['Reads used'] = 10
+        result['b']['Reads used'] = 20
+        output = io.StringIO()
+        vx.do_output(result, output, False)
+        lines = output.getvalue().splitlines()
+        self.assertTrue(lines[0].endswith(',Reads used'))
+        self.assertTrue(lines[1].startswith('Average,2.0,'))
+        self.assertTrue(lines[1].endswith(',15.0'))
+        output = io.StringIO()
+        vx.do_output(result, output, True)
+        self.assertTrue(output.getvalue().splitlines()[2].endswith(',20'))
+
+
+class test_sample_helpers(unittest.TestCase):
+    def setUp(self):
+        self.path = f'{os.path.dirname(__file__)}/test_data/test_dir/'
+
+    def test_find_read2(self):
+        read2_file, paired = vx.find_read2(f'{self.path}no_qual_paired_'
+                                           'R1_001.fastq')
+        self.assertEqual(read2_file, f'{self.path}no_qual_paired_'
+                         'R2_001.fastq')
+        self.assertTrue(paired)
+        read2_file, paired = vx.find_read2(f'{self.path}no_qual_test.fastq')
+        self.assertFalse(paired)
+
+    def test_sample_name(self):
+        self.assertEqual(vx.sample_name(f'{self.path}5004_S20_L001_R1_001'
+                                        '.fastq.gz'), '5004_S20_L001')
+        self.assertEqual(vx.sample_name('no_qual_test.fastq'),
+                         'no_qual_test')
+
+    def test_project_name(self):
+        self.assertEqual(vx.project_name(self.path), 'test_dir')
+        self.assertEqual(vx.project_name(self.path[:-1]), 'test_dir')
+        self.assertEqual(vx.project_name(f'{self.path}no_qual_test.fastq'),
+                         'test_dir')
+
+
 class test_do_statistic(unittest.TestCase):
     def setUp(self):
         self.fp_tmpdir = tempfile.mkdtemp()
@@ -128,6 +178,128 @@ class test_do_statistic(unittest.TestCase):
         self.assertTrue(statistic.equals(expected))
 
 
+class test_main(unittest.TestCase):
+    def test_cache_opt_in(self):
+        for argv, cache in [([], None), (['--cache'], 'use'),
+                            (['--refresh'], 'refresh'),
+                            (['--cache', '--no-cache'], None)]:
+            with mock.patch.object(sys, 'argv', ['VXdetector', 'dir/']
+                                   + argv), \
+                 mock.patch.object(vx, 'workflow') as workflow:
+                vx.main()
+            self.assertEqual(workflow.call_args.kwargs['cache'], cache)
+
+    def test_keyword_arguments(self):
+        import inspect
+        with mock.patch.object(sys, 'argv', ['VXdetector', 'dir/']), \
+             mock.patch.object(vx, 'workflow') as workflow:
+            vx.main()
+        parameters = list(inspect.signature(vx.workflow).parameters)
+        self.assertEqual(len(workflow.call_args.args), 3)
+        self.assertEqual(list(workflow.call_args.kwargs), parameters[3:])
+        # options after write_csv are passed by name
+
+
+class test_concurrent_cache(unittest.TestCase):
+    def setUp(self):
+        self.fp_tmpdir = tempfile.mkdtemp()
+        self.path = f'{os.path.dirname(__file__)}/test_data/test_dir/'
+
+    def tearDown(self):
+        shutil.rmtree(self.fp_tmpdir)
+
+    def test_hashing_does_not_block(self):
+        gaps = []
+
+        def sample_key(fq_file, *args):
+            time.sleep(0.3)
+            return fq_file
+            # a large file which takes a while to hash
+
+        async def analyse_alignment(*args):
+            last = time.perf_counter()
+            for _ in range(40):
+                await asyncio.sleep(0.01)
+                gaps.append(time.perf_counter() - last)
+                last = time.perf_counter()
+            return {'Number of Reads': 1}
+
+        program_path = f'{__file__.rsplit("/", 3)[0]}/'
+        with mock.patch.object(vx.files_manager, 'get_lib',
+                               return_value=program_path), \
+             mock.patch.object(vx, 'prepare_reference'), \
+             mock.patch.object(vx, 'analyse_alignment', analyse_alignment), \
+             mock.patch.multiple(vx.result_cache, sample_key=sample_key,
+                                 reference_fingerprint=mock.DEFAULT,
+                                 store=mock.DEFAULT, evict=mock.DEFAULT):
+            vx.workflow(self.path, f'{self.fp_tmpdir}/out.csv', False,
+                        jobs=2, cache='refresh')
+        output = pd.read_csv(f'{self.fp_tmpdir}/out.csv', index_col=0)
+        self.assertEqual(len(output), 2 + 4)
+        self.assertLess(max(gaps), 0.2)
+        # the event loop kept running while the files were hashed
+
+
+class test_prepare_reference(unittest.TestCase):
+    def test_default_imports(self):
+        code = ('import sys; from unittest import mock; '
+                'import vxdetector.VXdetector as vx; '
+                'mock.patch.object(vx, "buildbowtie2").start(); '
+                'vx.prepare_reference("path/"); '
+                'print("numpy" in sys.modules)')
+        output = subprocess.run([sys.executable, '-c', code], check=True,
+                                capture_output=True, text=True).stdout
+        self.assertEqual(output, 'False\n')
+        # the bowtie2 engine with bedtools does not load numpy
+
+
+class test_analyse_sample(unittest.TestCase):
+    def test_subsample_strict(self):
+        import vxdetector.subsample as subsample
+        counts = {'regions': dict.fromkeys(['V1', 'V4'], 0),
+                  'no_overlap': 3, 'not_paired': 0, 'intervals': 3}
+        new_row = {'Number of Reads': 10}
+        with mock.patch.object(subsample, 'analyse',
+                               return_value=(new_row, counts)):
+            self.assertEqual(vx.analyse_sample(
+                'R1.fastq', 'R2.fastq', True, 'path/', strict=True,
+                sampling={'reads': 10}), new_row)
+            # aligned pairs without a region hit are accepted
+            counts['intervals'] = 0
+            with self.assertRaises(ValueError):
+                vx.analyse_sample('R1.fastq', 'R2.fastq', True, 'path/',
+                                  strict=True, sampling={'reads': 10})
+
+
+class test_analyse_alignment(unittest.TestCase):
+    def setUp(self):
+        self.fp_tmpdir = f'{tempfile.mkdtemp()}/'
+        self.per_read = f'{self.fp_tmpdir}reads/'
+        os.mkdir(self.per_read)
+
+    def tearDown(self):
+        shutil.rmtree(self.fp_tmpdir)
+
+    def test_strict_discards_reads(self):
+        async def map_reads(*args):
+            return 'aligned.bam', False
+
+        def find_overlap(path, temp_path, aligned_path, overlap_engine,
+                         reads):
+            self.assertIsNotNone(reads)
+            return {'V4': 0}, 10
+
+        with mock.patch.object(vx, 'map_reads', map_reads), \
+             mock.patch.object(vx, 'find_overlap', find_overlap):
+            with self.assertRaises(ValueError):
+                asyncio.run(vx.analyse_alignment(
+                    'sample.fastq', '', False, self.fp_tmpdir,
+                    overlap_engine='native', strict=True,
+                    temp_dir=self.fp_tmpdir, per_read=self.per_read))
+        self.assertEqual(os.listdir(self.per_read), [])
+        # the per-read output of a rejected sample is not published
+
+
 class test_workflow(unittest.TestCase):
     def setUp(self):
         self.fp_tmpdir = tempfile.mkdtemp()
@@ -162,6 +334,47 @@ class test_workflow(unittest.TestCase):
                 output.append(line.strip().split())
         self.assertEqual(output, content)
 
+    def test_singleFile_stream(self):
+        expected = f'{self.path}test_data/Output_test.csv'
+        actual = f'{self.fp_tmpdir}/singleFile_test.csv'
+        test_file = f'{self.path}test_data/5011_S225_L001_R1_001.fastq.gz'
+        vx.workflow(test_file, actual, False, stream=True)
+        content = []
+        with open(expected)as f:
+            for line in f:
+                content.append(line.strip().split())
+        output = []
+        with open(actual)as f:
+            for line in f:
+                output.append(line.strip().split())
+        self.assertEqual(output, content)
+
+    def test_singleFile_subsample(self):
+        actual = f'{self.fp_tmpdir}/subsample_test.csv'
+        test_file = f'{self.path}test_data/5011_S225_L001_R1_001.fastq.gz'
+        vx.workflow(test_file, actual, False,
+                    sampling={'reads': 1000, 'tolerance': None})
+        output = pd.read_csv(actual, index_col=0)
+        self.assertEqual(output['Number of Reads'].iloc[0], 64421)
+        self.assertEqual(output['Reads used'].iloc[0], 1000)
+        vx.workflow(test_file, actual, False,
+                    sampling={'reads': None, 'tolerance': 1.0})
+        output = pd.read_csv(actual, index_col=0)
+        self.assertLess(output['Reads used'].iloc[0], 64421)
+        self.assertEqual(output['Sequenced variable region'].iloc[0], 'V45')
+
+    def assertStatistics(self, actual, expected):
+        # the average and standard deviation are computed online and
+        # may differ from the expected values in the last digit
+        output = pd.read_csv(actual, index_col=0).iloc[:2]
+        content = pd.read_csv(expected, index_col=0).iloc[:2]
+        numeric = content.select_dtypes('number').columns
+        self.assertEqual(output.drop(columns=numeric).values.tolist(),
+                         content.drop(columns=numeric).values.tolist())
+        self.assertEqual(output[numeric].to_numpy(),
+                         pytest.approx(content[numeric].to_numpy(),
+                                       nan_ok=True))
+
     def test_directory(self):
         expected = f'{self.path}test_data/dir_test.csv'
         actual = f'{self.path}/test_data/dir_test_actual.csv'
@@ -175,7 +388,46 @@ class test_workflow(unittest.TestCase):
         with open(actual)as f:
             for line in f:
                 output.append(line.strip().split())
-        self.assertEqual(output, content)
+        self.assertEqual(output[:1] + output[3:], content[:1] + content[3:])
+        self.assertStatistics(actual, expected)
+
+    def test_directory_parallel(self):
+        expected = f'{self.path}test_data/dir_test.csv'
+        actual = f'{self.path}/test_data/dir_test_actual.csv'
+        test_file = f'{self.path}test_data/test_dir/'
+        vx.workflow(test_file, actual, False, jobs=2)
+        content = []
+        with open(expected)as f:
+            for line in f:
+                content.append(line.strip().split())
+        output = []
+        with open(actual)as f:
+            for line in f:
+                output.append(line.strip().split())
+        self.assertEqual(output[:1] + output[3:], content[:1] + content[3:])
+        self.assertStatistics(actual, expected)
+        self.assertEqual(glob(f'{__file__.rsplit("/", 3)[0]}/tmp_files_*'),
+                         [])
+
+    def test_directory_store(self):
+        import vxdetector.result_store as result_store
+        actual = f'{self.path}/test_data/dir_test_actual.csv'
+        store = f'{self.fp_tmpdir}/results.sqlite'
+        test_file = f'{self.path}test_data/test_dir/'
+        vx.workflow(test_file, actual, False, store=store)
+        vx.workflow(test_file, actual, False, store=store)
+        output = pd.read_csv(actual, index_col=0)
+        connection = result_store.connect(store)
+        summary, = result_store.summary(connection, project='test_dir')
+        self.assertEqual(summary['samples'], len(output) - 2)
+        for column in ['Number of Reads', 'V4']:
+            self.assertAlmostEqual(summary['average'][column],
+                                   output[column].iloc[0])
+        self.assertEqual(summary['average']['Sequenced variable region'],
+                         output['Sequenced variable region'].iloc[0])
+        runs, = connection.execute('SELECT count(*) FROM runs').fetchone()
+        self.assertEqual(runs, 2)
+        connection.close()
 
     def test_c_option(self):
         expected = f'{self.path}test_data/Output_test.csv'
@@ -0,0 +1,104 @@
+#!/usr/bin/python
+
+import unittest
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import vxdetector
+import vxdetector.api as api
+import vxdetector.benchmarks.synthetic as synthetic
+import vxdetector.kmer_classifier as kmer_classifier
+
+
+class test_import(unittest.TestCase):
+    def test_no_heavy_modules(self):
+        code = ('import sys, vxdetector; vxdetector.detect; '
+                'print("numpy" in sys.modules, "pandas" in sys.modules)')
+        output = subprocess.run([sys.executable, '-c', code], check=True,
+                                capture_output=True, text=True).stdout
+        self.assertEqual(output, 'False False\n')
+
+    def test_lazy_attributes(self):
+        self.assertIs(vxdetector.detect, api.detect)
+        self.assertIs(vxdetector.Result, api.Result)
+        with self.assertRaises(AttributeError):
+            vxdetector.unknown
+
+
+class test_make_result(unittest.TestCase):
+    def setUp(self):
+        self.new_row = {'Number of Reads': 10, 'Unaligned Reads [%]': 20.0,
+                        'Not properly paired': 'not paired',
+                        'Sequenced variable region': 'V4',
+                        'Not aligned to a variable region': 5.0,
+                        'Aligned 0 times [%]': 20.0}
+        for region in ['V1', 'V2', 'V3', 'V4', 'V5', 'V6', 'V7', 'V8', 'V9']:
+            self.new_row[region] = 95.0 if region == 'V4' else 0.0
+
+    def test_result(self):
+        result = api.make_result('dir/a_R1_001.fastq', 'dir/a_R2_001.fastq',
+                                 False, self.new_row)
+        self.assertEqual(result.sample, 'a')
+        self.assertIsNone(result.read2_file)
+        self.assertEqual(result.reads, 10)
+        self.assertEqual(result.region, 'V4')
+        self.assertEqual(result.regions['V4'], 95.0)
+        self.assertEqual(len(result.regions), 9)
+        self.assertIsNone(result.reads_used)
+        self.assertEqual(result.alignment, {'Aligned 0 times [%]': 20.0})
+        self.assertFalse(hasattr(result, '__dict__'))
+
+
+class test_detect(unittest.TestCase):
+    def setUp(self):
+        self.path = f'{tempfile.mkdtemp()}/'
+        self.bundle = f'{self.path}bundle/'
+        os.makedirs(f'{self.bundle}Indexed_bt2')
+        program_path = f'{__file__.rsplit("/", 3)[0]}/'
+        with open(f'{program_path}Indexed_bt2/annoted_ref.bed') as f:
+            lines = [next(f) for _ in range(9 * 5)]
+        with open(f'{self.bundle}Indexed_bt2/annoted_ref.bed', 'w') as f:
+            f.writelines(lines)
+        rng = random.Random(0)
+        with open(f'{self.bundle}Indexed_bt2/85_otus.fasta', 'w') as f:
+            for otu in dict.fromkeys(line.split('\t')[0] for line in lines):
+                f.write(f'>{otu}\n'
+                        + ''.join(rng.choice('ACGT') for _ in range(1500))
+                        + '\n')
+        with open(f'{self.bundle}bundle.json', 'w') as f:
+            json.dump({'otus': []}, f)
+        self.out_dir = f'{self.path}reads/'
+        os.mkdir(self.out_dir)
+        synthetic.simulate(self.out_dir, self.bundle, reads=100, paired=True,
+                           regions=['V4'])
+        kmer_classifier.load_index.cache_clear()
+
+    def tearDown(self):
+        kmer_classifier.load_index.cache_clear()
+        shutil.rmtree(self.path)
+
+    def test_expand(self):
+        samples = api.expand(self.out_dir)
+        self.assertEqual(len(samples), 1)
+        self.assertTrue(samples[0][2])
+        self.assertEqual(api.expand([samples[0][0]]), samples)
+        with self.assertRaises(FileNotFoundError):
+            api.expand(f'{self.path}missing')
+
+    def test_kmer(self):
+        results = api.detect(self.out_dir, engine='kmer',
+                             reference=self.bundle)
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0].region, 'V4')
+        self.assertTrue(results[0].paired)
+        self.assertEqual(results[0].alignment, dict())
+
+    def test_incomplete_bundle(self):
+        os.remove(f'{self.bundle}Indexed_bt2/85_otus.fasta')
+        with self.assertRaises(FileNotFoundError) as cm:
+            api.detect(self.out_dir, engine='kmer', reference=self.bundle)
+        self.assertIn('85_otus.fasta', str(cm.exception))
@@ -0,0 +1,82 @@
+#!/usr/bin/python
+
+import unittest
+import os
+import shutil
+import tempfile
+import vxdetector.benchmarks.synthetic as synthetic
+import vxdetector.benchmarks.bench_workflow as bench_workflow
+
+
+class test_synthetic(unittest.TestCase):
+    def setUp(self):
+        self.path = f'{tempfile.mkdtemp()}/'
+        os.mkdir(f'{self.path}Indexed_bt2')
+        program_path = f'{__file__.rsplit("/", 3)[0]}/'
+        with open(f'{program_path}Indexed_bt2/annoted_ref.bed') as f:
+            lines = [line for line in f if line.startswith('851138\t')]
+        with open(f'{self.path}Indexed_bt2/annoted_ref.bed', 'w') as f:
+            f.writelines(lines)
+        with open(f'{self.path}Indexed_bt2/85_otus.fasta', 'w') as f:
+            f.write('>851138\n' + 'ACGGT' * 150 + '\n' + 'TTAGC' * 150 + '\n')
+        self.out_dir = f'{self.path}reads/'
+        os.mkdir(self.out_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_unpaired(self):
+        truth = synthetic.simulate(self.out_dir, self.path, samples=2,
+                                   reads=50, regions=['V3'])
+        self.assertEqual(sorted(os.listdir(self.out_dir)),
+                         ['synthetic0_S1_L001_R1_001.fastq',
+                          'synthetic1_S2_L001_R1_001.fastq'])
+        for counts in truth.values():
+            self.assertEqual(counts['V3'], 50)
+            self.assertEqual(counts['V4'], 0)
+            self.assertEqual(counts['Not aligned to a variable region'], 0)
+        with open(f'{self.out_dir}synthetic0_S1_L001_R1_001.fastq') as f:
+            lines = f.readlines()
+        self.assertEqual(len(lines), 200)
+        self.assertEqual(len(lines[1]), 151)
+
+    def test_paired(self):
+        sequences = synthetic.read_fasta(
+            f'{self.path}Indexed_bt2/85_otus.fasta')
+        windows = synthetic.read_windows(
+            f'{self.path}Indexed_bt2/annoted_ref.bed', ['V2'])
+        reads = synthetic.simulate_reads(sequences, windows, 20, 100, 250)
+        for chrom, start, mate1, mate2 in reads:
+            sequence = sequences[chrom]
+            self.assertEqual(mate1, sequence[start:start + 100])
+            self.assertEqual(mate2.translate(synthetic.complement)[::-1],
+                             sequence[start + 150:start + 250])
+        self.assertEqual(reads, synthetic.simulate_reads(
+            sequences, windows, 20, 100, 250))
+
+    def test_proportions(self):
+        counts = dict.fromkeys(synthetic.regions_list, 0)
+        counts.update({'V4': 3, 'Not aligned to a variable region': 1})
+        shares = synthetic.proportions(counts)
+        self.assertEqual(shares['V4'], 75)
+        self.assertEqual(shares['Not aligned to a variable region'], 25)
+
+
+class test_compare(unittest.TestCase):
+    def setUp(self):
+        self.baseline = {
+            'stages': {'mapping': {'reads_per_s': 1000, 'peak_rss': 100}},
+            'results': {'sample': {'V4': 50.0}}, 'max_error': 1.0}
+
+    def test_no_regression(self):
+        report = {
+            'stages': {'mapping': {'reads_per_s': 900, 'peak_rss': 110}},
+            'results': {'sample': {'V4': 50.0}}, 'max_error': 1.0}
+        self.assertEqual(bench_workflow.compare(report, self.baseline), [])
+
+    def test_regression(self):
+        report = {
+            'stages': {'mapping': {'reads_per_s': 500, 'peak_rss': 200}},
+            'results': {'sample': {'V4': 40.0}}, 'max_error': 5.0}
+        self.assertEqual(len(bench_workflow.compare(report, self.baseline)),
+                         4)
@@ -0,0 +1,79 @@
+#!/usr/bin/python
+
+import unittest
+import os
+import vxdetector.bowtie2_stats as bs
+import vxdetector.Output_counter as Output_counter
+
+
+class test_parse(unittest.TestCase):
+    def setUp(self):
+        self.data_path = f'{os.path.dirname(__file__)}/test_data/'
+
+    def test_paired(self):
+        with open(f'{self.data_path}paired/bowtie2.log') as f:
+            stats = bs.parse(f)
+        self.assertEqual(stats['reads'], 64421)
+        self.assertEqual(stats['paired'], 64421)
+        self.assertEqual(stats['concordant_0'], 14792)
+        self.assertEqual(stats['concordant_1'], 10772)
+        self.assertEqual(stats['concordant_multi'], 38857)
+        self.assertEqual(stats['discordant'], 1018)
+        self.assertEqual(stats['mates'], 27548)
+        self.assertEqual(stats['mates_aligned_0'], 15709)
+        self.assertEqual(stats['mates_aligned_multi'], 6968)
+        self.assertEqual(stats['overall_rate'], 87.81)
+        self.assertNotIn('aligned_0', stats)
+        self.assertTrue(bs.complete(stats))
+
+    def test_warnings(self):
+        lines = ['Warning: skipping read 1 because it was < 2 characters\n',
+                 '10 reads; of these:\n',
+                 '  10 (100.00%) were unpaired; of these:\n',
+                 '    2 (20.00%) aligned 0 times\n',
+                 'Warning: skipping read 7 because it was < 2 characters\n',
+                 '    8 (80.00%) aligned exactly 1 time\n',
+                 '    0 (0.00%) aligned >1 times\n',
+                 '80.00% overall alignment rate\n']
+        stats = bs.parse(lines)
+        self.assertEqual(stats, {'reads': 10, 'unpaired': 10, 'aligned_0': 2,
+                                 'aligned_1': 8, 'aligned_multi': 0,
+                                 'overall_rate': 80.0})
+        self.assertFalse(bs.complete(bs.parse(lines[:4])))
+        self.assertFalse(bs.complete(bs.parse(
+            ['Error: reads file does not look like a FASTQ file\n'])))
+
+
+class test_create_row(unittest.TestCase):
+    def setUp(self):
+        self.data_path = f'{os.path.dirname(__file__)}/test_data/'
+
+    def test_like_log(self):
+        for layout in ['paired', 'unpaired']:
+            with open(f'{self.data_path}{layout}/bowtie2.log') as f:
+                lines = f.readlines()
+            new_row = bs.create_row(bs.parse(lines))
+            expected = Output_counter.read_log(lines)
+            for key, value in expected.items():
+                self.assertAlmostEqual(new_row[key], value)
+
+    def test_paired(self):
+        with open(f'{self.data_path}paired/bowtie2.log') as f:
+            new_row = bs.create_row(bs.parse(f))
+        self.assertAlmostEqual(new_row['Concordant >1 times [%]'],
+                               38857 / 64421 * 100)
+        self.assertAlmostEqual(new_row['Mate alignment rate [%]'],
+                               (4871 + 6968) / 27548 * 100)
+        self.assertNotIn('Aligned 0 times [%]', new_row)
+
+    def test_output_counter(self):
+        with open(f'{self.data_path}paired/bowtie2.log') as f:
+            stats = bs.parse(f)
+        stats['not_paired'] = 360
+        new_row = Output_counter.create_row(f'{self.data_path}paired/',
+                                            True, stats=stats)
+        expected = Output_counter.create_row(f'{self.data_path}paired/',
+                                             True)
+        for key, value in expected.items():
+            self.assertEqual(new_row[key], value)
+        self.assertIn('Discordant [%]', new_row)
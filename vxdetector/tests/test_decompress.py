@@ -0,0 +1,126 @@
+#!/usr/bin/python
+
+import unittest
+import gzip
+import os
+import shutil
+import subprocess
+import tempfile
+import vxdetector.decompress as decompress
+from vxdetector.benchmarks.bench_decompress import compress_bgzf
+
+
+def fastq(names):
+    return ''.join(f'@{name}\nACGT\n+\nFFFF\n' for name in names).encode()
+
+
+class test_read_chunks(unittest.TestCase):
+    def setUp(self):
+        self.fp_tmpdir = f'{tempfile.mkdtemp()}/'
+        self.data = fastq(f'r{i}' for i in range(20000))
+
+    def tearDown(self):
+        shutil.rmtree(self.fp_tmpdir)
+
+    def read(self, filename, workers=1):
+        return b''.join(decompress.read_chunks(filename, workers))
+
+    def test_multi_member(self):
+        filename = f'{self.fp_tmpdir}reads.fastq.gz'
+        with open(filename, 'wb') as f:
+            f.write(gzip.compress(self.data[:1000]))
+            f.write(gzip.compress(self.data[1000:]))
+            f.write(bytes(8))
+        self.assertFalse(decompress.is_bgzf(filename))
+        self.assertEqual(self.read(filename), self.data)
+
+    def test_truncated(self):
+        filename = f'{self.fp_tmpdir}reads.fastq.gz'
+        with open(filename, 'wb') as f:
+            f.write(gzip.compress(self.data)[:-100])
+        with self.assertRaises(EOFError):
+            self.read(filename)
+
+    def test_bgzf(self):
+        source = f'{self.fp_tmpdir}reads.fastq'
+        with open(source, 'wb') as f:
+            f.write(self.data)
+        filename = f'{self.fp_tmpdir}reads.fastq.gz'
+        compress_bgzf(source, filename)
+        self.assertTrue(decompress.is_bgzf(filename))
+        self.assertEqual(self.read(filename, 3), self.data)
+        with gzip.open(filename) as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(self.read(source), self.data)
+
+    def test_bgzf_crc(self):
+        source = f'{self.fp_tmpdir}reads.fastq'
+        with open(source, 'wb') as f:
+            f.write(self.data)
+        filename = f'{self.fp_tmpdir}reads.fastq.gz'
+        compress_bgzf(source, filename)
+        with open(filename, 'r+b') as f:
+            f.seek(-36, os.SEEK_END)
+            crc = f.read(1)
+            f.seek(-36, os.SEEK_END)
+            f.write(bytes([crc[0] ^ 0xff]))
+            # changes the crc of the last block with data
+        with self.assertRaises(ValueError):
+            self.read(filename, 2)
+
+
+class test_interleave(unittest.TestCase):
+    def test_records(self):
+        records = list(decompress.records([b'@r1\nAC', b'GT\n+\nFFFF\n@r2\n',
+                                           b'A\n+\nF']))
+        self.assertEqual(records, [b'@r1\nACGT\n+\nFFFF\n',
+                                   b'@r2\nA\n+\nF\n'])
+        with self.assertRaises(ValueError):
+            list(decompress.records([b'>r1\nACGT\n']))
+
+    def test_interleave(self):
+        data = b''.join(decompress.interleave([fastq(['a', 'b'])],
+                                              [fastq(['c', 'd'])]))
+        self.assertEqual(data, fastq(['a', 'c', 'b', 'd']))
+        with self.assertRaises(ValueError):
+            list(decompress.interleave([fastq(['a', 'b'])], [fastq(['c'])]))
+
+
+class test_command(unittest.TestCase):
+    def setUp(self):
+        self.fp_tmpdir = f'{tempfile.mkdtemp()}/'
+        self.fq_file = f'{self.fp_tmpdir}a_R1_.fastq.gz'
+        self.read2_file = f'{self.fp_tmpdir}a_R2_.fastq.gz'
+        for filename, names in [(self.fq_file, ['a', 'b']),
+                                (self.read2_file, ['c', 'd'])]:
+            with gzip.open(filename, 'wb') as f:
+                f.write(fastq(names))
+
+    def tearDown(self):
+        shutil.rmtree(self.fp_tmpdir)
+
+    def test_auto(self):
+        cmd, reads = decompress.command(self.fq_file, None, False, 1)
+        self.assertIsNone(cmd)
+        self.assertEqual(reads, ['-q', '-U', self.fq_file])
+        cmd, reads = decompress.command(self.fq_file, self.read2_file, True,
+                                        8)
+        self.assertEqual(cmd[-2:], [self.fq_file, self.read2_file])
+        self.assertEqual(reads, ['--interleaved', '-'])
+        plain = f'{self.fp_tmpdir}plain.fastq'
+        with open(plain, 'wb') as f:
+            f.write(fastq(['a']))
+        cmd, reads = decompress.command(plain, None, False, 8)
+        self.assertIsNone(cmd)
+
+    def test_main(self):
+        cmd, _ = decompress.command(self.fq_file, self.read2_file, True,
+                                    offload=True)
+        output = subprocess.run(cmd, check=True, capture_output=True,
+                                cwd=self.fp_tmpdir).stdout
+        self.assertEqual(output, fastq(['a', 'c', 'b', 'd']))
+        with open(self.read2_file, 'wb') as f:
+            f.write(b'no gzip')
+        result = subprocess.run(cmd, capture_output=True)
+        self.assertEqual(result.returncode, 1)
+        self.assertIn(b'fastq', result.stderr)
@@ -51,3 +51,41 @@ class test_get_lib(unittest.TestCase):
         open(f'{self.fp_tmpdir}Indexed_bt2/85_otus_aligned.fasta', 'w').close()
         fm.get_lib(program_path=self.fp_tmpdir)
         self.assertTrue(os.path.exists(f'{self.fp_tmpdir}Output/'))
+
+
+class test_find_samples(unittest.TestCase):
+    def setUp(self):
+        self.fp_tmpdir = f'{tempfile.mkdtemp()}/'
+        for file in ['a_R1_001.fastq.gz', 'a_R2_001.fastq.gz',
+                     'b.fastq', 'notes.txt', '.hidden.fastq',
+                     'run/c_R1_001.fastq', 'run/c_R2_001.fastq',
+                     'run/d_R1_001.fastq', 'run/deep/e.fq.fastq',
+                     '.git/f.fastq']:
+            os.makedirs(os.path.dirname(f'{self.fp_tmpdir}{file}'),
+                        exist_ok=True)
+            open(f'{self.fp_tmpdir}{file}', 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.fp_tmpdir)
+
+    def test_pairing(self):
+        d = self.fp_tmpdir
+        samples = list(fm.find_samples(d))
+        self.assertEqual(samples, [
+            (f'{d}a_R1_001.fastq.gz', f'{d}a_R2_001.fastq.gz', True),
+            (f'{d}b.fastq', f'{d}b.fastq', False),
+            (f'{d}run/c_R1_001.fastq', f'{d}run/c_R2_001.fastq', True),
+            (f'{d}run/d_R1_001.fastq', f'{d}run/d_R2_001.fastq', False),
+            (f'{d}run/deep/e.fq.fastq', f'{d}run/deep/e.fq.fastq', False)])
+
+    def test_lazy(self):
+        samples = fm.find_samples(self.fp_tmpdir)
+        self.assertEqual(next(samples)[0],
+                         f'{self.fp_tmpdir}a_R1_001.fastq.gz')
+        shutil.rmtree(f'{self.fp_tmpdir}run/')
+        # later directories are listed only when they are reached
+        self.assertEqual(len(list(samples)), 1)
+
+    def test_empty(self):
+        self.assertEqual(list(fm.find_samples(f'{self.fp_tmpdir}run/deep/'
+                                              'missing/')), [])
@@ -4,6 +4,7 @@ import unittest
 import tempfile
 import os
 import vxdetector.interact_bedtools as ibe
+import vxdetector.Output_counter as Output_counter
 import shutil
 
 
@@ -57,3 +58,44 @@ class test_overlap(unittest.TestCase):
             for line in f:
                 output.append(line.strip().split())
         self.assertEqual(output, content)
+
+
+class test_count_wao(unittest.TestCase):
+    def test_rules(self):
+        lines = ['1\t100\t200\tr1\t40\t+\t1\t90\t150\tV3\t50\n',
+                 '1\t100\t200\tr1\t40\t+\t1\t190\t400\tV4\t10\n',
+                 '1\t300\t400\tr2\t40\t+\t1\t190\t400\tV4\t100\n',
+                 '1\t0\t100\tr3\t40\t+\t1\t90\t95\tV1\t5\n',
+                 '2\t0\t50\tr4\t40\t+\t.\t-1\t-1\t.\t0\n',
+                 '1\t100\t200\tr5\t40\t+\t1\t90\t150\tV3\t50\n',
+                 '1\t100\t200\tr5\t40\t+\t1\t90\t150\tV3\t50\n',
+                 '1\t500\t600\tr6\t40\t+\t1\t550\t550\tV5\t0\n']
+        # r5 was aligned twice, r6 intersects a zero length region
+        counts = ibe.new_counts()
+        for line in lines:
+            ibe.count_wao(counts, line)
+        ibe.finish_read(counts)
+        self.assertEqual(counts['regions']['V1'], 1)
+        self.assertEqual(counts['regions']['V3'], 3)
+        self.assertEqual(counts['regions']['V4'], 0)
+        self.assertEqual(counts['regions']['V5'], 1)
+        self.assertEqual(counts['no_overlap'], 3)
+
+    def test_empty(self):
+        counts = ibe.new_counts()
+        ibe.finish_read(counts)
+        self.assertEqual(counts['no_overlap'], 0)
+
+
+class test_overlap_counts(unittest.TestCase):
+    def setUp(self):
+        self.path = f'{__file__.rsplit("/", 3)[0]}/'
+        self.data_path = f'{os.path.dirname(__file__)}/test_data/paired/'
+
+    def test_same_as_intersect(self):
+        regions, no_overlap = ibe.overlap_counts(
+            self.path, f'{self.data_path}paired.bed')
+        counts = Output_counter.count_regions(f'{self.data_path}BED.bed')
+        self.assertEqual(list(regions.values()), list(counts))
+        self.assertEqual(no_overlap, Output_counter.rawincount(
+            f'{self.data_path}noOver.bed'))
@@ -1,6 +1,8 @@
 #!/usr/bin/python
 
 import unittest
+import asyncio
+import subprocess
 import tempfile
 import os
 from glob import glob
@@ -73,6 +75,19 @@ class test_mapbowtie2(unittest.TestCase):
                 output.append(line.strip().split())
         self.assertEqual(output, content)
 
+    def test_offload(self):
+        path = f'{os.path.dirname(__file__)}/test_data/'
+        temp_path = f'{self.fp_tmpdir}/'
+        with open(self.test_paired) as f:
+            content = [line.strip().split() for line in f]
+        aligned_path, Error = ibo.mapbowtie2(self.fasta_file, self.read2_file,
+                                             path, temp_path, True,
+                                             offload=True)
+        self.assertEqual(Error, False)
+        with open(aligned_path) as f:
+            output = [line.strip().split() for line in f]
+        self.assertEqual(output, content)
+
     def test_wrong_file_type(self):
         path = f'{os.path.dirname(__file__)}/test_data/'
         read2_file = f'{path}test_data/paired/BED.bed'
@@ -107,3 +122,64 @@ class test_buildbowtie2(unittest.TestCase):
         ibo.buildbowtie2(f'{path}test_data/')
         self.assertEqual(os.path.exists(f'{path}test_data/Indexed_bt2'
                                         '/bowtie2.1.bt2'), True)
+
+
+class test_index_build(unittest.TestCase):
+    def setUp(self):
+        self.path = f'{tempfile.mkdtemp()}/'
+        os.mkdir(f'{self.path}Indexed_bt2')
+        with open(f'{self.path}Indexed_bt2/85_otus.fasta', 'w') as f:
+            f.write('>1\nACGT\n')
+        ibo.tools['bowtie2'] = f'{self.path}bowtie2'
+        with open(f'{self.path}bowtie2-build', 'w') as f:
+            f.write(f'#!/bin/sh\necho build >> {self.path}builds\n'
+                    'sleep 0.2\nfor part in 1 2 rev.1; do\n'
+                    '  echo "$2" > "$5.$part.bt2"\ndone\n')
+        os.chmod(f'{self.path}bowtie2-build', 0o755)
+        # records every build and writes three index parts
+
+    def tearDown(self):
+        ibo.tools.pop('bowtie2')
+        shutil.rmtree(self.path)
+
+    def builds(self):
+        with open(f'{self.path}builds') as f:
+            return len(f.readlines())
+
+    def test_concurrent(self):
+        async def build_all():
+            await asyncio.gather(*[ibo.build_index(self.path, 2)
+                                   for _ in range(3)])
+
+        asyncio.run(build_all())
+        self.assertEqual(self.builds(), 1)
+        self.assertTrue(ibo.index_ready(self.path))
+        self.assertEqual(sorted(glob(f'{self.path}Indexed_bt2/*.bt2')),
+                         [f'{self.path}Indexed_bt2/bowtie2.{part}.bt2'
+                          for part in ['1', '2', 'rev.1']])
+        self.assertEqual(glob(f'{self.path}Indexed_bt2/.bowtie2_build_*'),
+                         [])
+
+    def test_damaged_index(self):
+        ibo.buildbowtie2(self.path)
+        with open(f'{self.path}Indexed_bt2/bowtie2.2.bt2', 'w') as f:
+            f.write('')
+        self.assertFalse(ibo.index_ready(self.path))
+        ibo.buildbowtie2(self.path)
+        self.assertEqual(self.builds(), 2)
+        self.assertTrue(ibo.index_ready(self.path))
+
+    def test_changed_reference(self):
+        ibo.buildbowtie2(self.path)
+        with open(f'{self.path}Indexed_bt2/85_otus.fasta', 'a') as f:
+            f.write('>2\nTTTT\n')
+        self.assertFalse(ibo.index_ready(self.path))
+
+    def test_failed_build(self):
+        with open(f'{self.path}bowtie2-build', 'w') as f:
+            f.write('#!/bin/sh\necho 1 > "$5.1.bt2"\nexit 1\n')
+        with self.assertRaises(subprocess.CalledProcessError):
+            ibo.buildbowtie2(self.path)
+        self.assertFalse(ibo.index_ready(self.path))
+        self.assertEqual(sorted(os.listdir(f'{self.path}Indexed_bt2')),
+                         ['85_otus.fasta', 'bowtie2.lock'])
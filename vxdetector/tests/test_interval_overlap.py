@@ -0,0 +1,124 @@
+#!/usr/bin/python
+
+import unittest
+import os
+import tempfile
+import shutil
+import numpy as np
+import vxdetector.interval_overlap as io
+from vxdetector.Output_counter import regions_list
+
+
+def bedtools_counts(data_path):
+    with open(f'{data_path}BED.bed') as f:
+        bed_data = f.read()
+    regions = {region: bed_data.count(region) for region in regions_list}
+    with open(f'{data_path}noOver.bed') as f:
+        no_overlap = len(f.readlines())
+    return regions, no_overlap
+
+
+class test_load_reference(unittest.TestCase):
+    def setUp(self):
+        self.path = f'{__file__.rsplit("/", 3)[0]}/'
+
+    def test_arrays(self):
+        reference = io.load_reference(self.path)
+        self.assertEqual(reference['starts'].shape,
+                         (len(reference['otus']), 9))
+        self.assertEqual(reference['starts'].dtype, np.int32)
+        self.assertTrue(np.all(reference['otus'][:-1]
+                               < reference['otus'][1:]))
+        row = np.searchsorted(reference['otus'], '851138')
+        self.assertEqual(reference['starts'][row][:3].tolist(),
+                         [46, 71, 311])
+        self.assertEqual(reference['ends'][row][:3].tolist(),
+                         [61, 283, 401])
+
+
+class test_compiled_reference(unittest.TestCase):
+    def setUp(self):
+        self.path = f'{__file__.rsplit("/", 3)[0]}/'
+        self.fp_tmpdir = f'{tempfile.mkdtemp()}/'
+        os.mkdir(f'{self.fp_tmpdir}Indexed_bt2/')
+        self.S_ref = f'{self.fp_tmpdir}Indexed_bt2/annoted_ref.bed'
+        shutil.copy(f'{self.path}Indexed_bt2/annoted_ref.bed', self.S_ref)
+
+    def tearDown(self):
+        shutil.rmtree(self.fp_tmpdir)
+        io.load_reference.cache_clear()
+
+    def test_memory_mapped(self):
+        expected = io.parse_reference(self.S_ref)
+        io.load_reference(self.fp_tmpdir)
+        self.assertTrue(os.path.exists(f'{self.fp_tmpdir}Indexed_bt2/'
+                                       'annoted_ref_cache/checksum'))
+        io.load_reference.cache_clear()
+        reference = io.load_reference(self.fp_tmpdir)
+        for key in io.cache_keys:
+            self.assertIsInstance(reference[key], np.memmap)
+            self.assertTrue(np.array_equal(reference[key], expected[key]))
+
+    def test_invalidation(self):
+        io.load_reference(self.fp_tmpdir)
+        io.load_reference.cache_clear()
+        with open(self.S_ref, 'w') as f:
+            f.write('1\t10\t20\tV1\n1\t30\t40\tV2\n')
+        reference = io.load_reference(self.fp_tmpdir)
+        self.assertEqual(reference['otus'].tolist(), ['1'])
+        self.assertEqual(reference['starts'][0][:3].tolist(), [10, 30, 0])
+
+
+class test_classify(unittest.TestCase):
+    def setUp(self):
+        self.reference = {'otus': np.array(['1', '2']),
+                          'starts': np.array([[0, 100] + [0] * 7,
+                                              [10, 200] + [300] * 7],
+                                             dtype=np.int32),
+                          'ends': np.array([[50, 200] + [0] * 7,
+                                            [20, 300] + [300] * 7],
+                                           dtype=np.int32)}
+
+    def test_rules(self):
+        chroms = np.array(['1', '1', '1', '2', '3'])
+        starts = np.array([0, 25, 150, 299, 0])
+        ends = np.array([40, 150, 400, 301, 100])
+        hits, no_overlap = io.classify(self.reference, chroms, starts, ends)
+        self.assertEqual(hits[:, :2].tolist(), [[True, False],
+                                                [True, True],
+                                                [False, True],
+                                                [False, False],
+                                                [False, False]])
+        self.assertEqual(hits[3, 2:].tolist(), [True] * 7)
+        # zero length regions are extended like bedtools does
+        self.assertEqual(no_overlap.tolist(),
+                         [False, True, True, False, True])
+
+
+class test_overlap_counts(unittest.TestCase):
+    def setUp(self):
+        self.path = f'{__file__.rsplit("/", 3)[0]}/'
+        self.data_path = f'{os.path.dirname(__file__)}/test_data/'
+
+    def test_paired(self):
+        counts = io.overlap_counts(self.path,
+                                   f'{self.data_path}paired/paired.bed')
+        self.assertEqual(counts,
+                         bedtools_counts(f'{self.data_path}paired/'))
+
+    def test_unpaired(self):
+        counts = io.overlap_counts(self.path,
+                                   f'{self.data_path}unpaired/unpaired.bam')
+        self.assertEqual(counts,
+                         bedtools_counts(f'{self.data_path}unpaired/'))
+
+    def test_chunks(self):
+        chunk_size = io.chunk_size
+        io.chunk_size = 1000
+        try:
+            counts = io.overlap_counts(self.path,
+                                       f'{self.data_path}paired/paired.bed')
+        finally:
+            io.chunk_size = chunk_size
+        self.assertEqual(counts,
+                         bedtools_counts(f'{self.data_path}paired/'))
@@ -0,0 +1,140 @@
+#!/usr/bin/python
+
+import unittest
+import os
+import random
+import shutil
+import tempfile
+import numpy as np
+import vxdetector.benchmarks.synthetic as synthetic
+import vxdetector.kmer_classifier as kmer_classifier
+
+
+def brute_force(sequence, k, stride):
+    complement = bytes.maketrans(b'ACGT', b'TGCA')
+    code = {ord(base): i for i, base in enumerate('ACGT')}
+    starts = list(range(0, len(sequence) - k + 1, stride))
+    if len(sequence) >= k and starts[-1] != len(sequence) - k:
+        starts.append(len(sequence) - k)
+    expected = []
+    for start in starts:
+        kmer = sequence[start:start + k]
+        if any(base not in b'ACGT' for base in kmer):
+            continue
+        values = []
+        for strand in [kmer, kmer.translate(complement)[::-1]]:
+            value = 0
+            for base in strand:
+                value = value * 4 + code[base]
+            values.append(value)
+        expected.append((min(values), start))
+    return expected
+
+
+class test_kmers(unittest.TestCase):
+    def test_brute_force(self):
+        rng = random.Random(0)
+        sequences = [bytes(rng.choice(b'ACGT') for _ in range(length))
+                     for length in [40, 15, 7, 100]]
+        sequences.append(sequences[0][:20] + b'N' + sequences[0][21:])
+        for stride in [1, 3, 4]:
+            values, owners, positions = kmer_classifier.kmers(
+                sequences, 15, stride)
+            for i, sequence in enumerate(sequences):
+                actual = [(int(value), int(position)) for value, position
+                          in zip(values[owners == i],
+                                 positions[owners == i])]
+                self.assertEqual(actual, brute_force(sequence, 15, stride))
+
+    def test_reverse_complement(self):
+        sequence = b'ACGTTGCAAGGCTTAACGGATC'
+        reverse = sequence.translate(
+            bytes.maketrans(b'ACGT', b'TGCA'))[::-1]
+        forward_values = kmer_classifier.kmers([sequence])[0]
+        reverse_values = kmer_classifier.kmers([reverse])[0]
+        self.assertEqual(sorted(forward_values), sorted(reverse_values))
+
+
+class test_analyse(unittest.TestCase):
+    def setUp(self):
+        self.path = f'{tempfile.mkdtemp()}/'
+        os.mkdir(f'{self.path}Indexed_bt2')
+        program_path = f'{__file__.rsplit("/", 3)[0]}/'
+        with open(f'{program_path}Indexed_bt2/annoted_ref.bed') as f:
+            lines = [next(f) for _ in range(9 * 20)]
+        with open(f'{self.path}Indexed_bt2/annoted_ref.bed', 'w') as f:
+            f.writelines(lines)
+        rng = random.Random(0)
+        with open(f'{self.path}Indexed_bt2/85_otus.fasta', 'w') as f:
+            for otu in dict.fromkeys(line.split('\t')[0] for line in lines):
+                f.write(f'>{otu}\n'
+                        + ''.join(rng.choice('ACGT') for _ in range(1500))
+                        + '\n')
+        self.out_dir = f'{self.path}reads/'
+        os.mkdir(self.out_dir)
+        kmer_classifier.load_index.cache_clear()
+
+    def tearDown(self):
+        kmer_classifier.load_index.cache_clear()
+        shutil.rmtree(self.path)
+
+    def assertCloseToTruth(self, new_row, counts):
+        for column, share in synthetic.proportions(counts).items():
+            self.assertLess(abs(new_row[column] - share), 3, column)
+
+    def test_unpaired(self):
+        truth = synthetic.simulate(self.out_dir, self.path, reads=200,
+                                   regions=['V3'])
+        fq_file = list(truth)[0]
+        new_row, counts = kmer_classifier.analyse(fq_file, None, self.path,
+                                                  False)
+        self.assertEqual(counts['reads'], 200)
+        self.assertEqual(counts['aligned'], 200)
+        self.assertEqual(new_row['Sequenced variable region'], 'V3')
+        self.assertEqual(new_row['Not properly paired'], 'not paired')
+        self.assertCloseToTruth(new_row, truth[fq_file])
+
+    def test_paired(self):
+        truth = synthetic.simulate(self.out_dir, self.path, reads=200,
+                                   paired=True, regions=['V3'])
+        fq_file = list(truth)[0]
+        read2_file = fq_file.replace('_R1_', '_R2_')
+        new_row, counts = kmer_classifier.analyse(fq_file, read2_file,
+                                                  self.path, True)
+        self.assertEqual(counts['reads'], 200)
+        self.assertEqual(counts['aligned'], 200)
+        self.assertEqual(new_row['Sequenced variable region'], 'V3')
+        self.assertCloseToTruth(new_row, truth[fq_file])
+
+    def test_unaligned(self):
+        rng = random.Random(1)
+        fq_file = f'{self.out_dir}random_S1_L001_R1_001.fastq'
+        synthetic.write_fastq(fq_file, [''.join(rng.choice('ACGT')
+                                                for _ in range(150))
+                                        for _ in range(50)], 'random')
+        new_row, counts = kmer_classifier.analyse(fq_file, None, self.path,
+                                                  False)
+        self.assertEqual(counts['aligned'], 0)
+        self.assertEqual(new_row['Unaligned Reads [%]'], 100)
+
+    def test_no_fastq(self):
+        fq_file = f'{self.out_dir}broken.fastq'
+        with open(fq_file, 'w') as f:
+            f.write('>not a fastq\nACGT\n')
+        new_row, counts = kmer_classifier.analyse(fq_file, None, self.path,
+                                                  False)
+        self.assertIsNone(new_row)
+
+    def test_load_index(self):
+        index = kmer_classifier.load_index(self.path)
+        self.assertIs(kmer_classifier.load_index(self.path), index)
+        self.assertEqual(sorted(os.listdir(
+            f'{self.path}Indexed_bt2/kmer_cache/')),
+            ['checksum', 'kmers.npy', 'lengths.npy', 'masks.npy',
+             'offsets.npy'])
+        kmer_classifier.load_index.cache_clear()
+        cached = kmer_classifier.load_index(self.path)
+        self.assertIsInstance(cached['kmers'], np.memmap)
+        self.assertEqual(index['kmers'].dtype, np.uint32)
+        for key in kmer_classifier.cache_keys:
+            np.testing.assert_array_equal(cached[key], index[key])
@@ -0,0 +1,120 @@
+#!/usr/bin/python
+
+import unittest
+import gzip
+import os
+import shutil
+import tempfile
+import vxdetector.multiplex as mp
+import vxdetector.sam_stream as ss
+import vxdetector.interval_overlap as io
+
+
+def sam_line(name, flag, tags=''):
+    return (f'{name}\t{flag}\t851138\t41\t40\t30M\t=\t0\t0\tACGT\tFFFF'
+            f'\tAS:i:0{tags}\n')
+
+
+class test_tag_samples(unittest.TestCase):
+    def setUp(self):
+        self.fp_tmpdir = f'{tempfile.mkdtemp()}/'
+
+    def tearDown(self):
+        shutil.rmtree(self.fp_tmpdir)
+
+    def write(self, name, reads, compress=False):
+        fq_file = f'{self.fp_tmpdir}{name}'
+        opener = gzip.open if compress else open
+        with opener(fq_file, 'wt') as f:
+            for read in reads:
+                f.write(f'@{read} 1:N:0\nACGT\n+\nFFFF\n')
+        return fq_file
+
+    def test_tags(self):
+        samples = [(self.write('a.fastq', ['r1', 'r2']), None, False),
+                   (self.write('b.fastq.gz', ['r3'], True), None, False)]
+        failed = set()
+        records = list(mp.tag_samples(samples, failed))
+        self.assertEqual(records, [b'@0:r1 1:N:0\nACGT\n+\nFFFF\n',
+                                   b'@0:r2 1:N:0\nACGT\n+\nFFFF\n',
+                                   b'@1:r3 1:N:0\nACGT\n+\nFFFF\n'])
+        self.assertEqual(failed, set())
+
+    def test_paired(self):
+        samples = [(self.write('a_R1_.fastq', ['r1']),
+                    self.write('a_R2_.fastq', ['r1']), True),
+                   (self.write('b_R1_.fastq', ['r2', 'r3']),
+                    self.write('b_R2_.fastq', ['r2']), True)]
+        failed = set()
+        records = list(mp.tag_samples(samples, failed))
+        self.assertEqual(records[0], b'@0:r1 1:N:0\nACGT\n+\nFFFF\n' * 2)
+        self.assertEqual(len(records), 2)
+        self.assertEqual(failed, {1})
+
+    def test_no_fastq(self):
+        no_fastq = f'{self.fp_tmpdir}no.fastq'
+        with open(no_fastq, 'w') as f:
+            f.write('>r1\nACGT\n')
+        samples = [(no_fastq, None, False),
+                   (self.write('a.fastq', ['r1']), None, False)]
+        failed = set()
+        records = list(mp.tag_samples(samples, failed))
+        self.assertEqual(records, [b'@1:r1 1:N:0\nACGT\n+\nFFFF\n'])
+        self.assertEqual(failed, {0})
+
+    def test_mixed_batch(self):
+        with self.assertRaises(ValueError):
+            mp.analyse_batch([('a', 'b', True), ('c', 'd', False)],
+                             self.fp_tmpdir)
+
+
+class test_summarise(unittest.TestCase):
+    def test_unpaired(self):
+        stats = dict()
+        lines = [sam_line('a', 0), sam_line('b', 16, '\tXS:i:0'),
+                 sam_line('c', 4), sam_line('a', 256)]
+        self.assertEqual(list(mp.summarise(lines, stats, False)), lines)
+        self.assertEqual(stats['reads'], 3)
+        self.assertEqual(stats['aligned_0'], 1)
+        self.assertEqual(stats['aligned_1'], 1)
+        self.assertEqual(stats['aligned_multi'], 1)
+        self.assertEqual(stats['overall_rate'], 66.67)
+
+    def test_paired(self):
+        stats = dict()
+        lines = [sam_line('a', 99), sam_line('a', 147),
+                 sam_line('b', 99, '\tXS:i:0'), sam_line('b', 147),
+                 sam_line('c', 65), sam_line('c', 129),
+                 sam_line('d', 73), sam_line('d', 133),
+                 sam_line('e', 77), sam_line('e', 141)]
+        list(mp.summarise(lines, stats, True))
+        self.assertEqual(stats['reads'], 5)
+        self.assertEqual(stats['concordant_1'], 1)
+        self.assertEqual(stats['concordant_multi'], 1)
+        self.assertEqual(stats['concordant_0'], 3)
+        self.assertEqual(stats['discordant'], 1)
+        self.assertEqual(stats['mates'], 4)
+        self.assertEqual(stats['mates_aligned_0'], 3)
+        self.assertEqual(stats['mates_aligned_1'], 1)
+        self.assertEqual(stats['overall_rate'], 70.0)
+
+
+class test_demultiplex(unittest.TestCase):
+    def setUp(self):
+        self.path = f'{__file__.rsplit("/", 3)[0]}/'
+        self.data_path = f'{os.path.dirname(__file__)}/test_data/'
+        self.reference = io.load_reference(self.path)
+
+    def test_unpaired(self):
+        with open(f'{self.data_path}unpaired/unpaired.sam') as f:
+            lines = f.readlines()
+        batch = ['@HD\tVN:1.0\n'] + [f'0:{line}' for line in lines[:500]] \
+            + [f'1:{line}' for line in lines[500:]]
+        results = mp.demultiplex(batch, self.reference, False)
+        self.assertEqual(sorted(results), [0, 1])
+        for sample, part in [(0, lines[:500]), (1, lines[500:])]:
+            counts, stats = results[sample]
+            self.assertEqual(counts, ss.count_sam(part, self.reference,
+                                                  False))
+            self.assertEqual(stats['reads'], len(part))
+            self.assertEqual(stats['overall_rate'], 100.0)
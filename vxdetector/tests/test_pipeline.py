@@ -0,0 +1,172 @@
+#!/usr/bin/python
+
+import unittest
+import asyncio
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from functools import partial
+import vxdetector.pipeline as pipeline
+
+
+class test_run(unittest.TestCase):
+    def setUp(self):
+        self.temp_path = f'{tempfile.mkdtemp()}/'
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_path)
+
+    def test_pipes(self):
+        with open(f'{self.temp_path}in.txt', 'w') as f:
+            f.write('b\na\nc\na\n')
+        returncodes = asyncio.run(pipeline.run(
+            [['sort'], ['uniq', '-c'], ['wc', '-l']],
+            stdin=f'{self.temp_path}in.txt',
+            stdout=f'{self.temp_path}out.txt'))
+        self.assertEqual(returncodes, [0, 0, 0])
+        with open(f'{self.temp_path}out.txt') as f:
+            self.assertEqual(f.read().strip(), '3')
+
+    def test_stderr(self):
+        asyncio.run(pipeline.run([['sh', '-c', 'echo log >&2']],
+                                 stderr=[f'{self.temp_path}err.log']))
+        with open(f'{self.temp_path}err.log') as f:
+            self.assertEqual(f.read(), 'log\n')
+
+    def test_stderr_lines(self):
+        lines = []
+        asyncio.run(pipeline.run(
+            [['sh', '-c', 'echo a >&2; echo b >&2; echo out'], ['cat']],
+            stdout=os.devnull, stderr=[lines.append, None]))
+        self.assertEqual(lines, ['a\n', 'b\n'])
+
+    def test_stdout_lines(self):
+        lines = []
+        asyncio.run(pipeline.run([['printf', 'b\\na\\n'], ['sort']],
+                                 stdout=lines.append))
+        self.assertEqual(lines, ['a\n', 'b\n'])
+
+    def test_fail_fast(self):
+        start = time.perf_counter()
+        with self.assertRaises(subprocess.CalledProcessError) as cm:
+            asyncio.run(pipeline.run([['sleep', '30'], ['false']]))
+        self.assertLess(time.perf_counter() - start, 10)
+        self.assertEqual(cm.exception.cmd, ['false'])
+        returncodes = asyncio.run(pipeline.run([['false'], ['cat']],
+                                               stdout=os.devnull,
+                                               check=False))
+        self.assertEqual(returncodes, [1, 0])
+
+    def test_timeout(self):
+        start = time.perf_counter()
+        with self.assertRaises(TimeoutError):
+            asyncio.run(pipeline.run([['sleep', '30']], timeout=0.2))
+        self.assertLess(time.perf_counter() - start, 10)
+
+    def test_cancel(self):
+        async def cancelled():
+            task = asyncio.ensure_future(pipeline.run(
+                [['sh', '-c', f'echo $$ > {self.temp_path}pid; sleep 30']]))
+            await asyncio.sleep(0.5)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(cancelled())
+        with open(f'{self.temp_path}pid') as f:
+            pid = int(f.read())
+        with self.assertRaises(ProcessLookupError):
+            os.kill(pid, 0)
+
+
+class test_spawn(unittest.TestCase):
+    def setUp(self):
+        self.temp_path = f'{tempfile.mkdtemp()}/'
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_path)
+
+    def assertKilled(self):
+        with open(f'{self.temp_path}pid') as f:
+            pid = int(f.read())
+        try:
+            with open(f'/proc/{pid}/stat') as f:
+                state = f.read().rsplit(')', 1)[1].split()[0]
+        except FileNotFoundError:
+            return
+        self.assertEqual(state, 'Z')
+        # killed, but not yet reaped by init
+
+    def test_output(self):
+        with pipeline.spawn(['sort'], stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE) as process:
+            output, _ = process.communicate(b'b\na\n')
+        self.assertEqual(output, b'a\nb\n')
+        self.assertEqual(process.returncode, 0)
+
+    def test_timeout(self):
+        start = time.perf_counter()
+        with self.assertRaises(TimeoutError):
+            with pipeline.spawn(['sh', '-c', 'sleep 30 & echo $! > '
+                                 f'{self.temp_path}pid; wait'], timeout=0.5,
+                                stdout=subprocess.PIPE) as process:
+                process.stdout.read()
+        self.assertLess(time.perf_counter() - start, 10)
+        self.assertKilled()
+        # the sleep started by the shell was killed as well
+
+    def test_exception(self):
+        with self.assertRaises(KeyboardInterrupt):
+            with pipeline.spawn(['sh', '-c', 'sleep 30 & echo $! > '
+                                 f'{self.temp_path}pid; wait']):
+                time.sleep(0.5)
+                raise KeyboardInterrupt
+        self.assertKilled()
+
+
+class test_gather(unittest.TestCase):
+    def test_limit(self):
+        running = []
+
+        async def job(i):
+            running.append(i)
+            await asyncio.sleep(0.01)
+            result = len(running)
+            running.remove(i)
+            return result
+
+        results = asyncio.run(pipeline.gather(
+            [partial(job, i) for i in range(6)], limit=2))
+        self.assertEqual(len(results), 6)
+        self.assertLessEqual(max(results), 2)
+
+    def test_fail_fast(self):
+        async def slow():
+            await pipeline.run([['sleep', '30']])
+
+        async def broken():
+            raise ValueError('broken')
+
+        start = time.perf_counter()
+        with self.assertRaises(ValueError):
+            asyncio.run(pipeline.gather([slow, broken]))
+        self.assertLess(time.perf_counter() - start, 10)
+
+    def test_generator(self):
+        started = []
+
+        async def job(i):
+            started.append(i)
+            await asyncio.sleep(0.01)
+            return i
+
+        def produce():
+            for i in range(4):
+                yield partial(job, i)
+                self.assertIn(i, started)
+                # runs before the next function is produced
+
+        results = asyncio.run(pipeline.gather(produce(), limit=4))
+        self.assertEqual(results, [0, 1, 2, 3])
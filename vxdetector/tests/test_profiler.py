@@ -0,0 +1,91 @@
+#!/usr/bin/python
+
+import unittest
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import vxdetector.profiler as profiler
+
+
+class test_stage(unittest.TestCase):
+    def setUp(self):
+        fd, self.profile = tempfile.mkstemp(suffix='.jsonl')
+        os.close(fd)
+
+    def tearDown(self):
+        profiler.enable(None)
+        os.remove(self.profile)
+
+    def test_disabled(self):
+        profiler.enable(None)
+        with profiler.stage('mapbowtie2'):
+            pass
+        self.assertEqual(os.path.getsize(self.profile), 0)
+
+    def test_record(self):
+        profiler.enable(self.profile, 'sample')
+        with profiler.stage('mapbowtie2'):
+            subprocess.run([sys.executable, '-c', 'sum(range(10 ** 6))'])
+        profiler.enable(self.profile)
+        with profiler.stage('do_output'):
+            pass
+        records = profiler.read_profile(self.profile)
+        self.assertEqual([(r['sample'], r['stage']) for r in records],
+                         [('sample', 'mapbowtie2'), (None, 'do_output')])
+        self.assertGreater(records[0]['child_cpu_s'], 0)
+        self.assertGreater(records[0]['peak_rss'], 0)
+        self.assertGreaterEqual(records[0]['wall_s'], 0)
+
+    def test_error(self):
+        profiler.enable(self.profile)
+        with self.assertRaises(ValueError):
+            with profiler.stage('create_row'):
+                raise ValueError
+        self.assertEqual(len(profiler.read_profile(self.profile)), 1)
+
+    def test_concurrent(self):
+        async def analyse(sample):
+            profiler.enable(self.profile, sample)
+            with profiler.stage('mapbowtie2'):
+                await asyncio.sleep(0.05)
+
+        async def both():
+            await asyncio.gather(analyse('a'), analyse('b'))
+
+        asyncio.run(both())
+        profiler.enable(self.profile, 'c')
+        with profiler.stage('mapbowtie2'):
+            with profiler.stage('overlap'):
+                pass
+        # nested stages of one sample are not shared
+        records = profiler.read_profile(self.profile)
+        self.assertEqual([r['shared'] for r in records],
+                         [True, True, False, False])
+        self.assertIsNone(records[0]['child_cpu_s'])
+        self.assertIsNone(records[0]['peak_rss'])
+        self.assertGreater(records[0]['wall_s'], 0)
+        self.assertIsNotNone(records[3]['peak_rss'])
+        stages = profiler.summary(records)
+        self.assertEqual(stages[0]['shared'], 2)
+
+
+class test_summary(unittest.TestCase):
+    def test_summary(self):
+        records = [{'sample': 'a', 'stage': 'overlap', 'wall_s': 1.0,
+                    'cpu_s': 0.1, 'child_cpu_s': 0.9, 'peak_rss': 10,
+                    'bytes_read': 5, 'bytes_written': None},
+                   {'sample': 'b', 'stage': 'overlap', 'wall_s': 2.0,
+                    'cpu_s': 0.1, 'child_cpu_s': 1.9, 'peak_rss': 30,
+                    'bytes_read': 5, 'bytes_written': 1},
+                   {'sample': 'a', 'stage': 'mapbowtie2', 'wall_s': 5.0,
+                    'cpu_s': 0.0, 'child_cpu_s': 9.0, 'peak_rss': 20,
+                    'bytes_read': 0, 'bytes_written': 0}]
+        stages = profiler.summary(records)
+        self.assertEqual([s['stage'] for s in stages],
+                         ['mapbowtie2', 'overlap'])
+        self.assertEqual(stages[1]['calls'], 2)
+        self.assertEqual(stages[1]['wall_s'], 3.0)
+        self.assertEqual(stages[1]['peak_rss'], 30)
+        self.assertEqual(stages[1]['bytes_written'], 1)
@@ -0,0 +1,81 @@
+#!/usr/bin/python
+
+import unittest
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+import vxdetector.read_output as read_output
+import vxdetector.sam_stream as ss
+import vxdetector.interval_overlap as io
+from vxdetector.Output_counter import regions_list
+
+
+class test_writer(unittest.TestCase):
+    def setUp(self):
+        self.temp_path = f'{tempfile.mkdtemp()}/'
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_path)
+
+    def test_roundtrip(self):
+        hits = np.zeros((3, 9), dtype=bool)
+        hits[0, 3] = True
+        hits[1, [3, 4]] = True
+        writer = read_output.start(self.temp_path, 'a')
+        read_output.add(writer, np.array(['r1', 'r2']), np.array(['12', '7']),
+                        np.array([10, 20]), np.array([110, 120]), hits[:2])
+        read_output.add(writer, np.array(['r3']), np.array(['12']),
+                        np.array([30]), np.array([130]), hits[2:])
+        self.assertFalse(os.path.exists(f'{self.temp_path}a'))
+        read_output.finish(writer)
+        self.assertEqual(os.listdir(self.temp_path), ['a'])
+        with open(f'{self.temp_path}a/reads.json') as f:
+            self.assertEqual(json.load(f)['rows'], 3)
+        parts = read_output.load(f'{self.temp_path}a')
+        self.assertEqual(len(parts), 2)
+        self.assertIsInstance(parts[0], np.memmap)
+        records = np.concatenate(parts)
+        self.assertEqual(records['otu'].tolist(), [12, 7, 12])
+        self.assertEqual(records['start'].tolist(), [10, 20, 30])
+        self.assertEqual(records['regions'].tolist(), [8, 24, 0])
+        self.assertEqual(records['read'][0],
+                         read_output.read_hash(['r1'])[0])
+
+    def test_otu_ids(self):
+        otus = read_output.otu_ids(np.array(['3', 'New.Ref', '5']))
+        self.assertEqual(otus.tolist(), [3, -1, 5])
+
+    def test_discard(self):
+        with self.assertRaises(ValueError):
+            with read_output.writing(self.temp_path, 'a'):
+                raise ValueError('failed')
+        self.assertEqual(os.listdir(self.temp_path), [])
+        with read_output.writing(None, 'a') as writer:
+            self.assertIsNone(writer)
+        with self.assertRaises(FileNotFoundError):
+            read_output.load(f'{self.temp_path}a')
+
+
+class test_count_sam(unittest.TestCase):
+    def setUp(self):
+        self.temp_path = f'{tempfile.mkdtemp()}/'
+        self.path = f'{__file__.rsplit("/", 3)[0]}/'
+        self.data_path = f'{os.path.dirname(__file__)}/test_data/'
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_path)
+
+    def test_unpaired(self):
+        reference = io.load_reference(self.path)
+        with read_output.writing(self.temp_path, 'unpaired') as reads:
+            with open(f'{self.data_path}unpaired/unpaired.sam') as f:
+                counts = ss.count_sam(f, reference, False, reads)
+        records = np.concatenate(
+            read_output.load(f'{self.temp_path}unpaired'))
+        self.assertEqual(len(records), counts['intervals'])
+        for i, region in enumerate(regions_list):
+            self.assertEqual(
+                np.count_nonzero(records['regions'] & (1 << i)),
+                counts['regions'][region])
@@ -0,0 +1,64 @@
+#!/usr/bin/python
+
+import unittest
+import os
+import shutil
+import tempfile
+import vxdetector.reduce_reference as reduce_reference
+from vxdetector.kmer_classifier import read_fasta
+
+
+class test_reduce_files(unittest.TestCase):
+    def setUp(self):
+        self.path = f'{tempfile.mkdtemp()}/'
+        self.bundle = f'{self.path}bundle/'
+        os.mkdir(f'{self.path}Indexed_bt2')
+        with open(f'{self.path}Indexed_bt2/annoted_ref.bed', 'w') as f:
+            for otu in ['1', '2', '3']:
+                f.write(f'{otu}\t300\t400\tV3\n{otu}\t500\t600\tV4\n')
+            f.write('4\t310\t400\tV3\n4\t500\t600\tV4\n')
+        sequence = 'ACGT' * 250
+        variant = sequence[:450] + 'T' + sequence[451:]
+        with open(f'{self.path}Indexed_bt2/85_otus.fasta', 'w') as f:
+            f.write(f'>1\n{sequence}\n>2\n{sequence[:200]}\n'
+                    f'{sequence[200:]}\n>3\n{variant}\n>4\n{sequence}\n'
+                    f'>5\n{sequence}\n')
+            # 2 is a duplicate of 1 and 5 has no variable regions
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def read_bundle(self):
+        sequences = dict(read_fasta(
+            f'{self.bundle}Indexed_bt2/85_otus.fasta'))
+        with open(f'{self.bundle}Indexed_bt2/annoted_ref.bed') as f:
+            lines = f.readlines()
+        return sequences, lines
+
+    def test_trim(self):
+        report = reduce_reference.reduce_files(self.path, self.bundle, 100)
+        self.assertEqual(report['otus'], [5, 3])
+        self.assertEqual(report['bases'], [5000, 500 + 500 + 490])
+        sequences, lines = self.read_bundle()
+        self.assertEqual(list(sequences), ['1', '3', '4'])
+        self.assertEqual(sequences['1'], b'ACGT' * 125)
+        self.assertEqual(lines[:2], ['1\t100\t200\tV3\n',
+                                     '1\t300\t400\tV4\n'])
+        self.assertEqual(lines[-2:], ['4\t100\t190\tV3\n',
+                                      '4\t290\t390\tV4\n'])
+        self.assertEqual(len(lines), 6)
+
+    def test_no_trim(self):
+        report = reduce_reference.reduce_files(self.path, self.bundle,
+                                               trim=False)
+        self.assertEqual(report['otus'], [5, 3])
+        sequences, lines = self.read_bundle()
+        self.assertEqual(sequences['1'], b'ACGT' * 250)
+        self.assertEqual(lines[:2], ['1\t300\t400\tV3\n',
+                                     '1\t500\t600\tV4\n'])
+
+    def test_flank_clipped(self):
+        reduce_reference.reduce_files(self.path, self.bundle, 1000)
+        sequences, lines = self.read_bundle()
+        self.assertEqual(sequences['1'], b'ACGT' * 250)
+        self.assertEqual(lines[0], '1\t300\t400\tV3\n')
@@ -0,0 +1,63 @@
+#!/usr/bin/python
+
+import unittest
+import os
+import shutil
+import tempfile
+import vxdetector.result_cache as rc
+
+
+class test_sample_key(unittest.TestCase):
+    def setUp(self):
+        self.temp_path = f'{tempfile.mkdtemp()}/'
+        self.fq_file = f'{self.temp_path}sample_R1_001.fastq'
+        with open(self.fq_file, 'w') as f:
+            f.write('@read\nACGT\n+\nFFFF\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_path)
+
+    def test_deterministic(self):
+        self.assertEqual(rc.sample_key(self.fq_file, None, False, 'ref'),
+                         rc.sample_key(self.fq_file, None, False, 'ref'))
+
+    def test_changes(self):
+        key = rc.sample_key(self.fq_file, None, False, 'ref')
+        self.assertNotEqual(key, rc.sample_key(self.fq_file, None, False,
+                                               'other'))
+        self.assertNotEqual(key, rc.sample_key(self.fq_file, None, False,
+                                               'ref', {'reads': 10}))
+        with open(self.fq_file, 'a') as f:
+            f.write('@read2\nACGT\n+\nFFFF\n')
+        self.assertNotEqual(key, rc.sample_key(self.fq_file, None, False,
+                                               'ref'))
+
+
+class test_cache(unittest.TestCase):
+    def setUp(self):
+        self.cache_path = f'{tempfile.mkdtemp()}/cache/'
+        self.new_row = {'Number of Reads': 10, 'V4': 50.0}
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.cache_path[:-1]))
+
+    def test_roundtrip(self):
+        self.assertIsNone(rc.lookup(self.cache_path, 'a'))
+        rc.store(self.cache_path, 'a', self.new_row)
+        self.assertEqual(rc.lookup(self.cache_path, 'a'), self.new_row)
+        self.assertEqual(os.listdir(self.cache_path), ['a.json'])
+
+    def test_evict(self):
+        for i, key in enumerate(['a', 'b', 'c']):
+            rc.store(self.cache_path, key, self.new_row)
+            os.utime(f'{self.cache_path}{key}.json', (i, i))
+        size = os.path.getsize(f'{self.cache_path}a.json')
+        rc.lookup(self.cache_path, 'a')
+        # a is now the most recently used entry
+        rc.evict(self.cache_path, 2 * size)
+        self.assertEqual(sorted(os.listdir(self.cache_path)),
+                         ['a.json', 'c.json'])
+
+    def test_evict_missing(self):
+        rc.evict(self.cache_path)
+        self.assertFalse(os.path.exists(self.cache_path))
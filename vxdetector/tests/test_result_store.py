@@ -0,0 +1,124 @@
+#!/usr/bin/python
+
+import unittest
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import vxdetector.result_store as rs
+import vxdetector.result_writer as rw
+
+
+def write_samples(filename, project, count):
+    connection = rs.connect(filename)
+    run = rs.start_run(connection, project, 'settings')
+    for i in range(count):
+        rs.add(connection, run, f'sample{i}', {'Number of Reads': i})
+    connection.close()
+
+
+class test_store(unittest.TestCase):
+    def setUp(self):
+        self.temp_path = f'{tempfile.mkdtemp()}/'
+        self.filename = f'{self.temp_path}results.sqlite'
+        self.connection = rs.connect(self.filename)
+        unpaired = {'Not properly paired': 'not paired'}
+        self.rows = [dict(unpaired, **{'Number of Reads': 10, 'V4': 90.0,
+                                       'Sequenced variable region': 'V4'}),
+                     dict(unpaired, **{'Number of Reads': 30, 'V4': 80.0,
+                                       'Sequenced variable region': 'V4'}),
+                     dict(unpaired, **{'Number of Reads': 50,
+                                       'V4': float('nan'),
+                                       'Sequenced variable region':
+                                       'V3 / V4'})]
+
+    def tearDown(self):
+        self.connection.close()
+        shutil.rmtree(self.temp_path)
+
+    def add_run(self, project, rows, fingerprint='settings'):
+        run = rs.start_run(self.connection, project, fingerprint)
+        for i, new_row in enumerate(rows):
+            rs.add(self.connection, run, f'sample{i}', new_row)
+        return run
+
+    def test_wal(self):
+        mode, = self.connection.execute('PRAGMA journal_mode').fetchone()
+        self.assertEqual(mode, 'wal')
+
+    def test_summary_like_result_writer(self):
+        self.add_run('project', self.rows)
+        statistics = rw.new_statistics()
+        for new_row in self.rows:
+            rw.update_statistics(statistics, new_row)
+        columns = ['Number of Reads', 'Not properly paired',
+                   'Sequenced variable region', 'V4']
+        average, std_dev = rw.statistic_rows(statistics, columns)
+        summary, = rs.summary(self.connection)
+        self.assertEqual(summary['samples'], 3)
+        self.assertEqual(summary['average'].keys(), average.keys())
+        for column in average:
+            if isinstance(average[column], str):
+                self.assertEqual(summary['average'][column], average[column])
+            else:
+                self.assertAlmostEqual(summary['average'][column],
+                                       average[column])
+        for column in std_dev:
+            self.assertAlmostEqual(summary['std_dev'][column],
+                                   std_dev[column])
+
+    def test_latest(self):
+        self.add_run('project', self.rows)
+        self.add_run('project', [{'Number of Reads': 70}])
+        self.add_run('project', [{'Number of Reads': 1000}], 'other')
+        results = rs.results(self.connection, fingerprint='settings')
+        self.assertEqual([(sample, new_row['Number of Reads'])
+                          for _, sample, new_row in results],
+                         [('sample0', 70), ('sample1', 30),
+                          ('sample2', 50)])
+        summaries = rs.summary(self.connection, project='project')
+        self.assertEqual([summary['fingerprint'] for summary in summaries],
+                         ['other', 'settings'])
+        self.assertAlmostEqual(summaries[1]['average']['Number of Reads'],
+                               50.0)
+
+    def test_filter(self):
+        self.add_run('a', self.rows)
+        self.add_run('b', self.rows[:1])
+        summaries = rs.summary(self.connection, region='V4')
+        self.assertEqual([(summary['project'], summary['samples'])
+                          for summary in summaries], [('a', 2), ('b', 1)])
+        self.assertNotIn('Number of Reads', summaries[1]['std_dev'])
+        self.assertEqual(rs.summary(self.connection, project='c'), [])
+
+    def test_replace(self):
+        run = self.add_run('project', self.rows[:1])
+        rs.add(self.connection, run, 'sample0', self.rows[1])
+        count, = self.connection.execute(
+            'SELECT count(*) FROM sample_values').fetchone()
+        self.assertEqual(count, 2)
+        self.assertEqual(rs.results(self.connection)[0][2], self.rows[1])
+
+    def test_concurrent_writers(self):
+        with ProcessPoolExecutor(max_workers=4) as executor:
+            for future in [executor.submit(write_samples, self.filename,
+                                           f'project{i}', 50)
+                           for i in range(4)]:
+                future.result()
+        for summary in rs.summary(self.connection):
+            self.assertEqual(summary['samples'], 50)
+            self.assertAlmostEqual(summary['average']['Number of Reads'],
+                                   24.5)
+        self.assertEqual(len(rs.summary(self.connection)), 4)
+        integrity, = self.connection.execute(
+            'PRAGMA integrity_check').fetchone()
+        self.assertEqual(integrity, 'ok')
+
+
+class test_parameter_fingerprint(unittest.TestCase):
+    def test_changes(self):
+        fingerprint = rs.parameter_fingerprint('ref')
+        self.assertEqual(fingerprint, rs.parameter_fingerprint('ref'))
+        self.assertNotEqual(fingerprint, rs.parameter_fingerprint('other'))
+        self.assertNotEqual(fingerprint,
+                            rs.parameter_fingerprint('ref', {'reads': 10}))
+        self.assertEqual(len(fingerprint), 64)
@@ -0,0 +1,136 @@
+#!/usr/bin/python
+
+import unittest
+import io
+import os
+import shutil
+import statistics
+import tempfile
+import pytest
+import vxdetector.VXdetector as vx
+import vxdetector.result_writer as result_writer
+
+
+def new_row(reads, region, paired=True):
+    row = {column: 0.0 for column in vx.output_columns}
+    row['Number of Reads'] = reads
+    row['Unaligned Reads [%]'] = reads / 7000
+    row['Sequenced variable region'] = region
+    row['V4'] = reads / 1000
+    row['Not aligned to a variable region'] = 1 / reads
+    if paired is True:
+        row['Not properly paired'] = reads / 3e6
+    else:
+        row['Not properly paired'] = 'not paired'
+    return row
+
+
+class test_statistics(unittest.TestCase):
+    def test_statistics(self):
+        values = [48981, 64421, 1203, 7.5, 333.25]
+        stats = result_writer.new_statistics()
+        for value in values:
+            result_writer.update_statistics(stats, {'V4': value})
+        average, std_dev = result_writer.statistic_rows(stats, ['V4'])
+        self.assertAlmostEqual(average['V4'], statistics.mean(values))
+        self.assertAlmostEqual(std_dev['V4'], statistics.stdev(values))
+
+    def test_missing_values(self):
+        stats = result_writer.new_statistics()
+        for value in [1.0, None, float('nan'), 3.0]:
+            result_writer.update_statistics(stats, {'V4': value})
+        average, std_dev = result_writer.statistic_rows(stats, ['V4'])
+        self.assertEqual(average['V4'], 2.0)
+        self.assertEqual(std_dev['V4'], statistics.stdev([1.0, 3.0]))
+
+    def test_mode(self):
+        stats = result_writer.new_statistics()
+        for region in ['V45', 'V34', 'V34', 'V45', 'V4']:
+            result_writer.update_statistics(
+                stats, {'Sequenced variable region': region})
+        self.assertEqual(result_writer.mode(stats), 'V34 / V45')
+        average, std_dev = result_writer.statistic_rows(
+            stats, ['Sequenced variable region'])
+        self.assertEqual(average['Sequenced variable region'], 'V34 / V45')
+        self.assertEqual(average['Not properly paired'], 'not paired')
+
+
+class test_finish(unittest.TestCase):
+    def setUp(self):
+        self.fp_tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.fp_tmpdir)
+
+    def write(self, result, single_file):
+        writer = result_writer.start(self.fp_tmpdir)
+        for name, row in result.items():
+            result_writer.add(writer, name, row)
+        output = io.StringIO()
+        new_file = f'{self.fp_tmpdir}/test.csv'
+        result_writer.finish(writer, [output, new_file], vx.output_columns,
+                             single_file)
+        with open(new_file) as f:
+            self.assertEqual(f.read(), output.getvalue())
+        return output.getvalue().splitlines()
+
+    def expected(self, result, single_file):
+        output = io.StringIO()
+        vx.do_output(result, output, single_file)
+        return output.getvalue().splitlines()
+
+    def assertOutput(self, actual, expected):
+        # only the average and standard deviation may differ in the
+        # last digit, they are computed online
+        self.assertEqual(len(actual), len(expected))
+        self.assertEqual(actual[:1] + actual[3:], expected[:1] + expected[3:])
+        for line in [1, 2]:
+            for actual_cell, expected_cell in zip(actual[line].split(','),
+                                                  expected[line].split(',')):
+                try:
+                    self.assertEqual(float(actual_cell),
+                                     pytest.approx(float(expected_cell)))
+                except ValueError:
+                    self.assertEqual(actual_cell, expected_cell)
+
+    def test_single_file(self):
+        result = {'5011_S225_L001': new_row(64421, 'V45')}
+        self.assertEqual(self.write(result, True),
+                         self.expected(result, True))
+
+    def test_directory(self):
+        result = {'c': new_row(48981, 'V45'), 'a': new_row(64421, 'V34'),
+                  'b': new_row(1203, 'V45', paired=False)}
+        self.assertOutput(self.write(result, False),
+                          self.expected(result, False))
+
+    def test_many_samples(self):
+        result = {f'sample{i}': new_row(1000 + i * 7919 % 65536, 'V4')
+                  for i in range(300)}
+        self.assertOutput(self.write(result, False),
+                          self.expected(result, False))
+
+    def test_duplicate_names(self):
+        writer = result_writer.start(self.fp_tmpdir)
+        result_writer.add(writer, 'a', new_row(10, 'V34'))
+        result_writer.add(writer, 'b', new_row(64421, 'V45'))
+        result_writer.add(writer, 'a', new_row(48981, 'V45'))
+        output = io.StringIO()
+        result_writer.finish(writer, [output], vx.output_columns, False)
+        result = {'a': new_row(48981, 'V45'), 'b': new_row(64421, 'V45')}
+        self.assertOutput(output.getvalue().splitlines(),
+                          self.expected(result, False))
+
+    def test_single_sample_directory(self):
+        result = {'a': new_row(64421, 'V34')}
+        actual = self.write(result, False)
+        expected = self.expected(result, False)
+        self.assertEqual(actual, expected)
+
+    def test_spool_removed(self):
+        writer = result_writer.start(self.fp_tmpdir)
+        result_writer.add(writer, 'a', new_row(10, 'V4'))
+        result_writer.finish(writer, [io.StringIO()], vx.output_columns,
+                             False)
+        self.assertTrue(writer['spool'].closed)
+        self.assertEqual(os.listdir(self.fp_tmpdir), [])
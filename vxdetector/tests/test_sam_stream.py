@@ -0,0 +1,133 @@
+#!/usr/bin/python
+
+import unittest
+import os
+import shutil
+import stat
+import tempfile
+import time
+from unittest import mock
+import numpy as np
+import vxdetector.sam_stream as ss
+import vxdetector.interval_overlap as io
+import vxdetector.interact_bowtie2 as ib
+import vxdetector.read_output as read_output
+
+
+def sam_line(name, flag, chrom, start, end, mapq=40):
+    return (f'{name}\t{flag}\t{chrom}\t{start + 1}\t{mapq}\t{end - start}M'
+            '\t=\t0\t0\tACGT\tFFFF\n')
+
+
+class test_reference_length(unittest.TestCase):
+    def test_cigar(self):
+        self.assertEqual(ss.reference_length('282M'), 282)
+        self.assertEqual(ss.reference_length('5S100M2I50M3D10M'), 163)
+        self.assertEqual(ss.reference_length('*'), 0)
+
+
+class test_count_sam(unittest.TestCase):
+    def setUp(self):
+        self.path = f'{__file__.rsplit("/", 3)[0]}/'
+        self.data_path = f'{os.path.dirname(__file__)}/test_data/'
+        self.reference = io.load_reference(self.path)
+
+    def test_unpaired(self):
+        with open(f'{self.data_path}unpaired/unpaired.sam') as f:
+            counts = ss.count_sam(f, self.reference, paired=False)
+        self.assertEqual(counts['intervals'], 1998)
+        self.assertEqual(counts['not_paired'], 0)
+        self.assertEqual(counts['no_overlap'], 0)
+        self.assertEqual(counts['regions']['V4'], 1998)
+        self.assertEqual(counts['regions']['V5'], 1414)
+
+    def test_paired_like_bedtools(self):
+        lines = ['@HD\tVN:1.0\n']
+        with open(f'{self.data_path}paired/paired.bed') as f:
+            for line in f:
+                fields = line.split()
+                lines.append(sam_line(fields[6], 99, fields[0],
+                                      int(fields[1]), int(fields[2])))
+                lines.append(sam_line(fields[6], 147, fields[3],
+                                      int(fields[4]), int(fields[5])))
+        with open(f'{self.data_path}paired/bed.log') as f:
+            for line in f:
+                lines.append(sam_line(line.split()[2], 99, '333042',
+                                      518, 800))
+        # rebuilds the bowtie2 output from the bamtobed result
+        counts = ss.count_sam(lines, self.reference, paired=True)
+        with open(f'{self.data_path}paired/BED.bed') as f:
+            bed_data = f.read()
+        for region in counts['regions']:
+            self.assertEqual(counts['regions'][region],
+                             bed_data.count(region))
+        self.assertEqual(counts['no_overlap'], 2)
+        self.assertEqual(counts['not_paired'], 360)
+        self.assertEqual(counts['intervals'], 3703)
+
+    def test_pair_filter(self):
+        lines = [sam_line('a', 99, '851138', 300, 410),
+                 sam_line('a', 147, '851138', 40, 70),
+                 sam_line('b', 99, '851138', 40, 70, mapq=1),
+                 sam_line('b', 147, '851138', 40, 70),
+                 sam_line('c', 77, '*', -1, 0),
+                 sam_line('c', 141, '*', -1, 0)]
+        counts = ss.count_sam(lines, self.reference, paired=True)
+        self.assertEqual(counts['intervals'], 1)
+        self.assertEqual(counts['not_paired'], 1)
+        self.assertEqual(counts['regions']['V1'], 1)
+        self.assertEqual(counts['regions']['V3'], 0)
+
+
+class test_stream_bowtie2(unittest.TestCase):
+    def setUp(self):
+        self.path = f'{tempfile.mkdtemp()}/'
+        program_path = f'{__file__.rsplit("/", 3)[0]}/'
+        data_path = f'{os.path.dirname(__file__)}/test_data/unpaired/'
+        os.makedirs(f'{self.path}Indexed_bt2')
+        os.makedirs(f'{self.path}bin')
+        shutil.copy(f'{program_path}Indexed_bt2/annoted_ref.bed',
+                    f'{self.path}Indexed_bt2/')
+        open(f'{self.path}Indexed_bt2/bowtie2.1.bt2', 'w').close()
+        self.sam_file = f'{data_path}unpaired.sam'
+        bowtie2 = f'{self.path}bin/bowtie2'
+        with open(bowtie2, 'w') as f:
+            f.write(f'#!/bin/sh\ncat "{self.sam_file}"\n'
+                    f'cat "{data_path}bowtie2.log" >&2\n')
+        os.chmod(bowtie2, os.stat(bowtie2).st_mode | stat.S_IEXEC)
+        # bowtie2 is replaced by a script writing a recorded alignment
+        self.fq_file = f'{self.path}sample.fastq'
+        with open(self.fq_file, 'w') as f:
+            f.write('@read\nACGT\n+\nFFFF\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def stream(self, reads=None, timeout=None):
+        environ = {'PATH': f'{self.path}bin:{os.environ["PATH"]}'}
+        with mock.patch.dict(os.environ, environ), \
+             mock.patch.dict(ib.tools, clear=True):
+            return ss.stream_bowtie2(self.fq_file, '', self.path, False,
+                                     reads=reads, timeout=timeout)
+
+    def test_stub(self):
+        counts, stats, Error = self.stream()
+        self.assertFalse(Error)
+        self.assertEqual(stats['reads'], 64421)
+        self.assertEqual(counts['intervals'], 1998)
+        self.assertEqual(counts['regions']['V4'], 1998)
+
+    def test_per_read(self):
+        with read_output.writing(self.path, 'sample') as reads:
+            counts, stats, Error = self.stream(reads)
+        self.assertFalse(Error)
+        records = np.concatenate(read_output.load(f'{self.path}sample'))
+        self.assertEqual(len(records), counts['intervals'])
+
+    def test_timeout(self):
+        with open(f'{self.path}bin/bowtie2', 'w') as f:
+            f.write(f'#!/bin/sh\nhead -n 100 "{self.sam_file}"\nsleep 30\n')
+        start = time.perf_counter()
+        with self.assertRaises(TimeoutError):
+            self.stream(timeout=0.5)
+        self.assertLess(time.perf_counter() - start, 10)
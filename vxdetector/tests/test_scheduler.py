@@ -0,0 +1,60 @@
+#!/usr/bin/python
+
+import unittest
+import os
+import tempfile
+import shutil
+import vxdetector.scheduler as sc
+
+
+class test_plan(unittest.TestCase):
+    def test_split_cores(self):
+        self.assertEqual(sc.plan(32, 384, 0), (32, 1))
+        self.assertEqual(sc.plan(32, 4, 0), (4, 8))
+        self.assertEqual(sc.plan(32, 1, 0), (1, 32))
+        self.assertEqual(sc.plan(7, 2, 0), (2, 3))
+
+    def test_jobs_limit(self):
+        self.assertEqual(sc.plan(32, 384, 0, jobs=8), (8, 4))
+        self.assertEqual(sc.plan(4, 384, 0, jobs=8), (4, 1))
+
+    def test_memory_limit(self):
+        gib = 1024 ** 3
+        self.assertEqual(sc.plan(32, 384, 4 * gib, memory=16 * gib), (4, 8))
+        self.assertEqual(sc.plan(32, 384, 4 * gib, memory=gib), (1, 32))
+
+    def test_minimum(self):
+        self.assertEqual(sc.plan(0, 0, 0), (1, 1))
+
+
+class test_split_threads(unittest.TestCase):
+    def test_budget(self):
+        for threads in range(1, 33):
+            bowtie2, samtools = sc.split_threads(threads)
+            self.assertGreaterEqual(bowtie2, 1)
+            self.assertLessEqual(bowtie2 + samtools + (threads >= 4),
+                                 threads)
+        self.assertEqual(sc.split_threads(1), (1, 0))
+        self.assertEqual(sc.split_threads(8), (6, 1))
+        self.assertEqual(sc.split_threads(8, compress=False), (8, 0))
+
+
+class test_resources(unittest.TestCase):
+    def setUp(self):
+        self.fp_tmpdir = f'{tempfile.mkdtemp()}/'
+        os.mkdir(f'{self.fp_tmpdir}Indexed_bt2/')
+
+    def tearDown(self):
+        shutil.rmtree(self.fp_tmpdir)
+
+    def test_sample_memory(self):
+        self.assertEqual(sc.sample_memory(self.fp_tmpdir), sc.pipeline_buffer)
+        with open(f'{self.fp_tmpdir}Indexed_bt2/bowtie2.1.bt2', 'wb') as f:
+            f.write(b'\0' * 1000)
+        self.assertEqual(sc.sample_memory(self.fp_tmpdir),
+                         sc.pipeline_buffer + 1000)
+
+    def test_available(self):
+        self.assertGreaterEqual(sc.available_cpus(), 1)
+        memory = sc.available_memory()
+        self.assertTrue(memory is None or memory > 0)
@@ -0,0 +1,144 @@
+#!/usr/bin/python
+
+import unittest
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import tempfile
+import threading
+import vxdetector.benchmarks.synthetic as synthetic
+import vxdetector.kmer_classifier as kmer_classifier
+import vxdetector.server as server
+
+
+class UnixConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path):
+        super().__init__('localhost')
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+class test_server(unittest.TestCase):
+    def setUp(self):
+        self.path = f'{tempfile.mkdtemp()}/'
+        os.mkdir(f'{self.path}Indexed_bt2')
+        program_path = f'{__file__.rsplit("/", 3)[0]}/'
+        with open(f'{program_path}Indexed_bt2/annoted_ref.bed') as f:
+            lines = [next(f) for _ in range(9 * 5)]
+        with open(f'{self.path}Indexed_bt2/annoted_ref.bed', 'w') as f:
+            f.writelines(lines)
+        rng = random.Random(0)
+        with open(f'{self.path}Indexed_bt2/85_otus.fasta', 'w') as f:
+            for otu in dict.fromkeys(line.split('\t')[0] for line in lines):
+                f.write(f'>{otu}\n'
+                        + ''.join(rng.choice('ACGT') for _ in range(1500))
+                        + '\n')
+        self.out_dir = f'{self.path}reads/'
+        os.mkdir(self.out_dir)
+        truth = synthetic.simulate(self.out_dir, self.path, reads=100,
+                                   paired=True, regions=['V4'])
+        self.fq_file = list(truth)[0]
+        kmer_classifier.load_index.cache_clear()
+        self.settings = server.start(self.path, engine='kmer')
+
+    def tearDown(self):
+        kmer_classifier.load_index.cache_clear()
+        shutil.rmtree(self.path)
+
+    def serve(self, socket_path=None):
+        httpd = server.make_server(self.settings, socket_path, port=0)
+        thread = threading.Thread(target=httpd.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(httpd.server_close)
+        self.addCleanup(httpd.shutdown)
+        return httpd
+
+    def request(self, connection, method, url, body=None):
+        connection.request(method, url, body=json.dumps(body).encode()
+                           if body is not None else None)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    def test_analyse(self):
+        expected, _ = kmer_classifier.analyse(
+            self.fq_file, self.fq_file.replace('_R1_', '_R2_'), self.path,
+            True)
+        httpd = self.serve()
+        connection = http.client.HTTPConnection(*httpd.server_address)
+        self.addCleanup(connection.close)
+        status, response = self.request(connection, 'POST', '/analyse',
+                                        {'fq_file': self.fq_file})
+        self.assertEqual(status, 200)
+        self.assertEqual(response['sample'], 'synthetic0_S1_L001')
+        self.assertEqual(response['result'], expected)
+        status, response = self.request(connection, 'GET', '/health')
+        self.assertEqual(status, 200)
+        self.assertEqual(response['engine'], 'kmer')
+
+    def test_errors(self):
+        httpd = self.serve()
+        connection = http.client.HTTPConnection(*httpd.server_address)
+        self.addCleanup(connection.close)
+        status, response = self.request(connection, 'POST', '/analyse',
+                                        {'fq_file': f'{self.path}missing'})
+        self.assertEqual(status, 400)
+        status, response = self.request(connection, 'POST', '/analyse',
+                                        {'sample': 'no path'})
+        self.assertEqual(status, 400)
+        self.assertEqual(response['error'], 'The request needs a "fq_file"')
+        broken = f'{self.out_dir}broken.fastq'
+        with open(broken, 'w') as f:
+            f.write('>no fastq\nACGT\n')
+        status, response = self.request(connection, 'POST', '/analyse',
+                                        {'fq_file': broken})
+        self.assertEqual(status, 400)
+        self.assertEqual(response['error'],
+                         'This file does not look like a fastq file')
+        status, response = self.request(connection, 'GET', '/unknown')
+        self.assertEqual(status, 404)
+
+    def test_unix_socket(self):
+        socket_path = f'{self.path}vxdetector.sock'
+        self.serve(socket_path)
+        connection = UnixConnection(socket_path)
+        self.addCleanup(connection.close)
+        status, response = self.request(
+            connection, 'POST', '/analyse',
+            {'fq_file': self.fq_file,
+             'read2_file': self.fq_file.replace('_R1_', '_R2_')})
+        self.assertEqual(status, 200)
+        self.assertEqual(response['result']['Sequenced variable region'],
+                         'V4')
+
+    def test_keeps_other_files(self):
+        socket_path = f'{self.path}results.csv'
+        with open(socket_path, 'w') as f:
+            f.write('data')
+        with self.assertRaises(FileExistsError):
+            server.make_server(self.settings, socket_path)
+        with open(socket_path) as f:
+            self.assertEqual(f.read(), 'data')
+        socket_path = f'{self.path}old.sock'
+        old = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old.bind(socket_path)
+        old.close()
+        # the socket of a stopped server is replaced
+        httpd = server.make_server(self.settings, socket_path)
+        httpd.server_close()
+
+    def test_map_index(self):
+        with open(f'{self.path}Indexed_bt2/bowtie2.1.bt2', 'wb') as f:
+            f.write(b'index')
+        with open(f'{self.path}Indexed_bt2/bowtie2.2.bt2', 'wb') as f:
+            pass
+        maps = server.map_index(self.path)
+        self.assertEqual([index_map[:] for index_map in maps], [b'index'])
+        for index_map in maps:
+            index_map.close()
@@ -0,0 +1,139 @@
+#!/usr/bin/python
+
+import unittest
+import gzip
+import os
+import shutil
+import stat
+import tempfile
+from unittest import mock
+import vxdetector.subsample as sub
+import vxdetector.interact_bowtie2 as ib
+
+
+class test_read_records(unittest.TestCase):
+    def setUp(self):
+        self.path = f'{os.path.dirname(__file__)}/test_data/test_dir/'
+
+    def test_fastq(self):
+        records = list(sub.read_fastq(f'{self.path}no_qual_test.fastq'))
+        self.assertEqual(len(records), 26)
+        self.assertTrue(records[0].startswith(b'@'))
+        self.assertEqual(records[0].count(b'\n'), 4)
+
+    def test_gzip(self):
+        records = sub.read_fastq(f'{self.path}5004_S20_L001_R1_001.fastq.gz')
+        record = next(records)
+        self.assertTrue(record.startswith(b'@'))
+        self.assertEqual(record.count(b'\n'), 4)
+
+    def test_paired(self):
+        records = list(sub.read_records(
+            f'{self.path}no_qual_paired_R1_001.fastq',
+            f'{self.path}no_qual_paired_R2_001.fastq', True))
+        self.assertEqual(len(records), 26)
+        self.assertEqual(records[0].count(b'\n'), 8)
+
+    def test_mate_missing(self):
+        temp_path = tempfile.mkdtemp()
+        try:
+            read2_file = f'{temp_path}/R2.fastq'
+            with open(f'{self.path}no_qual_paired_R2_001.fastq') as f:
+                lines = f.readlines()
+            with open(read2_file, 'w') as f:
+                f.writelines(lines[:-4])
+            with self.assertRaises(EOFError):
+                list(sub.read_records(
+                    f'{self.path}no_qual_paired_R1_001.fastq', read2_file,
+                    True))
+        finally:
+            shutil.rmtree(temp_path)
+
+
+class test_reservoir(unittest.TestCase):
+    def test_deterministic(self):
+        sample, total = sub.reservoir(range(1000), 10, seed=1)
+        self.assertEqual(total, 1000)
+        self.assertEqual(len(sample), 10)
+        self.assertEqual(sample, sorted(sample))
+        self.assertEqual(sub.reservoir(range(1000), 10, seed=1)[0], sample)
+        self.assertNotEqual(sub.reservoir(range(1000), 10, seed=2)[0],
+                            sample)
+
+    def test_small_input(self):
+        self.assertEqual(sub.reservoir(range(5), 10), ([0, 1, 2, 3, 4], 5))
+
+
+class test_confidence_width(unittest.TestCase):
+    def test_width(self):
+        counts = {'regions': {'V4': 500, 'V5': 500}, 'no_overlap': 0}
+        self.assertAlmostEqual(sub.confidence_width(counts),
+                               1.959964 * 0.5 / 1000 ** 0.5 * 100, places=4)
+        counts['regions'] = {'V4': 5000, 'V5': 5000}
+        self.assertLess(sub.confidence_width(counts), 1)
+        self.assertLess(sub.confidence_width(counts, 0.9),
+                        sub.confidence_width(counts, 0.99))
+
+    def test_empty(self):
+        counts = {'regions': {'V4': 0}, 'no_overlap': 0}
+        self.assertEqual(sub.confidence_width(counts), float('inf'))
+
+
+def damaged(records):
+    yield from records
+    raise EOFError('Compressed file ended before the end-of-stream marker')
+
+
+class test_damaged_input(unittest.TestCase):
+    def setUp(self):
+        self.path = f'{tempfile.mkdtemp()}/'
+        program_path = f'{__file__.rsplit("/", 3)[0]}/'
+        data_path = f'{os.path.dirname(__file__)}/test_data/unpaired/'
+        os.makedirs(f'{self.path}Indexed_bt2')
+        os.makedirs(f'{self.path}bin')
+        shutil.copy(f'{program_path}Indexed_bt2/annoted_ref.bed',
+                    f'{self.path}Indexed_bt2/')
+        open(f'{self.path}Indexed_bt2/bowtie2.1.bt2', 'w').close()
+        bowtie2 = f'{self.path}bin/bowtie2'
+        with open(bowtie2, 'w') as f:
+            f.write(f'#!/bin/sh\ncat > /dev/null\n'
+                    f'cat "{data_path}unpaired.sam"\n'
+                    f'cat "{data_path}bowtie2.log" >&2\n')
+        os.chmod(bowtie2, os.stat(bowtie2).st_mode | stat.S_IEXEC)
+        # bowtie2 is replaced by a script writing a complete alignment
+        # whatever it was fed
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def align(self, records):
+        environ = {'PATH': f'{self.path}bin:{os.environ["PATH"]}'}
+        with mock.patch.dict(os.environ, environ), \
+             mock.patch.dict(ib.tools, clear=True):
+            return sub.align_records(records, self.path, False)
+
+    def test_stub(self):
+        counts, stats, Error = self.align([b'@read\nACGT\n+\nFFFF\n'])
+        self.assertFalse(Error)
+
+    def test_feeder_error(self):
+        counts, stats, Error = self.align(
+            damaged([b'@read\nACGT\n+\nFFFF\n']))
+        self.assertTrue(Error)
+
+    def test_feeder_bug(self):
+        with self.assertRaises(ZeroDivisionError):
+            self.align(1 / 0 for _ in range(1))
+
+    def test_truncated_gzip(self):
+        fq_file = f'{self.path}sample.fastq.gz'
+        with gzip.open(fq_file, 'wb') as f:
+            f.write(b'@read\nACGT\n+\nFFFF\n' * 1000)
+        with open(fq_file, 'rb') as f:
+            content = f.read()
+        with open(fq_file, 'wb') as f:
+            f.write(content[:len(content) // 2])
+        new_row, counts = sub.analyse(fq_file, '', self.path, False,
+                                      reads=10)
+        self.assertIsNone(new_row)
+        self.assertEqual(counts['intervals'], 0)